@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Batched Balance Tables with Robust Per-Variable and Joint Tests
+
+Python engine for balance_tables_full.do: group means, the per-variable
+F-test of balance_table.ado (regress var i.group, vce(robust); testparm
+i.group) and the suest joint test, for every table in a spec (default:
+code/balance_tables.json) from one read of the survey data.
+
+A regression on group indicators alone is saturated, so its coefficients
+are the group means and everything the tests need comes from per-group
+moments. With the group indicator matrix G (n x K), the missing-value mask
+M and the residuals E (n x p, zero where missing), computed once for all
+variables:
+
+    counts, sums        G'M, G'Y                      (K x p)
+    HC1 variances       G'E^2 / counts^2 * n/(n-K)    per variable
+    suest covariances   E'(G_k E) / (counts counts')  (K x p x p)
+
+The per-variable Wald statistics are solved as one batch of (K-1) x (K-1)
+systems. The joint test stacks all p(K-1) group-difference coefficients,
+whose covariance is C_0 + C_k on the diagonal blocks and C_0 off the
+diagonal, scaled by N/(N-1) as suest's robust VCE is (N = rows with any
+variable non-missing). Each variable keeps its own sample (casewise
+deletion, as in the do-files).
+
+Covariances that are singular (e.g. a full set of indicators that sums to
+one) are swept in order as Stata's invsym does: a coefficient that is
+collinear with earlier ones is dropped and the test df reduced, so the df
+and statistic match `test` on the same constraints. A variable that is
+constant within every group has no testable variation and gets p = '.'.
+
+Output is the balance_table.ado fragment format (notes/table_abstraction_plan.md):
+
+    varlabel & mean_g1 & ... & mean_gK & pval \\
+    Joint test & \\multicolumn{K}{c}{} & p \\
+    N & n1 & ... & nK
+
+plus the matching .md table, and balance_omnibus.tex in the layout of
+balance_tables_full.do. Row labels are the .dta variable labels (the
+variable name if unlabelled, or for columnar formats); --chi2 prints the
+joint statistic in the multicolumn as in the plan.
+
+Usage:
+    python code/balance_tables.py                         # every table + omnibus
+    python code/balance_tables.py balance_vacc balance_trust
+    python code/balance_tables.py --data derived/merged_main_pre.parquet
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.special import chdtrc, fdtrc
+
+DEFAULT_SPEC = Path('code') / 'balance_tables.json'
+OUTPUT_DIR = Path('output') / 'tables'
+
+# A sweep pivot below this fraction of its original variance counts as collinear
+RANK_TOL = 1e-10
+
+# LaTeX escapes applied to row labels (as in balance_table.ado)
+TEX_ESCAPES = {'$': r'\$', '%': r'\%', '&': r'\&', '_': r'\_'}
+
+
+def load_spec(spec_path):
+    """
+    Read and validate a balance table spec.
+
+    Returns:
+        spec dict with 'group', 'tables' and optionally 'data' and 'omnibus'
+    """
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    names = set()
+    for table in spec['tables']:
+        if 'name' not in table or not table.get('vars'):
+            raise ValueError(f"Table spec {table.get('name', '?')!r} needs a name and vars")
+        if table['name'] in names:
+            raise ValueError(f"Duplicate table name {table['name']!r}")
+        names.add(table['name'])
+    for test in spec.get('omnibus', {}).get('tests', []):
+        unknown = [name for name in test['tables'] if name not in names]
+        if unknown:
+            raise ValueError(f"Omnibus test {test['label']!r}: unknown tables {', '.join(unknown)}")
+    return spec
+
+
+def read_balance_data(path, columns):
+    """
+    Read the group and balance variables from a survey data file.
+
+    .dta files are read with value codes (not labels) and their variable
+    labels; other formats have no labels.
+
+    Returns:
+        (DataFrame, {variable: label})
+    """
+    import pandas as pd
+    from survey_io import iter_survey_chunks
+
+    path = Path(path)
+    df = pd.concat(list(iter_survey_chunks(path, columns=columns)), ignore_index=True)
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"not in {path}: {', '.join(missing)}")
+
+    labels = {}
+    if path.suffix.lower() == '.dta':
+        with pd.read_stata(path, iterator=True) as reader:
+            labels = {var: label for var, label in reader.variable_labels().items() if label}
+    return df, labels
+
+
+def group_indicators(groups):
+    """
+    Indicator matrix of a numeric group variable.
+
+    Returns:
+        (levels, G) with levels ascending and G of shape (n, K)
+    """
+    levels = np.unique(groups)
+    return levels, (groups[:, None] == levels[None, :]).astype(float)
+
+
+def wald(b, V):
+    """
+    Wald statistic b' V^-1 b and its df, batched over any leading axes of
+    b (..., m) and V (..., m, m).
+
+    Like Stata's invsym (which test uses), V is swept in order and a
+    coefficient whose remaining variance is zero given the earlier ones is
+    dropped, reducing the df; the statistic uses the kept coefficients.
+    """
+    A = np.array(V, dtype=float)
+    r = np.array(b, dtype=float)
+    diag = np.diagonal(A, axis1=-2, axis2=-1).copy()
+    stat = np.zeros(r.shape[:-1])
+    df = np.zeros(r.shape[:-1], dtype=int)
+    for i in range(r.shape[-1]):
+        pivot = A[..., i, i]
+        keep = (pivot > RANK_TOL * diag[..., i]) & (pivot > 0)
+        safe = np.where(keep, pivot, 1.0)
+        stat += np.where(keep, r[..., i] ** 2 / safe, 0.0)
+        df += keep
+        factor = np.where(keep, 1.0 / safe, 0.0)[..., None]
+        column = A[..., :, i].copy()
+        r -= column * (r[..., i:i + 1] * factor)
+        A -= column[..., :, None] * (A[..., i:i + 1, :] * factor[..., None])
+    return stat, df
+
+
+class GroupMoments:
+    """
+    Per-group means and residuals of p variables, shared by the per-variable
+    and joint tests.
+    """
+
+    def __init__(self, Y, G):
+        observed = ~np.isnan(Y)
+        Y0 = np.where(observed, Y, 0.0)
+        self.G = G
+        self.counts = G.T @ observed                               # (K, p)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = (G.T @ Y0) / self.counts                   # (K, p)
+        self.resid = np.where(observed, Y0 - G @ np.nan_to_num(self.means), 0.0)
+        self.n_rows = int(observed.any(axis=1).sum())
+
+    @property
+    def diffs(self):
+        """Coefficients on the non-base groups: mean_k - mean_1, shape (K-1, p)."""
+        return self.means[1:] - self.means[:1]
+
+
+def variable_tests(moments):
+    """
+    HC1-robust F-test of equal group means for each variable, as regress
+    var i.group, vce(robust) followed by testparm i.group.
+
+    Returns:
+        (F, df1, df2, p) arrays of length p
+    """
+    K = moments.G.shape[1]
+    n = moments.counts.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_means = (moments.G.T @ moments.resid ** 2) / moments.counts ** 2 * (n / (n - K))
+
+    # V[j] = v_base + diag(v_1..v_{K-1}) for the K-1 differences of variable j
+    V = var_means[0][:, None, None] + np.einsum('kj,kl->jkl', var_means[1:], np.eye(K - 1))
+    b = moments.diffs.T
+    bad = ~np.isfinite(b).all(axis=1) | ~np.isfinite(V).all(axis=(1, 2))
+    stat, df1 = wald(np.where(bad[:, None], 0.0, b), np.where(bad[:, None, None], 0.0, V))
+
+    df2 = n - K
+    with np.errstate(invalid='ignore', divide='ignore'):
+        F = stat / df1
+        p = fdtrc(df1, df2, F)
+    invalid = bad | (df1 == 0)
+    F[invalid] = np.nan
+    p[invalid] = np.nan
+    return F, df1, df2, p
+
+
+def joint_test(moments):
+    """
+    suest-style joint Wald test that every group difference of every
+    variable is zero (the stacked regressions with vce(robust)).
+
+    Returns:
+        (chi2, df, p)
+    """
+    K, p = moments.counts.shape
+    # cross[k] = E' diag(G_k) E / outer(counts_k, counts_k): (K, p, p) in one matmul
+    weighted = moments.G.T[:, :, None] * moments.resid[None, :, :]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cross = (weighted.transpose(0, 2, 1) @ moments.resid) / (
+            moments.counts[:, :, None] * moments.counts[:, None, :])
+
+    # Coefficients stacked variable-major, the order of balance_table.ado's
+    # test terms: index j * (K - 1) + (k - 1), with
+    # cov(b_jk, b_lh) = C_0[j, l] + (k == h) C_k[j, l]
+    V = (cross[0][:, None, :, None]
+         + np.einsum('kjl,kh->jklh', cross[1:], np.eye(K - 1))).reshape(p * (K - 1), p * (K - 1))
+    N = moments.n_rows
+    V *= N / (N - 1)
+
+    b = moments.diffs.T.ravel()
+    if not (np.isfinite(b).all() and np.isfinite(V).all()):
+        return np.nan, 0, np.nan
+    chi2, df = wald(b, V)
+    df = int(df)
+    return (float(chi2), df, float(chdtrc(df, chi2))) if df else (np.nan, 0, np.nan)
+
+
+def compute_balance(df, variables, group, jointtest=False):
+    """
+    Group sizes, means and tests for one balance table.
+
+    Rows with a missing group are dropped (markout); each variable then
+    uses its own non-missing rows.
+
+    Returns:
+        dict with levels, n (per group), means (K x p), F, df1, df2, p and
+        joint ((chi2, df, p), or None if not requested or only one variable)
+    """
+    groups = df[group].to_numpy(dtype=float)
+    sample = ~np.isnan(groups)
+    if not sample.any():
+        raise ValueError("no observations")
+    levels, G = group_indicators(groups[sample])
+    Y = df.loc[sample, variables].to_numpy(dtype=float)
+
+    if len(levels) < 2:
+        raise ValueError(f"{group} has only one level in the sample")
+    if len(levels) > 10:
+        print(f"warning: group variable has {len(levels)} levels - table may be very wide")
+    empty = [var for var, seen in zip(variables, (~np.isnan(Y)).any(axis=0)) if not seen]
+    if empty:
+        raise ValueError(f"no non-missing observations for {', '.join(empty)}")
+
+    moments = GroupMoments(Y, G)
+    F, df1, df2, p = variable_tests(moments)
+    joint = joint_test(moments) if jointtest and len(variables) > 1 else None
+    return {
+        'levels': levels,
+        'n': G.sum(axis=0).astype(int),
+        'means': moments.means,
+        'F': F, 'df1': df1, 'df2': df2, 'p': p,
+        'joint': joint,
+    }
+
+
+def fmt(value, spec='.3f'):
+    """Format a number like Stata's display: missing values as '.'."""
+    return '.' if value is None or not np.isfinite(value) else format(value, spec)
+
+
+def tex_escape(text):
+    """Escape the characters balance_table.ado escapes in row labels."""
+    return ''.join(TEX_ESCAPES.get(ch, ch) for ch in text)
+
+
+def tex_lines(result, row_labels, chi2=False):
+    """Lines of the balance_table.ado .tex fragment (final row without \\\\)."""
+    K = len(result['levels'])
+    lines = []
+    for j, label in enumerate(row_labels):
+        cells = [fmt(m) for m in result['means'][:, j]] + [fmt(result['p'][j])]
+        lines.append(f"{tex_escape(label)} & {' & '.join(cells)} \\\\")
+    if result['joint'] is not None and np.isfinite(result['joint'][2]):
+        stat, df, p = result['joint']
+        middle = f"$\\chi^2({df})={stat:.3f}$" if chi2 else ''
+        lines.append(f"Joint test & \\multicolumn{{{K}}}{{c}}{{{middle}}} & {fmt(p)} \\\\")
+    lines.append(' & '.join(['N'] + [str(n) for n in result['n']]))
+    return lines
+
+
+def md_lines(result, row_labels, group_labels):
+    """Lines of the balance_table.ado .md table."""
+    K = len(result['levels'])
+    lines = ['| | ' + ' | '.join(group_labels) + ' | P-value |',
+             '|---|' + '---:|' * (K + 1)]
+    for j, label in enumerate(row_labels):
+        cells = [fmt(m) for m in result['means'][:, j]] + [fmt(result['p'][j])]
+        lines.append(f"| {label.replace('|', chr(92) + '|')} | {' | '.join(cells)} |")
+    if result['joint'] is not None and np.isfinite(result['joint'][2]):
+        lines.append('| Joint test' + ' |' * K + f" | {fmt(result['joint'][2])} |")
+    lines.append('| N | ' + ' | '.join(str(n) for n in result['n']) + ' | |')
+    return lines
+
+
+def print_table(result, row_labels, group_labels, group, width=78):
+    """Console table in the layout of balance_table.ado."""
+    print(f"\nBalance Table: group({group})")
+    print('-' * width)
+    print(f"{'Variable':<24}" + ''.join(f"{label:>9}" for label in group_labels) + '   P-value')
+    print('-' * width)
+    for j, label in enumerate(row_labels):
+        short = label if len(label) <= 24 else label[:23] + '~'
+        print(f"{short:<24}" + ''.join(f"{fmt(m):>9}" for m in result['means'][:, j])
+              + f"{fmt(result['p'][j]):>9}")
+    if result['joint'] is not None and np.isfinite(result['joint'][2]):
+        stat, df, p = result['joint']
+        print('-' * width)
+        print(f"Joint test: chi2({df}) = {stat:8.3f}, p = {p:5.3f}")
+    print('-' * width)
+    print(f"{'N':<24}" + ''.join(f"{n:>9,}" for n in result['n']))
+    print('-' * width)
+
+
+def write_lines(path, lines):
+    """Write lines with a trailing newline, creating the directory."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def omnibus_lines(tests, n_groups):
+    """balance_omnibus.tex lines: (label, (chi2, df, p)) per test, final row without \\\\."""
+    lines = []
+    for k, (label, (stat, df, p)) in enumerate(tests):
+        end = ' \\\\' if k < len(tests) - 1 else ''
+        lines.append(f"{label} & \\multicolumn{{{n_groups}}}{{c}}{{$\\chi^2({df})={stat:6.2f}$}} "
+                     f"& {fmt(p, '5.4f')}{end}")
+    return lines
+
+
+def build_tables(spec, data_path, output_dir, names=None, chi2=False):
+    """
+    Compute and write the spec's balance tables (all, or those in names)
+    and, when every table is built, its omnibus tests.
+
+    Returns:
+        dict mapping table name -> compute_balance result
+    """
+    group = spec['group']
+    tables = [table for table in spec['tables'] if names is None or table['name'] in names]
+    omnibus = spec.get('omnibus') if names is None else None
+    columns = list(dict.fromkeys([group] + [var for table in tables for var in table['vars']]))
+
+    start = time.perf_counter()
+    df, labels = read_balance_data(data_path, columns)
+    print(f"Read {len(df):,} rows x {len(columns)} columns from {data_path} "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    results = {}
+    for table in tables:
+        start = time.perf_counter()
+        result = compute_balance(df, table['vars'], group, jointtest=table.get('jointtest', False))
+        results[table['name']] = result
+
+        row_labels = [table.get('labels', {}).get(var) or labels.get(var, var) for var in table['vars']]
+        group_labels = table.get('group_labels') or spec.get('group_labels') or \
+            [f"Arm {level:g}" for level in result['levels']]
+        print_table(result, row_labels, group_labels, group)
+
+        tex_path = output_dir / f"{table['name']}.tex"
+        write_lines(tex_path, tex_lines(result, row_labels, chi2=chi2))
+        write_lines(tex_path.with_suffix('.md'), md_lines(result, row_labels, group_labels))
+        print(f"Saved: {tex_path} ({time.perf_counter() - start:.2f}s)")
+
+    if omnibus:
+        start = time.perf_counter()
+        by_name = {table['name']: table for table in spec['tables']}
+        tests = []
+        for test in omnibus['tests']:
+            variables = [var for name in test['tables'] for var in by_name[name]['vars']]
+            result = compute_balance(df, variables, group, jointtest=True)
+            tests.append((test['label'], result['joint']))
+            stat, dof, p = result['joint']
+            print(f"{test['label']}: chi2({dof}) = {stat:.2f}, p = {fmt(p, '.4f')}")
+        omni_path = output_dir / f"{omnibus['name']}.tex"
+        write_lines(omni_path, omnibus_lines(tests, len(result['levels'])))
+        print(f"Saved: {omni_path} ({time.perf_counter() - start:.2f}s)")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Balance tables with robust per-variable and joint tests')
+    parser.add_argument(
+        'tables',
+        nargs='*',
+        help='Table names to build (default: every table in the spec, plus the omnibus tests)'
+    )
+    parser.add_argument(
+        '--spec',
+        type=Path,
+        default=None,
+        help=f'Balance table spec (default: {DEFAULT_SPEC})'
+    )
+    parser.add_argument(
+        '--data',
+        type=Path,
+        default=None,
+        help="Survey data file (default: the spec's data)"
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=Path,
+        default=None,
+        help=f'Directory for the .tex and .md files (default: {OUTPUT_DIR})'
+    )
+    parser.add_argument(
+        '--chi2',
+        action='store_true',
+        help='Print the joint chi2 statistic in the Joint test row'
+    )
+    args = parser.parse_args()
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    spec_path = args.spec or proj_dir / DEFAULT_SPEC
+
+    try:
+        spec = load_spec(spec_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read spec {spec_path}: {e}")
+        sys.exit(1)
+
+    known = {table['name'] for table in spec['tables']}
+    unknown = [name for name in args.tables if name not in known]
+    if unknown:
+        print(f"ERROR: not in {spec_path}: {', '.join(unknown)}")
+        sys.exit(1)
+
+    data_path = args.data or proj_dir / spec['data']
+    if not data_path.exists():
+        print(f"ERROR: data file not found: {data_path}")
+        sys.exit(1)
+
+    try:
+        build_tables(spec, data_path, args.output_dir or proj_dir / OUTPUT_DIR,
+                     names=set(args.tables) or None, chi2=args.chi2)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
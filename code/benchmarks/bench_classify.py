@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark Row Classification in parse_xml
+
+Compares the original per-row classification (Series.apply with
+is_placeholder_pid / is_valid_prolific_id, run separately for the metadata,
+preview and invalid-PID reports) against the vectorized classify_rows on a
+synthetic export.
+
+Usage:
+    python code/benchmarks/bench_classify.py              # 1,000,000 rows
+    python code/benchmarks/bench_classify.py --rows 100000
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from parse_xml import classify_rows, is_placeholder_pid, is_valid_prolific_id  # noqa: E402
+from synthetic import make_synthetic_export  # noqa: E402
+
+
+def classify_rows_apply(df):
+    """The original classification: one re.match per row, per report."""
+    is_preview_channel = df['distributionChannel'] == 'preview'
+    is_preview_status = df['status'] == 'Survey Preview'
+    has_placeholder_pid = df['PROLIFIC_PID'].apply(is_placeholder_pid)
+    is_preview = (is_preview_channel | is_preview_status) & ~has_placeholder_pid
+    is_metadata = has_placeholder_pid
+
+    # Safety check and invalid-PID report each re-ran the regex
+    valid_in_metadata = df[is_metadata]['PROLIFIC_PID'].apply(is_valid_prolific_id)
+    has_valid_pid = df[~is_metadata]['PROLIFIC_PID'].apply(is_valid_prolific_id)
+    return is_preview, is_metadata, valid_in_metadata.sum(), has_valid_pid
+
+
+def classify_rows_vectorized(df):
+    """The vectorized classification, reused for every report."""
+    is_preview, is_metadata, has_valid_pid = classify_rows(df)
+    valid_in_metadata = (is_metadata & has_valid_pid).sum()
+    return is_preview, is_metadata, valid_in_metadata, has_valid_pid[~is_metadata]
+
+
+def time_call(func, *args, repeat=3):
+    """Return (best wall time in seconds, last result) over repeat runs."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse_xml row classification')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='Synthetic export size')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions (best is reported)')
+    args = parser.parse_args()
+
+    print(f"Building synthetic export with {args.rows:,} rows...")
+    df = make_synthetic_export(args.rows)
+
+    t_apply, old = time_call(classify_rows_apply, df, repeat=args.repeat)
+    t_vec, new = time_call(classify_rows_vectorized, df, repeat=args.repeat)
+
+    # Both paths must agree exactly
+    assert old[0].equals(new[0]), "is_preview differs"
+    assert old[1].equals(new[1]), "is_metadata differs"
+    assert old[2] == new[2], "valid PIDs in metadata differ"
+    assert old[3].astype(bool).equals(new[3]), "has_valid_pid differs"
+
+    print(f"  apply (per-row re.match): {t_apply:8.3f} s")
+    print(f"  vectorized:               {t_vec:8.3f} s")
+    print(f"  speedup:                  {t_apply / t_vec:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark CLI Startup and No-Op Invocations
+
+The Makefile starts parse_xml.py, build_codebook.py and render_figures.py
+many times per build, usually with nothing to do. This times each of them
+as a fresh interpreter for --help and for an up-to-date invocation (the
+export, stats and figure data unchanged since the previous run), and
+reports which heavy modules (numpy, pandas, matplotlib, pyarrow) each
+invocation imported.
+
+The invocations run in a scratch copy of the project (code/ plus
+synthetic inputs from synthetic.py), primed with one real run each, so the
+real data/, output/ and derived/ directories are never touched.
+
+Usage:
+    python code/benchmarks/bench_startup.py
+    python code/benchmarks/bench_startup.py --repeat 20 --max-ms 100
+
+Exit status is 1 if an invocation fails, imports a heavy module, or its
+best time exceeds bare interpreter startup ('python -c pass') by more than
+--max-ms. What remains is mostly stdlib imports (argparse, pathlib, json)
+and compiling the script, so the limit is still machine-specific.
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import json
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+CODE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(CODE_DIR))
+
+import synthetic  # noqa: E402
+from parse_xml import DEFAULT_XML_FILES  # noqa: E402
+
+HEAVY_MODULES = ('numpy', 'pandas', 'matplotlib', 'pyarrow')
+
+# (label, script and arguments, run in the scratch project directory)
+INVOCATIONS = [
+    ('parse_xml --help', ['code/parse_xml.py', '--help']),
+    ('parse_xml main (up to date)', ['code/parse_xml.py', 'main']),
+    ('build_codebook --help', ['code/build_codebook.py', '--help']),
+    ('build_codebook main (up to date)', ['code/build_codebook.py', 'main']),
+    ('render_figures --help', ['code/render_figures.py', '--help']),
+    ('render_figures (cached)', ['code/render_figures.py']),
+]
+
+DEFAULT_MAX_MS = 100
+
+
+def make_project(proj_dir, responses=2_000):
+    """
+    Lay out a scratch project: the code/ scripts, a synthetic main export,
+    main stats CSVs and codebook template, and a one-figure manifest.
+    """
+    proj_dir = Path(proj_dir)
+    shutil.copytree(CODE_DIR, proj_dir / 'code',
+                    ignore=shutil.ignore_patterns('__pycache__', 'benchmarks', '*.do', '*.ado'))
+    for sub in ('data', 'output/tables', 'output/docs', 'output/figures'):
+        (proj_dir / sub).mkdir(parents=True, exist_ok=True)
+
+    synthetic.write_qualtrics_xml(proj_dir / 'data' / DEFAULT_XML_FILES['main'], responses)
+    synthetic.write_stats_csvs(proj_dir / 'output/tables/stats_main_continuous.csv',
+                               proj_dir / 'output/tables/stats_main_categorical.csv', 20, 100)
+    synthetic.write_codebook_template(proj_dir / 'output/docs/main_codebook_template.md', 20, 100)
+
+    rows = ['splitting_var,subgroup,treatment,effect,se']
+    for split in ('Prior', 'Trust'):
+        for subgroup in ('Low', 'High'):
+            for k, treatment in enumerate(('Industry', 'Academic', 'Personal')):
+                rows.append(f'{split},{subgroup},{treatment},{0.1 * k - 0.05},0.1')
+    (proj_dir / 'output/figures/forest.csv').write_text('\n'.join(rows) + '\n')
+    manifest = {'figures': [{'name': 'forest', 'kind': 'forest', 'csv': 'output/figures/forest.csv',
+                             'output': 'output/figures/forest.png', 'dpi': 50}]}
+    (proj_dir / 'code' / 'figures.json').write_text(json.dumps(manifest, indent=2))
+
+
+def run(proj_dir, args, importtime=False):
+    """Run one invocation; returns (seconds, completed process)."""
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else []) + args
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=proj_dir, capture_output=True, text=True)
+    return time.perf_counter() - start, proc
+
+
+def heavy_imports(importtime_log):
+    """Top-level heavy packages named in a -X importtime log."""
+    found = set()
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or line.count('|') < 2:
+            continue
+        module = line.rsplit('|', 1)[1].strip()
+        if module.split('.')[0] in HEAVY_MODULES:
+            found.add(module.split('.')[0])
+    return sorted(found)
+
+
+def time_invocation(proj_dir, args, repeat):
+    """Best and median wall time over repeat runs, plus the heavy modules imported."""
+    times = []
+    for _ in range(repeat):
+        seconds, proc = run(proj_dir, args)
+        if proc.returncode != 0:
+            raise RuntimeError(f"{' '.join(args)} exited {proc.returncode}:\n{proc.stdout}{proc.stderr}")
+        times.append(seconds)
+    _, proc = run(proj_dir, args, importtime=True)
+    return min(times), statistics.median(times), heavy_imports(proc.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark CLI startup and no-op invocations')
+    parser.add_argument('--repeat', type=int, default=10, help='Runs per invocation (default: 10)')
+    parser.add_argument('--max-ms', type=float, default=DEFAULT_MAX_MS,
+                        help='Fail if an invocation takes this much longer than bare interpreter '
+                             f'startup (default: {DEFAULT_MAX_MS})')
+    parser.add_argument('--output', type=Path, default=None, help='Also write results JSON here')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proj_dir = Path(tmp)
+        print("Preparing scratch project and priming caches...")
+        make_project(proj_dir)
+        for _, invocation in INVOCATIONS:
+            _, proc = run(proj_dir, invocation)
+            if proc.returncode != 0:
+                print(f"ERROR: priming run failed: {' '.join(invocation)}\n{proc.stdout}{proc.stderr}")
+                sys.exit(1)
+
+        baseline, _, _ = time_invocation(proj_dir, ['-c', 'pass'], args.repeat)
+        print(f"\n  {'python -c pass':<34} {baseline * 1000:7.1f} ms best")
+
+        results = {}
+        failures = []
+        for label, invocation in INVOCATIONS:
+            best, median, heavy = time_invocation(proj_dir, invocation, args.repeat)
+            overhead_ms = (best - baseline) * 1000
+            results[label] = {'best_ms': best * 1000, 'median_ms': median * 1000,
+                              'overhead_ms': overhead_ms, 'heavy': heavy}
+            print(f"  {label:<34} {best * 1000:7.1f} ms best {median * 1000:7.1f} ms median "
+                  f"(+{overhead_ms:.1f} ms)  heavy imports: {', '.join(heavy) or 'none'}")
+            if heavy:
+                failures.append(f"{label} imported {', '.join(heavy)}")
+            if overhead_ms > args.max_ms:
+                failures.append(f"{label} took {overhead_ms:.1f} ms over interpreter startup "
+                                f"(limit {args.max_ms:g} ms)")
+
+    if args.output:
+        args.output.write_text(json.dumps({'python_ms': baseline * 1000, 'invocations': results},
+                                          indent=2))
+        print(f"\nResults written to {args.output}")
+
+    if failures:
+        print("\nFAILED:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("\nAll invocations within limits")
+
+
+if __name__ == '__main__':
+    main()
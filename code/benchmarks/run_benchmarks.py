@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Benchmark Suite for the Python Pipeline
+
+Times the main stages of parse_xml.py and build_codebook.py on synthetic
+inputs (see synthetic.py) across scale tiers, and fails when a stage is
+slower than a saved baseline by more than a threshold.
+
+Stages:
+    parse_xml_tree         parse_qualtrics_xml (ET.parse engine)
+    parse_xml_stream       parse_qualtrics_xml(stream=True)
+    classify_rows          classify_rows on a synthetic parsed export
+    read_categorical_stats read_categorical_stats on a synthetic stats CSV
+    find_and_update_tables find_and_update_tables on a synthetic template
+    add_continuous_stats   add_continuous_stats on a synthetic template
+    render_codebook        single-pass render_codebook (both kinds of stats)
+    render_template_model  render from an already parsed codebook_template model
+
+Usage:
+    python code/benchmarks/run_benchmarks.py                      # small, medium
+    python code/benchmarks/run_benchmarks.py --tiers small medium large
+    python code/benchmarks/run_benchmarks.py --save-baseline      # record baseline
+    python code/benchmarks/run_benchmarks.py --threshold 0.5      # allow +50%
+
+Exit status is 1 if any stage regressed beyond the threshold, or if there
+is no baseline to compare against (without --save-baseline). Baselines are
+machine-specific, so none is committed; record one on the machine (or CI
+runner) that compares against it.
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import io
+import json
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent))
+
+import build_codebook  # noqa: E402
+import codebook_template  # noqa: E402
+import parse_xml  # noqa: E402
+from bench_classify import time_call  # noqa: E402
+import synthetic  # noqa: E402
+
+DEFAULT_BASELINE = BENCH_DIR / 'baseline.json'
+
+# Sizes per tier: XML responses x question columns, rows for classify_rows,
+# and continuous/categorical variable counts for the stats and codebook
+TIERS = {
+    'small': {'responses': 1_000, 'columns': 20, 'classify_rows': 10_000,
+              'continuous': 20, 'categorical': 100},
+    'medium': {'responses': 10_000, 'columns': 50, 'classify_rows': 100_000,
+               'continuous': 100, 'categorical': 1_000},
+    'large': {'responses': 50_000, 'columns': 100, 'classify_rows': 1_000_000,
+              'continuous': 500, 'categorical': 5_000},
+}
+
+# Ignore regressions smaller than this in absolute terms (timer noise)
+MIN_DELTA_SEC = 0.01
+
+
+def quiet(func):
+    """Wrap func so its progress prints do not clutter benchmark output."""
+    def wrapper(*args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def run_tier(tier, sizes, work_dir, repeat):
+    """Generate inputs for one tier and time every stage. Returns {stage: seconds}."""
+    work_dir = Path(work_dir)
+    xml_path = synthetic.write_qualtrics_xml(work_dir / f'{tier}.xml', sizes['responses'],
+                                             n_columns=sizes['columns'])
+    cont_path, cat_path = synthetic.write_stats_csvs(
+        work_dir / f'{tier}_continuous.csv', work_dir / f'{tier}_categorical.csv',
+        sizes['continuous'], sizes['categorical'])
+    template_path = synthetic.write_codebook_template(
+        work_dir / f'{tier}_template.md', sizes['continuous'], sizes['categorical'])
+    export = synthetic.make_synthetic_export(sizes['classify_rows'])
+
+    template = template_path.read_text(encoding='utf-8')
+    cont_stats = build_codebook.read_continuous_stats(cont_path)
+    cat_stats = build_codebook.read_categorical_stats(cat_path)
+    nodes = codebook_template.parse_template(template)
+    parse = quiet(parse_xml.parse_qualtrics_xml)
+
+    stages = {
+        'parse_xml_tree': lambda: parse(xml_path),
+        'parse_xml_stream': lambda: parse(xml_path, stream=True),
+        'classify_rows': lambda: parse_xml.classify_rows(export),
+        'read_categorical_stats': lambda: build_codebook.read_categorical_stats(cat_path),
+        'find_and_update_tables': lambda: build_codebook.find_and_update_tables(template, cat_stats),
+        'add_continuous_stats': lambda: build_codebook.add_continuous_stats(template, cont_stats),
+        'render_codebook': lambda: build_codebook.render_codebook(template, cat_stats, cont_stats),
+        'render_template_model': lambda: codebook_template.render(nodes, cat_stats, cont_stats),
+    }
+
+    results = {}
+    for stage, func in stages.items():
+        seconds, _ = time_call(func, repeat=repeat)
+        results[stage] = seconds
+        print(f"  {tier:<7} {stage:<24} {seconds:9.4f} s")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results against baseline ({'tier/stage': seconds}).
+
+    Returns:
+        list of (name, baseline_sec, current_sec) for stages slower than
+        baseline * (1 + threshold) by more than MIN_DELTA_SEC
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if current > base * (1 + threshold) and current - base > MIN_DELTA_SEC:
+            regressions.append((name, base, current))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Python pipeline on synthetic data')
+    parser.add_argument('--tiers', nargs='+', choices=list(TIERS), default=['small', 'medium'],
+                        help='Scale tiers to run (default: small medium)')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing repetitions (best is kept)')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE,
+                        help=f'Baseline JSON to compare against (default: {DEFAULT_BASELINE.name})')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Write these results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown as a fraction of baseline (default: 0.25)')
+    parser.add_argument('--output', type=Path, default=None, help='Also write results JSON here')
+    args = parser.parse_args()
+
+    # Fail before spending minutes on timings that cannot be gated
+    if not args.save_baseline and not args.baseline.exists():
+        print(f"ERROR: no baseline at {args.baseline}, so regressions cannot be detected.")
+        print("Record one on this machine with --save-baseline, or pass --baseline.")
+        sys.exit(1)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        for tier in args.tiers:
+            print(f"\n=== Tier: {tier} ({TIERS[tier]}) ===")
+            tier_results = run_tier(tier, TIERS[tier], work_dir, args.repeat)
+            results.update({f'{tier}/{stage}': sec for stage, sec in tier_results.items()})
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults: {args.output}")
+
+    if args.save_baseline:
+        baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+        baseline.update(results)
+        args.baseline.write_text(json.dumps(baseline, indent=2, sort_keys=True))
+        print(f"\nBaseline saved: {args.baseline}")
+        return
+
+    baseline = json.loads(args.baseline.read_text())
+    regressions = compare(results, baseline, args.threshold)
+    print(f"\n=== Comparison with {args.baseline.name} (threshold +{args.threshold:.0%}) ===")
+    uncovered = [name for name in results if name not in baseline]
+    if uncovered:
+        print(f"WARNING: not in the baseline, not compared: {', '.join(uncovered)}")
+    if not regressions:
+        print("No regressions")
+        return
+
+    for name, base, current in regressions:
+        print(f"  REGRESSION {name}: {base:.4f} s -> {current:.4f} s ({current / base - 1:+.0%})")
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Synthetic Inputs for the Pipeline Benchmarks
+
+Generators for data shaped like our real inputs, so the Python pipeline can
+be timed in CI without the (identifiable) survey data:
+
+    - make_synthetic_export:  DataFrame like a parsed Qualtrics export
+    - write_qualtrics_xml:    Qualtrics XML export with configurable
+                              responses, columns, preview and placeholder rows
+    - write_stats_csvs:       stats_*_continuous.csv / stats_*_categorical.csv
+                              in the format the summary_stats_*.do files write
+    - write_codebook_template: markdown codebook template with the same
+                              section, label and value-table layout as
+                              output/docs/*_codebook_template.md
+
+All generators are deterministic for a given seed.
+
+Created by Dan + Claude Code
+"""
+
+import csv
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+HEX_CHARS = np.array(list('0123456789abcdef'))
+
+# Fixed Qualtrics metadata fields written before the question columns
+METADATA_FIELDS = ['startDate', 'endDate', 'status', 'progress', 'duration', 'finished',
+                   'recordedDate', '_recordId', 'distributionChannel', 'PROLIFIC_PID']
+
+
+def _random_pids(rng, n):
+    """n random 24-character hex Prolific IDs."""
+    return [''.join(chars) for chars in rng.choice(HEX_CHARS, size=(n, 24))]
+
+
+def _row_kinds(rng, n, preview_share, placeholder_share, bad_pid_share=0.0):
+    """Boolean masks (is_preview, is_placeholder, is_bad_pid), mutually exclusive."""
+    draw = rng.random(n)
+    is_preview = draw < preview_share
+    is_placeholder = (draw >= preview_share) & (draw < preview_share + placeholder_share)
+    lo = preview_share + placeholder_share
+    is_bad_pid = (draw >= lo) & (draw < lo + bad_pid_share)
+    return is_preview, is_placeholder, is_bad_pid
+
+
+def make_synthetic_export(n_rows, seed=0, preview_share=0.02, placeholder_share=0.01,
+                          bad_pid_share=0.01):
+    """DataFrame with the columns classify_rows needs, shaped like a parsed export."""
+    rng = np.random.default_rng(seed)
+    is_preview, is_placeholder, is_bad_pid = _row_kinds(
+        rng, n_rows, preview_share, placeholder_share, bad_pid_share)
+
+    pids = np.array(_random_pids(rng, n_rows), dtype=object)
+    pids[is_placeholder] = '{{%PROLIFIC_PID%}}'
+    pids[is_bad_pid] = 'not-a-prolific-id'
+    pids[is_preview] = ''
+
+    return pd.DataFrame({
+        '_recordId': [f'R_{i:010d}' for i in range(n_rows)],
+        'PROLIFIC_PID': pids,
+        'distributionChannel': np.where(is_preview, 'preview', 'anonymous'),
+        'status': np.where(is_preview, 'Survey Preview', 'IP Address'),
+    })
+
+
+def write_qualtrics_xml(path, n_responses, n_columns=20, preview_share=0.02,
+                        placeholder_share=0.01, seed=0):
+    """
+    Write a synthetic Qualtrics XML export.
+
+    Each <Response> has the Qualtrics metadata fields followed by n_columns
+    question fields (alternating 1-5 Likert items, 0-100 sliders and short
+    free text; some left empty). Preview rows use the preview channel and
+    status; placeholder rows carry {{%PROLIFIC_PID%}}.
+    """
+    rng = np.random.default_rng(seed)
+    is_preview, is_placeholder, _ = _row_kinds(rng, n_responses, preview_share, placeholder_share)
+    pids = _random_pids(rng, n_responses)
+    likert = rng.integers(1, 6, size=(n_responses, n_columns))
+    slider = rng.integers(0, 101, size=(n_responses, n_columns))
+    empty = rng.random((n_responses, n_columns)) < 0.05
+    durations = rng.integers(30, 3600, size=n_responses)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<Responses>\n')
+        for i in range(n_responses):
+            minute = i % 60
+            preview = is_preview[i]
+            pid = '{{%PROLIFIC_PID%}}' if is_placeholder[i] else pids[i]
+            fields = [
+                ('startDate', f'2026-01-08 10:{minute:02d}:00'),
+                ('endDate', f'2026-01-08 11:{minute:02d}:00'),
+                ('status', 'Survey Preview' if preview else 'IP Address'),
+                ('progress', '100'),
+                ('duration', str(durations[i])),
+                ('finished', '1'),
+                ('recordedDate', f'2026-01-08 11:{minute:02d}:01'),
+                ('_recordId', f'R_{i:015d}'),
+                ('distributionChannel', 'preview' if preview else 'anonymous'),
+                ('PROLIFIC_PID', pid),
+            ]
+            for j in range(n_columns):
+                if empty[i, j]:
+                    value = ''
+                elif j % 3 == 0:
+                    value = str(likert[i, j])
+                elif j % 3 == 1:
+                    value = str(slider[i, j])
+                else:
+                    value = escape(f'free text <{i}> & more')
+                fields.append((f'Q{j + 1}', value))
+
+            f.write('<Response>')
+            f.write(''.join(f'<{tag}>{value}</{tag}>' for tag, value in fields))
+            f.write('</Response>\n')
+        f.write('</Responses>\n')
+
+    return path
+
+
+def variable_names(n_continuous, n_categorical):
+    """Names used by the stats and codebook generators, so they line up."""
+    cont_vars = [f'cont_var_{i}' for i in range(n_continuous)]
+    cat_vars = [f'cat_var_{i}' for i in range(n_categorical)]
+    return cont_vars, cat_vars
+
+
+def write_stats_csvs(cont_path, cat_path, n_continuous, n_categorical, n_values=5,
+                     missing_share=0.3, seed=0):
+    """
+    Write synthetic continuous and categorical stats CSVs.
+
+    Layout matches summary_stats_*.do: continuous rows are
+    variable,n,mean,sd,min,p50,max; categorical rows are variable,value,n,pct
+    with one row per value plus a '.' row for missing on missing_share of
+    the variables.
+    """
+    rng = np.random.default_rng(seed)
+    cont_vars, cat_vars = variable_names(n_continuous, n_categorical)
+
+    with open(cont_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['variable', 'n', 'mean', 'sd', 'min', 'p50', 'max'])
+        for var in cont_vars:
+            mean = rng.uniform(0, 500)
+            writer.writerow([var, int(rng.integers(1000, 9000)), f'{mean:.6f}',
+                             f'{rng.uniform(1, 100):.6f}', 0, f'{mean:.0f}',
+                             int(rng.integers(1000, 60000))])
+
+    with open(cat_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['variable', 'value', 'n', 'pct'])
+        for var in cat_vars:
+            counts = rng.integers(1, 2000, size=n_values)
+            pcts = 100 * counts / counts.sum()
+            for value, (n, pct) in enumerate(zip(counts, pcts)):
+                writer.writerow([var, value, int(n), f'{pct:.6f}'])
+            if rng.random() < missing_share:
+                writer.writerow([var, '.', int(rng.integers(1, 200)), f'{rng.uniform(0, 5):.6f}'])
+
+    return cont_path, cat_path
+
+
+def write_codebook_template(path, n_continuous, n_categorical, n_values=5):
+    """
+    Write a synthetic markdown codebook template covering the variables from
+    write_stats_csvs, grouped into sections of 25 variables.
+    """
+    cont_vars, cat_vars = variable_names(n_continuous, n_categorical)
+    lines = ['# Synthetic Codebook', '', '**Dataset:** `derived/synthetic_clean.dta`', '', '---', '']
+
+    entries = [(var, 'continuous') for var in cont_vars] + [(var, 'categorical') for var in cat_vars]
+    for k, (var, kind) in enumerate(entries):
+        if k % 25 == 0:
+            lines += [f'## Section {k // 25 + 1}', '']
+        lines.append(f'### `{var}`')
+        if kind == 'continuous':
+            lines += ['- **Type:** Numeric (continuous)', f'- **Label:** Continuous variable {var}', '']
+        else:
+            lines += ['- **Type:** Categorical', f'- **Label:** Categorical variable {var}', '',
+                      '| Code | Label |', '|------|-------|']
+            lines += [f'| {value} | Option {value} |' for value in range(n_values)]
+            lines.append('')
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines))
+    return path
@@ -3,7 +3,9 @@
 Build Codebook with Summary Statistics
 
 Reads statistics from Stata-generated CSV files and merges them into
-the markdown codebook template.
+the markdown codebook template. The parsed template is cached under
+derived/codebook_cache/ (see codebook_template.py), so rebuilding after a
+stats refresh does not re-parse an unchanged template.
 
 Input (prescreen):
     - output/tables/stats_continuous.csv
@@ -25,135 +27,62 @@ Usage:
     python code/build_codebook.py prescreen    # prescreen data
     python code/build_codebook.py main         # main survey data
     python code/build_codebook.py followup     # followup survey data
+    python code/build_codebook.py all          # all three, in parallel
+    python code/build_codebook.py main --force # rebuild even if inputs unchanged
+    python code/build_codebook.py main --data derived/main_clean.dta
+                                               # stats computed from the data (no Stata run)
+
+A dataset whose stats CSVs and template are unchanged since its last build
+(and whose codebook has not been edited since) is skipped; if only the stats
+changed, only the sections of variables whose stats changed are re-rendered.
+The build stamps live in derived/codebook_cache/<dataset>.stamp.json.
+With 'all', up-to-date datasets are checked before any worker is started,
+and pandas (stats_loader, summary_stats) is only imported by a build that
+reads statistics, so a no-op run costs a few file hashes.
 
 Created by Dan + Claude Code
 """
 
-import csv
+import argparse
+import hashlib
+import io
+import json
+import os
 import re
 import sys
+from contextlib import redirect_stdout
 from pathlib import Path
 
+from codebook_template import (BINARY_INDICATOR_VARS, MODEL_VERSION, VAR_HEADER, changed_vars,
+                               format_continuous_stats, format_n_pct, load_template,
+                               parse_template, render, render_chunks, rerender,
+                               split_chunks, stats_digests, stats_variables,
+                               update_value_table)
+
 
 def read_continuous_stats(filepath):
-    """Read continuous variable statistics from CSV."""
-    stats = {}
-    with open(filepath, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            var = row['variable']
-            stats[var] = {
-                'n': int(float(row['n'])),
-                'mean': float(row['mean']),
-                'sd': float(row['sd']),
-                'min': float(row['min']),
-                'median': float(row['p50']),
-                'max': float(row['max'])
-            }
-    return stats
+    """
+    Read continuous variable statistics from CSV.
+
+    Returns:
+        {var: {'n', 'mean', 'sd', 'min', 'median', 'max'}} (see stats_loader)
+    """
+    from stats_loader import load_continuous_stats
+
+    return load_continuous_stats(filepath).to_nested()
 
 
 def read_categorical_stats(filepath):
-    """Read categorical variable statistics from CSV."""
-    stats = {}
-    with open(filepath, 'r') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            # Skip rows with missing required fields
-            if not row.get('variable') or not row.get('value') or not row.get('n') or not row.get('pct'):
-                continue
-
-            var = row['variable'].strip()
-            val = row['value'].strip()
-            n_str = row['n'].strip()
-            pct_str = row['pct'].strip()
-
-            # Skip rows with empty values (malformed CSV)
-            if not var or not n_str or not pct_str:
-                continue
-
-            try:
-                n = int(float(n_str))
-                pct = float(pct_str)
-            except ValueError:
-                # Skip rows that can't be parsed
-                continue
-
-            if var not in stats:
-                stats[var] = {}
-
-            # Handle missing values (represented as ".")
-            if val == '.':
-                stats[var]['missing'] = {'n': n, 'pct': pct}
-            else:
-                # Try to parse as int, fall back to float, then string
-                try:
-                    val_key = int(float(val))
-                except ValueError:
-                    val_key = val
-                stats[var][val_key] = {'n': n, 'pct': pct}
-
-    return stats
-
-
-def format_n_pct(n, pct):
-    """Format N and percentage as string like '4,413 (56.05%)'."""
-    return f"{n:,} ({pct:.2f}%)"
-
-
-def update_value_table(table_lines, var_stats):
     """
-    Update a markdown value table to include N (%) column.
-
-    Input table format:
-    | Code | Label |
-    |------|-------|
-    | 0 | No |
-    | 1 | Yes |
-
-    Output table format:
-    | Code | Label | N (%) |
-    |------|-------|-------|
-    | 0 | No | 4,413 (56.05%) |
-    | 1 | Yes | 3,435 (43.63%) |
+    Read categorical variable statistics from CSV.
+
+    Returns:
+        {var: {value: {'n', 'pct'}}} with Stata missing ('.') under 'missing'
+        (see stats_loader for how malformed rows are skipped)
     """
-    if len(table_lines) < 3:
-        return table_lines  # Not enough lines for a table
+    from stats_loader import load_categorical_stats
 
-    new_lines = []
-
-    for i, line in enumerate(table_lines):
-        if i == 0:  # Header row
-            # Add N (%) column header
-            new_lines.append(line.rstrip() + ' N (%) |')
-        elif i == 1:  # Separator row
-            # Add separator for new column
-            new_lines.append(line.rstrip() + '-------|')
-        else:
-            # Data row - extract the code value and look up stats
-            # Parse: | Code | Label |
-            parts = line.split('|')
-            if len(parts) >= 3:
-                code_str = parts[1].strip()
-                try:
-                    code = int(code_str)
-                except ValueError:
-                    try:
-                        code = float(code_str)
-                    except ValueError:
-                        code = code_str
-
-                # Look up stats for this value
-                if code in var_stats:
-                    n_pct = format_n_pct(var_stats[code]['n'], var_stats[code]['pct'])
-                else:
-                    n_pct = '-'
-
-                new_lines.append(line.rstrip() + f' {n_pct} |')
-            else:
-                new_lines.append(line)
-
-    return new_lines
+    return load_categorical_stats(filepath).to_nested()
 
 
 def find_and_update_tables(content, cat_stats):
@@ -164,16 +93,13 @@ def find_and_update_tables(content, cat_stats):
     new_lines = []
     i = 0
 
-    # Pattern to match variable headers like ### `flu_vax_lastyear`
-    var_pattern = re.compile(r'^### `(\w+)`')
-
     current_var = None
 
     while i < len(lines):
         line = lines[i]
 
         # Check if this is a variable header
-        match = var_pattern.match(line)
+        match = VAR_HEADER.match(line)
         if match:
             current_var = match.group(1)
             new_lines.append(line)
@@ -208,16 +134,7 @@ def add_continuous_stats(content, cont_stats):
         # Find the variable section and add stats after the label line
         pattern = rf'(### `{var}`\n.*?- \*\*Label:\*\* [^\n]+)'
 
-        stats_table = f"""
-- **Summary Statistics (N={stats['n']:,}):**
-
-| Statistic | Value |
-|-----------|-------|
-| Mean | {stats['mean']:,.1f} |
-| SD | {stats['sd']:,.1f} |
-| Min | {stats['min']:,.0f} |
-| Median | {stats['median']:,.0f} |
-| Max | {stats['max']:,.0f} |"""
+        stats_table = format_continuous_stats(stats)
 
         def add_stats(match):
             return match.group(1) + stats_table
@@ -227,6 +144,20 @@ def add_continuous_stats(content, cont_stats):
     return content
 
 
+def render_codebook(content, cat_stats, cont_stats, binary_indicators=False):
+    """
+    Render the codebook from template text in a single pass.
+
+    Parses the template into the codebook_template node model and renders
+    it; main() uses load_template instead so the parse is cached. Equivalent
+    to find_and_update_tables followed by add_continuous_stats (and
+    update_binary_indicator_table with binary_indicators=True), except that
+    a section without a **Label:** line no longer picks up the next
+    section's label.
+    """
+    return render(parse_template(content), cat_stats, cont_stats, binary_indicators)
+
+
 def update_binary_indicator_table(content, cat_stats):
     """
     Update the binary indicators table in Information Sources section.
@@ -236,10 +167,6 @@ def update_binary_indicator_table(content, cat_stats):
     pattern = r'(\| Variable \| Label \|\n\|----------\|-------\|)'
     match = re.search(pattern, content)
     if match:
-        # Find all source_* variables in the table
-        source_vars = ['source_doctor', 'source_sm', 'source_podcasts',
-                       'source_cdc', 'source_news', 'source_none']
-
         # Update the header
         new_header = '| Variable | Label | N (%) Yes |'
         new_sep = '|----------|-------|-----------|'
@@ -248,7 +175,7 @@ def update_binary_indicator_table(content, cat_stats):
         content = content.replace('|----------|-------|', new_sep)
 
         # Update each row
-        for var in source_vars:
+        for var in BINARY_INDICATOR_VARS:
             if var in cat_stats and 1 in cat_stats[var]:
                 n_pct = format_n_pct(cat_stats[var][1]['n'], cat_stats[var][1]['pct'])
                 old_pattern = rf'(\| `{var}` \| [^|]+ \|)'
@@ -258,69 +185,299 @@ def update_binary_indicator_table(content, cat_stats):
     return content
 
 
-def main():
-    # Parse command line argument
-    dataset = sys.argv[1] if len(sys.argv) > 1 else 'prescreen'
+# Dataset -> (continuous stats CSV, categorical stats CSV) in output/tables
+DATASETS = {
+    'prescreen': ('stats_continuous.csv', 'stats_categorical.csv'),
+    'main': ('stats_main_continuous.csv', 'stats_main_categorical.csv'),
+    'followup': ('stats_followup_continuous.csv', 'stats_followup_categorical.csv'),
+}
 
-    if dataset not in ['prescreen', 'main', 'followup']:
-        print(f"Error: Unknown dataset '{dataset}'. Use 'prescreen', 'main', or 'followup'.")
-        sys.exit(1)
+# Bump when rendering changes in a way that must invalidate build stamps
+STAMP_VERSION = 2
 
-    # Set up paths
-    proj_dir = Path(__file__).parent.parent
-    output_dir = proj_dir / 'output'
-
-    # Set file paths based on dataset
-    if dataset == 'prescreen':
-        cont_stats_file = output_dir / 'tables/stats_continuous.csv'
-        cat_stats_file = output_dir / 'tables/stats_categorical.csv'
-        template_path = output_dir / 'docs/prescreen_codebook_template.md'
-        codebook_path = output_dir / 'docs/prescreen_codebook.md'
-    elif dataset == 'main':
-        cont_stats_file = output_dir / 'tables/stats_main_continuous.csv'
-        cat_stats_file = output_dir / 'tables/stats_main_categorical.csv'
-        template_path = output_dir / 'docs/main_codebook_template.md'
-        codebook_path = output_dir / 'docs/main_codebook.md'
-    else:  # followup
-        cont_stats_file = output_dir / 'tables/stats_followup_continuous.csv'
-        cat_stats_file = output_dir / 'tables/stats_followup_categorical.csv'
-        template_path = output_dir / 'docs/followup_codebook_template.md'
-        codebook_path = output_dir / 'docs/followup_codebook.md'
+
+def dataset_paths(proj_dir, dataset):
+    """Input and output paths for one dataset."""
+    output_dir = Path(proj_dir) / 'output'
+    cont_name, cat_name = DATASETS[dataset]
+    return {
+        'cont_stats': output_dir / 'tables' / cont_name,
+        'cat_stats': output_dir / 'tables' / cat_name,
+        'template': output_dir / 'docs' / f'{dataset}_codebook_template.md',
+        'codebook': output_dir / 'docs' / f'{dataset}_codebook.md',
+    }
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's bytes."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def input_digests(paths, data_path=None):
+    """
+    Digests of the statistics source (the stats CSVs, or the data file with
+    data_path) and the template, plus the versions that affect rendering.
+    """
+    digests = {'stamp_version': STAMP_VERSION, 'model_version': MODEL_VERSION}
+    if data_path is not None:
+        digests['data'] = file_digest(data_path)
+    else:
+        digests['cont_stats'] = file_digest(paths['cont_stats'])
+        digests['cat_stats'] = file_digest(paths['cat_stats'])
+    digests['template'] = file_digest(paths['template'])
+    return digests
+
+
+def stamp_path(cache_dir, dataset):
+    return Path(cache_dir) / f'{dataset}.stamp.json'
+
+
+def read_stamp(stamp_file):
+    """The stamp written by the last build, or None if missing or unreadable."""
+    try:
+        return json.loads(Path(stamp_file).read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(stamp_file, digests, codebook_path, var_digests, node_lines):
+    """
+    Record a build: input digests, the written codebook's digest, the
+    per-variable stats digests and the number of output lines per template
+    node (so the next build can patch individual sections).
+    """
+    stamp = {
+        'inputs': digests,
+        'codebook': file_digest(codebook_path),
+        'vars': var_digests,
+        'node_lines': node_lines,
+    }
+    stamp_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = stamp_file.with_name(stamp_file.name + f'.tmp{os.getpid()}')
+    tmp_file.write_text(json.dumps(stamp))
+    os.replace(tmp_file, stamp_file)
+
+
+def is_up_to_date(dataset, proj_dir, data_path=None):
+    """
+    True if the last build's stamp matches the current inputs and the
+    codebook on disk is the one it wrote (False if any input is missing).
+    """
+    paths = dataset_paths(proj_dir, dataset)
+    stamp = read_stamp(stamp_path(Path(proj_dir) / 'derived' / 'codebook_cache', dataset))
+    if stamp is None or not paths['codebook'].exists():
+        return False
+    try:
+        digests = input_digests(paths, data_path)
+    except OSError:
+        return False
+    return stamp.get('inputs') == digests and stamp.get('codebook') == file_digest(paths['codebook'])
+
+
+def previous_chunks(stamp, digests, codebook_path, codebook_digest):
+    """
+    Split the existing codebook into per-node chunks for an incremental
+    rebuild.
+
+    Only possible when the last build used the same template and rendering
+    versions and the codebook has not been edited since.
+
+    Returns:
+        list of per-node line lists, or None if a full render is needed
+    """
+    if stamp is None or codebook_digest is None or stamp.get('codebook') != codebook_digest:
+        return None
+    old_inputs = stamp.get('inputs', {})
+    for key in ('stamp_version', 'model_version', 'template'):
+        if old_inputs.get(key) != digests[key]:
+            return None
+    if 'node_lines' not in stamp or 'vars' not in stamp:
+        return None
+    with open(codebook_path, 'r', encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    return split_chunks(lines, stamp['node_lines'])
+
+
+def build_codebook(dataset, proj_dir, force=False, data_path=None):
+    """
+    Build the codebook for one dataset.
+
+    Statistics come from the Stata stats CSVs, or with data_path are
+    computed in memory from that survey data file (see summary_stats.py),
+    with variables typed by their template **Type:** lines.
+
+    Skipped when the stats CSVs and template are unchanged since the last
+    build (per the stamp in derived/codebook_cache/) and the codebook on
+    disk is the one that build wrote. When only the stats changed, just the
+    sections of variables whose stats differ from the last build are
+    re-rendered into the existing codebook. force=True always does a full
+    rebuild.
+
+    Returns:
+        'built' or 'skipped'
+    """
+    paths = dataset_paths(proj_dir, dataset)
+    cache_dir = Path(proj_dir) / 'derived' / 'codebook_cache'
+    codebook_path = paths['codebook']
+    binary_indicators = dataset == 'prescreen'
 
     print(f"Building codebook for: {dataset}")
 
+    digests = input_digests(paths, data_path)
+    stamp_file = stamp_path(cache_dir, dataset)
+    stamp = None if force else read_stamp(stamp_file)
+    codebook_digest = file_digest(codebook_path) if codebook_path.exists() else None
+    if stamp is not None and stamp.get('inputs') == digests and stamp.get('codebook') == codebook_digest:
+        print(f"  Stats and template unchanged; skipping ({codebook_path} is up to date)")
+        return 'skipped'
+
+    # Load the parsed template (re-parsed only when the template changes)
+    print(f"Reading markdown codebook template from {paths['template']}...")
+    nodes, from_cache = load_template(paths['template'], cache_dir=cache_dir)
+    print(f"  Template model: {len(nodes)} nodes ({'cached' if from_cache else 'parsed'})")
+
     # Read statistics
-    print("Reading statistics from CSV files...")
-    cont_stats = read_continuous_stats(cont_stats_file)
-    cat_stats = read_categorical_stats(cat_stats_file)
+    if data_path is not None:
+        from summary_stats import print_info, summary_stats_from_file
+
+        print(f"Computing statistics from {data_path}...")
+        cont_vars, cat_vars = stats_variables(nodes)
+        cont_stats, cat_stats, info = summary_stats_from_file(data_path, cont_vars, cat_vars)
+        print_info(info)
+    else:
+        print("Reading statistics from CSV files...")
+        cont_stats = read_continuous_stats(paths['cont_stats'])
+        cat_stats = read_categorical_stats(paths['cat_stats'])
+    var_digests = stats_digests(cat_stats, cont_stats)
 
     print(f"  Continuous variables: {len(cont_stats)}")
     print(f"  Categorical variables: {len(cat_stats)}")
 
-    # Read markdown template
-    print(f"Reading markdown codebook template from {template_path}...")
-    with open(template_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Update tables with categorical statistics
-    print("Updating categorical variable tables...")
-    content = find_and_update_tables(content, cat_stats)
-
-    # Update binary indicator table (prescreen only has this special table)
-    if dataset == 'prescreen':
-        print("Updating binary indicator tables...")
-        content = update_binary_indicator_table(content, cat_stats)
-
-    # Add continuous variable statistics
-    print("Adding continuous variable statistics...")
-    content = add_continuous_stats(content, cont_stats)
+    # Add categorical and continuous statistics (and, for prescreen, the
+    # binary indicator table). If the previous codebook can be reused, only
+    # the nodes of variables whose stats changed are re-rendered.
+    chunks = None
+    old_chunks = previous_chunks(stamp, digests, codebook_path, codebook_digest)
+    if old_chunks is not None:
+        changed = changed_vars(stamp['vars'], var_digests)
+        print(f"Re-rendering sections for {len(changed)} variable(s) with changed statistics...")
+        chunks, n_rerendered = rerender(nodes, old_chunks, changed, cat_stats, cont_stats,
+                                        binary_indicators)
+        print(f"  Re-rendered {n_rerendered} of {len(nodes)} nodes")
+    if chunks is None:
+        print("Updating categorical tables and adding continuous statistics...")
+        chunks = render_chunks(nodes, cat_stats, cont_stats, binary_indicators)
 
     # Write updated codebook
     print("Writing updated codebook...")
     with open(codebook_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+        f.write('\n'.join(line for chunk in chunks for line in chunk))
+    write_stamp(stamp_file, digests, codebook_path, var_digests, [len(chunk) for chunk in chunks])
 
     print(f"\nDone! Updated codebook saved to: {codebook_path}")
+    return 'built'
+
+
+def _build_worker(dataset, proj_dir, force):
+    """
+    Process-pool entry point: run build_codebook with its log captured.
+
+    Returns:
+        (dataset, status, log) where status is 'built', 'skipped' or 'failed'
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            status = build_codebook(dataset, proj_dir, force=force)
+        except Exception:
+            import traceback
+            status = 'failed'
+            print(f"\nFAILED with exception:\n{traceback.format_exc()}")
+    return dataset, status, log.getvalue()
+
+
+def build_all(proj_dir, datasets=None, max_workers=None, force=False):
+    """
+    Build several codebooks in a process pool, one worker per dataset.
+
+    Each worker's log is printed as one contiguous block per dataset (in the
+    order given), so logs from concurrent workers do not interleave.
+    Datasets that are up to date are reported without starting a worker.
+
+    Returns:
+        dict mapping dataset -> 'built', 'skipped' or 'failed'
+    """
+    datasets = list(datasets or DATASETS)
+    results = {}
+    stale = []
+    for dataset in datasets:
+        if not force and is_up_to_date(dataset, proj_dir):
+            results[dataset] = 'skipped'
+            print(f"\n[{dataset}] SKIPPED (stats and template unchanged)")
+        else:
+            stale.append(dataset)
+
+    if stale:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=max_workers or len(stale)) as pool:
+            futures = {dataset: pool.submit(_build_worker, dataset, proj_dir, force)
+                       for dataset in stale}
+            for dataset in stale:
+                _, status, log = futures[dataset].result()
+                results[dataset] = status
+                print(f"\n{'=' * 70}\n[{dataset}] {status.upper()}\n{'=' * 70}")
+                print(log, end='')
+
+    print(f"\n=== ALL CODEBOOKS ===")
+    for dataset in datasets:
+        print(f"  {dataset}: {results[dataset]}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build markdown codebooks with summary statistics')
+    parser.add_argument(
+        'dataset',
+        nargs='?',
+        default='prescreen',
+        choices=list(DATASETS) + ['all'],
+        help="Dataset to build (default: prescreen), or 'all' to build every codebook in parallel"
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Rebuild even if the stats CSVs and template are unchanged since the last build'
+    )
+    parser.add_argument(
+        '--data',
+        type=Path,
+        default=None,
+        help='Compute statistics from this survey data file (.dta, .parquet, .feather, .arrow) '
+             'instead of reading the Stata stats CSVs'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help="With 'all': number of worker processes (default: one per dataset)"
+    )
+    args = parser.parse_args()
+
+    proj_dir = Path(__file__).parent.parent
+
+    if args.dataset == 'all':
+        if args.data:
+            parser.error("--data cannot be given with 'all' (one data file per dataset)")
+        results = build_all(proj_dir, max_workers=args.jobs, force=args.force)
+        sys.exit(1 if 'failed' in results.values() else 0)
+
+    if args.data and not args.data.exists():
+        print(f"ERROR: data file not found: {args.data}")
+        sys.exit(1)
+
+    build_codebook(args.dataset, proj_dir, force=args.force, data_path=args.data)
 
 
 if __name__ == '__main__':
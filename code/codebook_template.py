@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Parsed Codebook Template Model
+
+Parses a markdown codebook template (output/docs/*_codebook_template.md)
+once into a flat list of nodes, so rendering with new statistics only
+touches the nodes that take statistics:
+
+    text          static lines (headings, descriptions, blank lines, ...)
+    header        a variable header line, ### `var`
+    label         the first **Label:** line of a variable section whose
+                  header is exactly ### `var` (continuous stats go after it)
+    value_table   a | Code | Label | table inside a variable section
+    binary_table  the | Variable | Label | table of source_* indicators
+                  (prescreen only)
+
+Nodes are plain dicts so the parsed model can be cached as JSON. The cache
+lives under derived/codebook_cache/ and is keyed by a hash of the template
+bytes and MODEL_VERSION, so rebuilding a codebook after a stats refresh
+skips template parsing entirely.
+
+For incremental rebuilds, stats_digests() fingerprints each variable's
+statistics and rerender() re-renders only the nodes whose variables changed,
+reusing the previous render's lines for everything else.
+
+Created by Dan + Claude Code
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+# Bump when parsing or the node layout changes (invalidates cached models)
+MODEL_VERSION = 1
+
+# Variable section headers like ### `flu_vax_lastyear`
+VAR_HEADER = re.compile(r'^### `(\w+)`')
+
+# A variable's label line (continuous stats are inserted after it)
+LABEL_LINE = re.compile(r'- \*\*Label:\*\* [^\n]')
+
+# Rows of the binary indicators table in the Information Sources section
+BINARY_INDICATOR_VARS = ['source_doctor', 'source_sm', 'source_podcasts',
+                         'source_cdc', 'source_news', 'source_none']
+BINARY_HEADER = '| Variable | Label |'
+
+# A variable's type line, e.g. - **Type:** Numeric (continuous)
+TYPE_LINE = re.compile(r'^- \*\*Type:\*\* (.+)$')
+BINARY_SEPARATOR = '|----------|-------|'
+
+
+def format_n_pct(n, pct):
+    """Format N and percentage as string like '4,413 (56.05%)'."""
+    return f"{n:,} ({pct:.2f}%)"
+
+
+def format_continuous_stats(stats):
+    """Format the summary statistics block inserted after a variable's label line."""
+    return f"""
+- **Summary Statistics (N={stats['n']:,}):**
+
+| Statistic | Value |
+|-----------|-------|
+| Mean | {stats['mean']:,.1f} |
+| SD | {stats['sd']:,.1f} |
+| Min | {stats['min']:,.0f} |
+| Median | {stats['median']:,.0f} |
+| Max | {stats['max']:,.0f} |"""
+
+
+def update_value_table(table_lines, var_stats):
+    """
+    Update a markdown value table to include N (%) column.
+
+    Input table format:
+    | Code | Label |
+    |------|-------|
+    | 0 | No |
+    | 1 | Yes |
+
+    Output table format:
+    | Code | Label | N (%) |
+    |------|-------|-------|
+    | 0 | No | 4,413 (56.05%) |
+    | 1 | Yes | 3,435 (43.63%) |
+    """
+    if len(table_lines) < 3:
+        return table_lines  # Not enough lines for a table
+
+    new_lines = []
+
+    for i, line in enumerate(table_lines):
+        if i == 0:  # Header row
+            # Add N (%) column header
+            new_lines.append(line.rstrip() + ' N (%) |')
+        elif i == 1:  # Separator row
+            # Add separator for new column
+            new_lines.append(line.rstrip() + '-------|')
+        else:
+            # Data row - extract the code value and look up stats
+            # Parse: | Code | Label |
+            parts = line.split('|')
+            if len(parts) >= 3:
+                code_str = parts[1].strip()
+                try:
+                    code = int(code_str)
+                except ValueError:
+                    try:
+                        code = float(code_str)
+                    except ValueError:
+                        code = code_str
+
+                # Look up stats for this value
+                if code in var_stats:
+                    n_pct = format_n_pct(var_stats[code]['n'], var_stats[code]['pct'])
+                else:
+                    n_pct = '-'
+
+                new_lines.append(line.rstrip() + f' {n_pct} |')
+            else:
+                new_lines.append(line)
+
+    return new_lines
+
+
+def update_binary_rows(table_lines, cat_stats):
+    """Add the N (%) Yes column to the binary indicators table."""
+    new_lines = [line.replace(BINARY_HEADER, '| Variable | Label | N (%) Yes |')
+                     .replace(BINARY_SEPARATOR, '|----------|-------|-----------|')
+                 for line in table_lines]
+
+    for var in BINARY_INDICATOR_VARS:
+        if var in cat_stats and 1 in cat_stats[var]:
+            n_pct = format_n_pct(cat_stats[var][1]['n'], cat_stats[var][1]['pct'])
+            row_pattern = re.compile(rf'(\| `{var}` \| [^|]+ \|)')
+            new_lines = [row_pattern.sub(rf'\1 {n_pct} |', line) for line in new_lines]
+
+    return new_lines
+
+
+def parse_template(content):
+    """
+    Parse template text into a list of nodes (see module docstring).
+
+    Adjacent static lines are merged into one text node, so rendering is a
+    join over a few hundred strings regardless of template size.
+    """
+    lines = content.split('\n')
+    nodes = []
+    text = []
+
+    def flush_text():
+        if text:
+            nodes.append({'kind': 'text', 'lines': text.copy()})
+            text.clear()
+
+    var = None
+    wants_label = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        match = VAR_HEADER.match(line)
+        if match:
+            flush_text()
+            var = match.group(1)
+            wants_label = line == f'### `{var}`'
+            nodes.append({'kind': 'header', 'var': var, 'lines': [line]})
+            i += 1
+            continue
+
+        if var is not None and line.strip() == '| Code | Label |':
+            flush_text()
+            table = []
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                table.append(lines[i])
+                i += 1
+            nodes.append({'kind': 'value_table', 'var': var, 'lines': table})
+            continue
+
+        if line == BINARY_HEADER and i + 1 < len(lines) and lines[i + 1] == BINARY_SEPARATOR:
+            flush_text()
+            table = []
+            while i < len(lines) and lines[i].strip().startswith('|'):
+                table.append(lines[i])
+                i += 1
+            nodes.append({'kind': 'binary_table', 'var': None, 'lines': table})
+            continue
+
+        if wants_label and LABEL_LINE.search(line):
+            flush_text()
+            nodes.append({'kind': 'label', 'var': var, 'lines': [line]})
+            wants_label = False
+            i += 1
+            continue
+
+        text.append(line)
+        i += 1
+
+    flush_text()
+    return nodes
+
+
+def render_node(node, cat_stats, cont_stats, binary_indicators=False):
+    """Return the output lines for one node given the statistics."""
+    kind = node['kind']
+    var = node.get('var')
+
+    if kind == 'value_table' and var in cat_stats:
+        return update_value_table(node['lines'], cat_stats[var])
+    if kind == 'label' and var in cont_stats:
+        return node['lines'] + format_continuous_stats(cont_stats[var]).split('\n')[1:]
+    if kind == 'binary_table' and binary_indicators:
+        return update_binary_rows(node['lines'], cat_stats)
+    return node['lines']
+
+
+def render_chunks(nodes, cat_stats, cont_stats, binary_indicators=False):
+    """Rendered lines per node (same order as nodes)."""
+    return [render_node(node, cat_stats, cont_stats, binary_indicators) for node in nodes]
+
+
+def render(nodes, cat_stats, cont_stats, binary_indicators=False):
+    """
+    Render the codebook from parsed nodes and statistics.
+
+    Only value_table, label and binary_table nodes look at the statistics;
+    every other node is emitted unchanged.
+    """
+    out = []
+    for chunk in render_chunks(nodes, cat_stats, cont_stats, binary_indicators):
+        out.extend(chunk)
+    return '\n'.join(out)
+
+
+def node_vars(node):
+    """Variables whose statistics a node's rendering depends on."""
+    if node['kind'] in ('value_table', 'label'):
+        return (node['var'],)
+    if node['kind'] == 'binary_table':
+        return tuple(BINARY_INDICATOR_VARS)
+    return ()
+
+
+def stats_digests(cat_stats, cont_stats):
+    """
+    Per-variable digests of the statistics, keyed 'cat:<var>' / 'cont:<var>'.
+
+    Used to find the variables whose stats changed since the last render.
+    """
+    digests = {}
+    for prefix, stats in (('cat', cat_stats), ('cont', cont_stats)):
+        for var, var_stats in stats.items():
+            digests[f'{prefix}:{var}'] = hashlib.sha1(repr(var_stats).encode()).hexdigest()[:16]
+    return digests
+
+
+def changed_vars(old_digests, new_digests):
+    """Variables added, removed or changed between two stats_digests results."""
+    keys = set(old_digests) | set(new_digests)
+    return {key.split(':', 1)[1] for key in keys if old_digests.get(key) != new_digests.get(key)}
+
+
+def rerender(nodes, old_chunks, changed, cat_stats, cont_stats, binary_indicators=False):
+    """
+    Re-render only the nodes that depend on a variable in `changed`.
+
+    old_chunks are the per-node lines of the previous render (e.g. the
+    existing codebook split by the node line counts recorded at that
+    render); every other node's lines are reused as-is.
+
+    Returns:
+        (chunks, n_rerendered)
+    """
+    chunks = []
+    n_rerendered = 0
+    for node, old in zip(nodes, old_chunks):
+        if any(var in changed for var in node_vars(node)):
+            chunks.append(render_node(node, cat_stats, cont_stats, binary_indicators))
+            n_rerendered += 1
+        else:
+            chunks.append(old)
+    return chunks, n_rerendered
+
+
+def split_chunks(lines, node_lines):
+    """
+    Split rendered lines into per-node chunks using recorded line counts.
+
+    Returns:
+        list of line lists, or None if the counts do not match the lines
+    """
+    if sum(node_lines) != len(lines):
+        return None
+    chunks = []
+    pos = 0
+    for count in node_lines:
+        chunks.append(lines[pos:pos + count])
+        pos += count
+    return chunks
+
+
+def variable_types(nodes):
+    """
+    Map each variable to the text of its first **Type:** line.
+
+    Returns:
+        {var: type} in template order, e.g. {'duration_sec': 'Numeric (continuous)'}
+    """
+    types = {}
+    var = None
+    for node in nodes:
+        if node['kind'] == 'header':
+            var = node['var']
+            continue
+        if var is None or var in types or node['kind'] != 'text':
+            continue
+        for line in node['lines']:
+            match = TYPE_LINE.match(line)
+            if match:
+                types[var] = match.group(1).strip()
+                break
+    return types
+
+
+def stats_variables(nodes):
+    """
+    Split template variables by the statistics they get, from their types:
+    Numeric (continuous ...) and Numeric (derived) are continuous; Binary and
+    Categorical are categorical; String and plain Numeric get none.
+
+    Returns:
+        (cont_vars, cat_vars)
+    """
+    cont_vars, cat_vars = [], []
+    for var, type_text in variable_types(nodes).items():
+        lowered = type_text.lower()
+        if lowered.startswith('numeric') and ('continuous' in lowered or 'derived' in lowered):
+            cont_vars.append(var)
+        elif lowered.startswith(('binary', 'categorical')):
+            cat_vars.append(var)
+    return cont_vars, cat_vars
+
+
+def template_key(content):
+    """Cache key for template text: hash of its bytes and MODEL_VERSION."""
+    digest = hashlib.sha256(content.encode('utf-8'))
+    digest.update(f";model={MODEL_VERSION}".encode())
+    return digest.hexdigest()
+
+
+def load_template(template_path, cache_dir=None):
+    """
+    Return the parsed nodes for a template file.
+
+    With cache_dir, the model is read from <cache_dir>/<stem>-<key>.json
+    when present and written there after parsing otherwise.
+
+    Returns:
+        (nodes, from_cache)
+    """
+    template_path = Path(template_path)
+    content = template_path.read_text(encoding='utf-8')
+    if cache_dir is None:
+        return parse_template(content), False
+
+    cache_dir = Path(cache_dir)
+    cache_file = cache_dir / f"{template_path.stem}-{template_key(content)[:20]}.json"
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f), True
+        except (OSError, ValueError):
+            pass  # Corrupt entry: re-parse and overwrite
+
+    nodes = parse_template(content)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Drop models of earlier versions of this template
+    for old in cache_dir.glob(f"{template_path.stem}-*.json"):
+        old.unlink()
+
+    tmp_file = cache_file.with_name(cache_file.name + f".tmp{os.getpid()}")
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(nodes, f)
+    os.replace(tmp_file, cache_file)
+    return nodes, False
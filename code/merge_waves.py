@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Merge the Survey Waves on the Prolific ID in One Join
+
+Python replacement for merge_prescreen_main.do + merge_followup.do: reads
+each wave's cleaned data once, keeps its final sample, and joins all waves
+onto the base wave (the first in the spec, main) in a single pass, driven
+by a spec (default: code/merge_waves.json).
+
+Each non-base wave is indexed by its validated key (study_id, the Prolific
+ID: stripped, lower-cased and checked against parse_xml's 24-hex-character
+pattern) in a hash index, and the base rows look up their match in every
+wave at once. As in the do-files, every base row is kept and unmatched
+rows of the other waves are dropped (merge 1:1 ..., keep(1 3)); a key that
+appears twice within a wave's final sample is an error.
+
+Column conflicts are resolved automatically, separately for each output
+among the waves it contains: a column that appears in more than one of
+them gets the wave's prefix (pre_, main_, followup_) in every wave it
+appears in, except in the wave that lists it under 'keep'. A wave's
+'rename' and 'drop' are applied before conflicts are found. The spec's
+rename, keep and drop lists reproduce the do-files' names: main keeps
+vacc_intent; prescreen renames its *_miss indicators to pre_*_miss
+(clean_main.do never creates them, so they are no conflict, but
+$pre_miss in _set_controls.do needs the pre_ names); prescreen and
+followup drop first_attempt and is_preview (Stata's `update` merge keeps
+main's values); followup keeps start_date, end_date, duration_sec,
+progress, consent, incomplete, failed_attn, pid_mismatch,
+duplicate_study_id and comments, whose main copies the do-file renames
+first. A column shared by main and followup
+beyond these (none in the current clean files) is prefixed in
+merged_all, where `update` would have kept main's value under the bare
+name.
+Each non-base wave adds a match indicator (in_pre, in_followup), and
+'flags' are 1 where all their inputs are 1 (main_sample, followup_sample).
+
+Outputs are written as Parquet by default (--format dta also writes .dta
+for the Stata stages, with every wave's variable and value labels plus
+the indicator and flag labels of the spec), one file per entry in
+'outputs' with the columns of its waves, so merged_main_pre and
+merged_all come from the same join.
+
+Usage:
+    python code/merge_waves.py                       # derived/merged_*.parquet
+    python code/merge_waves.py --format parquet dta
+    python code/merge_waves.py --list
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import survey_io
+
+DEFAULT_SPEC = Path('code') / 'merge_waves.json'
+
+# Longest variable name Stata accepts
+STATA_NAME_MAX = 32
+
+
+def load_spec(spec_path):
+    """
+    Read and validate a merge spec.
+
+    Returns:
+        spec dict with 'key', 'waves' (base wave first), 'outputs' and
+        optionally 'flags'
+    """
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    names = set()
+    for k, wave in enumerate(spec['waves']):
+        for field in ('name', 'data', 'prefix'):
+            if field not in wave:
+                raise ValueError(f"Wave spec {wave.get('name', '?')!r} is missing {field}")
+        if k > 0 and 'indicator' not in wave:
+            raise ValueError(f"Wave {wave['name']!r} needs an indicator (only the base wave has none)")
+        if wave['name'] in names:
+            raise ValueError(f"Duplicate wave name {wave['name']!r}")
+        names.add(wave['name'])
+    base = spec['waves'][0]['name']
+    for output in spec['outputs']:
+        unknown = [name for name in output['waves'] if name not in names]
+        if unknown:
+            raise ValueError(f"Output {output['path']!r}: unknown waves {', '.join(unknown)}")
+        if base not in output['waves']:
+            raise ValueError(f"Output {output['path']!r} must include the base wave {base!r}")
+    return spec
+
+
+def read_wave(path):
+    """
+    Read a wave's cleaned data (.dta with value codes, not labels, so
+    labelled numeric variables stay numeric) and its labels.
+
+    Returns:
+        (df, variable_labels {var: label}, value_labels {var: {code: label}});
+        the labels are empty for columnar formats
+    """
+    import pandas as pd
+
+    path = Path(path)
+    df = pd.concat(list(survey_io.iter_survey_chunks(path)), ignore_index=True)
+    variable_labels, value_labels = {}, {}
+    if path.suffix.lower() == '.dta':
+        with pd.read_stata(path, iterator=True) as reader:
+            variable_labels = {var: label for var, label in reader.variable_labels().items() if label}
+            label_sets = reader.value_labels()
+            # pandas has no public variable -> value label name mapping
+            value_labels = {var: label_sets[name] for var, name in zip(reader._varlist, reader._lbllist)
+                            if name in label_sets}
+    return df, variable_labels, value_labels
+
+
+def normalize_keys(values):
+    """
+    Matching form of the key: stripped and lower-cased, missing where it is
+    not a valid Prolific ID.
+
+    Returns:
+        (keys, valid) Series
+    """
+    from parse_xml import valid_prolific_id_mask
+
+    keys = values.astype('string').str.strip().str.lower()
+    valid = valid_prolific_id_mask(keys)
+    return keys.where(valid), valid
+
+
+def prepare_wave(df, labels, wave, key):
+    """
+    Keep a wave's final sample and apply its renames and drops (to the
+    data and to its (variable_labels, value_labels)).
+
+    Returns:
+        (df, keys, labels, diagnostics) with keys the normalized key of each row
+    """
+    if key not in df.columns:
+        raise ValueError(f"{wave['name']}: no key column {key!r}")
+    diagnostics = {'rows': len(df)}
+    if wave.get('filter'):
+        # Stata's `use ... if var`: true unless 0 (missing counts as true)
+        df = df[df[wave['filter']] != 0]
+    df = df.drop(columns=wave.get('drop', []), errors='ignore').rename(columns=wave.get('rename', {}))
+    df = df.reset_index(drop=True)
+    renames, dropped = wave.get('rename', {}), set(wave.get('drop', []))
+    labels = tuple({renames.get(var, var): value for var, value in mapping.items() if var not in dropped}
+                   for mapping in labels)
+
+    keys, valid = normalize_keys(df[key])
+    duplicated = keys[valid].duplicated(keep=False)
+    if duplicated.any():
+        raise ValueError(f"{wave['name']}: {key} does not uniquely identify observations "
+                         f"({duplicated.sum()} rows share {keys[valid][duplicated].nunique()} keys)")
+    diagnostics.update(kept=len(df), invalid=int((~valid).sum()))
+    return df, keys, labels, diagnostics
+
+
+def output_names(waves, columns, key):
+    """
+    Output name of every column of every wave: the wave's prefix on columns
+    that appear in more than one wave, unless the wave keeps them.
+
+    Returns:
+        list (one per wave) of {column: output name}, in column order
+    """
+    counts = {}
+    for cols in columns:
+        for col in cols:
+            if col != key:
+                counts[col] = counts.get(col, 0) + 1
+
+    names = []
+    seen = {key: None}
+    for wave, cols in zip(waves, columns):
+        renames = {}
+        for col in cols:
+            if col == key:
+                continue
+            out = col if counts[col] == 1 or col in wave.get('keep', []) else wave['prefix'] + col
+            if out in seen:
+                raise ValueError(f"{wave['name']}: output column {out!r} is already taken "
+                                 f"(by {seen[out] or 'the key'})")
+            seen[out] = wave['name']
+            renames[col] = out
+        names.append(renames)
+    return names
+
+
+def join_waves(frames, keys, spec):
+    """
+    Line every wave up with the base wave's rows through a hash index of
+    its keys.
+
+    Returns:
+        (parts, indicators, matches): per wave its columns (without the
+        key) in base row order, missing where unmatched; {indicator:
+        int8 array} and {wave name: match counts} for the non-base waves
+    """
+    import pandas as pd
+
+    key = spec['key']
+    base_keys = pd.Index(keys[0])
+    parts = [frames[0].drop(columns=[key])]
+    indicators = {}
+    matches = {}
+    for wave, df, wave_keys in zip(spec['waves'][1:], frames[1:], keys[1:]):
+        valid = wave_keys.notna().to_numpy()
+        index = pd.Index(wave_keys[valid])
+        positions = index.get_indexer(base_keys)
+        matched = positions >= 0
+
+        part = df[valid].drop(columns=[key]).set_axis(index)
+        parts.append(part.reindex(base_keys).reset_index(drop=True))
+        indicators[wave['indicator']] = matched.astype('int8')
+        matches[wave['name']] = {'both': int(matched.sum()), 'base only': int((~matched).sum()),
+                                 'wave only': int(len(index) - matched.sum())}
+    return parts, indicators, matches
+
+
+def build_output(spec, output, key_column, parts, indicators, labels):
+    """
+    One output's data: the key, its waves' columns named among those waves
+    only, their match indicators and the flags computable from them.
+
+    Returns:
+        (df, variable_labels, value_labels, prefixed columns)
+    """
+    import pandas as pd
+
+    chosen = [k for k, wave in enumerate(spec['waves']) if wave['name'] in output['waves']]
+    waves = [spec['waves'][k] for k in chosen]
+    names = output_names(waves, [list(parts[k].columns) for k in chosen], spec['key'])
+
+    variable_labels, value_labels = {}, {}
+    columns = [key_column]
+    prefixed = []
+    for k, wave, renames in zip(chosen, waves, names):
+        columns.append(parts[k].rename(columns=renames))
+        wave_variable_labels, wave_value_labels = labels[k]
+        for col, out in renames.items():
+            if col in wave_variable_labels:
+                variable_labels[out] = wave_variable_labels[col]
+            if col in wave_value_labels and pd.api.types.is_numeric_dtype(parts[k][col]):
+                value_labels[out] = wave_value_labels[col]
+            if out != col:
+                prefixed.append(out)
+        if 'indicator' in wave:
+            columns.append(pd.Series(indicators[wave['indicator']], name=wave['indicator']))
+            if wave.get('indicator_label'):
+                variable_labels[wave['indicator']] = wave['indicator_label']
+    if spec['key'] in labels[0][0]:
+        variable_labels[spec['key']] = labels[0][0][spec['key']]
+
+    df = pd.concat(columns, axis=1)
+    # Stata stores missing strings as ""
+    strings = [col for col in df.columns if df[col].dtype == object]
+    df[strings] = df[strings].fillna('')
+
+    for flag in spec.get('flags', []):
+        if all(col in df.columns for col in flag['all']):
+            df[flag['name']] = (df[flag['all']] == 1).all(axis=1).astype('int8')
+            if flag.get('label'):
+                variable_labels[flag['name']] = flag['label']
+    return df, variable_labels, value_labels, prefixed
+
+
+def print_summary(spec, diagnostics, matches):
+    """Wave sizes and match counts, as the do-files' logs report them."""
+    key = spec['key']
+    base = spec['waves'][0]['name']
+    print("\n=== WAVES ===")
+    for wave in spec['waves']:
+        d = diagnostics[wave['name']]
+        sample = f" with {wave['filter']}" if wave.get('filter') else ''
+        print(f"  {wave['name']:<12} {d['rows']:>8,} rows, {d['kept']:>8,}{sample}"
+              f" ({d['invalid']:,} without a valid {key})")
+
+    print("\n=== MERGE SUMMARY ===")
+    for name, counts in matches.items():
+        print(f"  {name}:")
+        for label, count in (('In both', counts['both']),
+                             (f"In {base} only (kept)", counts['base only']),
+                             (f"In {name} only (dropped)", counts['wave only'])):
+            print(f"    {label + ':':<28} {count:>8,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge the survey waves on the Prolific ID')
+    parser.add_argument(
+        '--spec',
+        type=Path,
+        default=None,
+        help=f'Merge spec (default: {DEFAULT_SPEC})'
+    )
+    parser.add_argument(
+        '--format',
+        dest='formats',
+        nargs='+',
+        choices=list(survey_io.OUTPUT_FORMATS),
+        default=['parquet'],
+        help='Output format(s): parquet (default), dta, feather, arrow; e.g. --format parquet dta'
+    )
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='List the waves and outputs of the spec and exit'
+    )
+    args = parser.parse_args()
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    spec_path = args.spec or proj_dir / DEFAULT_SPEC
+
+    try:
+        spec = load_spec(spec_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read spec {spec_path}: {e}")
+        sys.exit(1)
+
+    if args.list:
+        for wave in spec['waves']:
+            print(f"  {wave['name']:<12} {wave['prefix']:<10} {wave['data']}")
+        for output in spec['outputs']:
+            print(f"  -> {output['path']}: {' + '.join(output['waves'])}")
+        return
+
+    missing = [wave['data'] for wave in spec['waves'] if not (proj_dir / wave['data']).exists()]
+    if missing:
+        print(f"ERROR: data file not found: {', '.join(missing)}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    frames, keys, labels, diagnostics = [], [], [], {}
+    try:
+        for wave in spec['waves']:
+            df, variable_labels, value_labels = read_wave(proj_dir / wave['data'])
+            df, wave_keys, wave_labels, diagnostics[wave['name']] = prepare_wave(
+                df, (variable_labels, value_labels), wave, spec['key'])
+            frames.append(df)
+            keys.append(wave_keys)
+            labels.append(wave_labels)
+        print(f"Read {len(frames)} waves ({time.perf_counter() - start:.2f}s)")
+
+        parts, indicators, matches = join_waves(frames, keys, spec)
+        print_summary(spec, diagnostics, matches)
+
+        for output in spec['outputs']:
+            df, variable_labels, value_labels, prefixed = build_output(
+                spec, output, frames[0][spec['key']], parts, indicators, labels)
+            too_long = [col for col in df.columns if len(col) > STATA_NAME_MAX]
+            if 'dta' in args.formats and too_long:
+                raise ValueError(f"names longer than {STATA_NAME_MAX} characters for .dta: "
+                                 f"{', '.join(too_long)}")
+            print(f"\n{output['path']}: {' + '.join(output['waves'])}")
+            if prefixed:
+                print(f"  {len(prefixed)} conflicting columns prefixed: {', '.join(prefixed)}")
+            for flag in spec.get('flags', []):
+                if flag['name'] in df.columns:
+                    print(f"  {flag['name']}: {int(df[flag['name']].sum()):,}")
+            paths = survey_io.write_survey(df, proj_dir / output['path'], args.formats,
+                                           variable_labels, value_labels)
+            print(f"Saved: {', '.join(str(path) for path in paths)} ({len(df):,} x {df.shape[1]})")
+    except (ValueError, KeyError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    print(f"\nMerged in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Content-Hash Cache for Parsed Qualtrics Exports
+
+Stores the typed, classified DataFrame produced by parse_xml.process_survey
+as Parquet under derived/parse_cache/, keyed by a SHA-256 of the XML file
+bytes plus the parser version and options. When the export bytes have not
+changed, parse_xml can skip XML parsing entirely and only re-emit the .dta.
+
+The cache is bounded by total size: least-recently-used entries (by file
+mtime, refreshed on every hit) are evicted first, so old export versions age
+out as new ones arrive.
+
+Parquet support needs pyarrow; without it the cache is disabled and
+parse_xml falls back to parsing every time.
+
+Run stamps (<name>.run.json) record the size and mtime of an export and of
+the outputs written from it, so an invocation whose export and outputs are
+untouched can stop after a few stat calls, before pandas is even imported.
+
+Created by Dan + Claude Code
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+# Default size budget for the cache directory
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+CACHE_SUFFIX = '.parquet'
+
+
+def parquet_available():
+    """Return True if pandas can read/write Parquet (pyarrow installed)."""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(xml_path, parser_version, **options):
+    """
+    Cache key for an export: hash of the file bytes, parser version, and any
+    options that change the parsed result (e.g. infer_types).
+    """
+    digest = hashlib.sha256()
+    digest.update(file_digest(xml_path).encode())
+    digest.update(f"parser={parser_version}".encode())
+    for name in sorted(options):
+        digest.update(f";{name}={options[name]!r}".encode())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir, name, key):
+    """Path of the cache entry for output `name` (e.g. 'main_raw') and key."""
+    return Path(cache_dir) / f"{name}-{key[:20]}{CACHE_SUFFIX}"
+
+
+def load(cache_dir, name, key):
+    """
+    Return the cached DataFrame for (name, key), or None on a miss.
+
+    A hit refreshes the entry's mtime so eviction treats it as recently used.
+    """
+    path = cache_path(cache_dir, name, key)
+    if not path.exists():
+        return None
+    import pandas as pd
+
+    try:
+        df = pd.read_parquet(path)
+    except (OSError, ValueError):
+        # Truncated or unreadable entry: treat as a miss
+        return None
+    os.utime(path)
+    return df
+
+
+def store(cache_dir, name, key, df, max_bytes=DEFAULT_MAX_BYTES):
+    """Write df to the cache and evict old entries beyond max_bytes."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_path(cache_dir, name, key)
+
+    # Write to a temporary name first so readers never see a partial file
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    evict(cache_dir, max_bytes, keep=path)
+    return path
+
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES, keep=None):
+    """
+    Delete least-recently-used entries until the cache fits in max_bytes.
+
+    The entry `keep` (typically the one just written) is never evicted.
+
+    Returns:
+        list of evicted paths
+    """
+    entries = []
+    for path in Path(cache_dir).glob(f"*{CACHE_SUFFIX}"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if keep is not None and path == Path(keep):
+            continue
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted.append(path)
+
+    return evicted
+
+
+def stat_signature(path):
+    """[size, mtime_ns] of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def run_stamp_path(cache_dir, name):
+    """Path of the run stamp for output `name` (e.g. 'main_raw')."""
+    return Path(cache_dir) / f"{name}.run.json"
+
+
+def write_run_stamp(cache_dir, name, inputs, outputs):
+    """
+    Record a completed run: the inputs dict (export signature, versions and
+    options) and the signature of each output file it wrote.
+    """
+    stamp = {'inputs': inputs,
+             'outputs': {str(path): stat_signature(path) for path in outputs}}
+    path = run_stamp_path(cache_dir, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + f".tmp{os.getpid()}")
+    tmp_path.write_text(json.dumps(stamp))
+    os.replace(tmp_path, path)
+
+
+def run_is_current(cache_dir, name, inputs):
+    """
+    True if the last run had the same inputs and every output it wrote is
+    still on disk with the size and mtime it had then.
+    """
+    try:
+        stamp = json.loads(run_stamp_path(cache_dir, name).read_text())
+    except (OSError, ValueError):
+        return False
+    if stamp.get('inputs') != inputs or not stamp.get('outputs'):
+        return False
+    return all(stat_signature(path) == signature for path, signature in stamp['outputs'].items())
@@ -1,227 +1,998 @@
-#!/usr/bin/env python3
-"""
-Parse Qualtrics XML Export to Stata Dataset
-
-Usage: python parse_xml.py <survey_name> [xml_filename]
-
-Arguments:
-    survey_name: One of 'prescreen', 'main', 'followup'
-    xml_filename: Optional specific XML filename (without path)
-
-Examples:
-    python parse_xml.py prescreen
-    python parse_xml.py main
-    python parse_xml.py followup
-    python parse_xml.py prescreen vacc_se_prescreen_full_January+8,+2026_16.33.xml
-
-Parses Qualtrics XML export and saves as Stata dataset.
-- Preserves preview data (flagged with is_preview=1)
-- Drops only true metadata (placeholder PIDs like {{%PROLIFIC_PID%}})
-- Asserts no real data is lost
-
-Created by Dan + Claude Code
-"""
-
-import pandas as pd
-import xml.etree.ElementTree as ET
-from pathlib import Path
-import re
-import sys
-import argparse
-
-
-# Default XML filenames for each survey
-DEFAULT_XML_FILES = {
-    'prescreen': 'vacc_se_prescreen_full_January+8,+2026_16.33.xml',
-    'main': 'flu_survey_main_January+8,+2026_16.30.xml',
-    'followup': 'flu_vacc_se_followup_January+8,+2026_18.39.xml',
-}
-
-# Output filenames
-OUTPUT_FILES = {
-    'prescreen': 'prescreen_raw.dta',
-    'main': 'main_raw.dta',
-    'followup': 'followup_raw.dta',
-}
-
-
-def parse_qualtrics_xml(xml_path):
-    """Parse Qualtrics XML export into a DataFrame."""
-    print(f"Parsing XML file: {xml_path}")
-
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    # Collect all responses
-    responses = []
-    for response in root.findall('Response'):
-        row = {}
-        for child in response:
-            tag = child.tag
-            row[tag] = child.text if child.text else ''
-        responses.append(row)
-
-    df = pd.DataFrame(responses)
-    print(f"  Parsed {len(df)} responses with {len(df.columns)} columns")
-    return df
-
-
-def is_valid_prolific_id(pid):
-    """Check if a string looks like a valid Prolific ID (24-char hex string)."""
-    if pd.isna(pid) or pid == '':
-        return False
-    # Prolific IDs are 24-character hex strings
-    return bool(re.match(r'^[a-f0-9]{24}$', str(pid).strip()))
-
-
-def is_placeholder_pid(pid):
-    """Check if a PID is a Qualtrics placeholder like {{%PROLIFIC_PID%}}."""
-    if pd.isna(pid) or pid == '':
-        return False
-    return '{{%' in str(pid) or '%}}' in str(pid)
-
-
-def classify_rows(df):
-    """
-    Classify rows into: real data, preview data, and metadata (to drop).
-
-    Returns:
-        is_preview: Boolean series - True for preview responses (keep, but flag)
-        is_metadata: Boolean series - True for metadata to drop (placeholder PIDs)
-    """
-    # Check for preview distribution channel
-    is_preview_channel = df['distributionChannel'] == 'preview'
-
-    # Check for preview status
-    is_preview_status = df['status'] == 'Survey Preview'
-
-    # Check for placeholder PID (test entries with {{%PROLIFIC_PID%}})
-    has_placeholder_pid = df['PROLIFIC_PID'].apply(is_placeholder_pid)
-
-    # Preview rows: preview channel/status but NOT placeholder PIDs
-    # These are real preview runs that should be kept but flagged
-    is_preview = (is_preview_channel | is_preview_status) & ~has_placeholder_pid
-
-    # Metadata rows: placeholder PIDs (these are templates, not real responses)
-    is_metadata = has_placeholder_pid
-
-    return is_preview, is_metadata
-
-
-def main():
-    parser = argparse.ArgumentParser(
-        description='Parse Qualtrics XML export to Stata dataset'
-    )
-    parser.add_argument(
-        'survey',
-        choices=['prescreen', 'main', 'followup'],
-        help='Survey name: prescreen, main, or followup'
-    )
-    parser.add_argument(
-        'xml_file',
-        nargs='?',
-        default=None,
-        help='Optional: specific XML filename (in data directory)'
-    )
-
-    args = parser.parse_args()
-
-    # Set up paths
-    proj_dir = Path(__file__).parent.parent
-    data_dir = proj_dir / 'data'
-
-    # Get input/output files
-    xml_filename = args.xml_file or DEFAULT_XML_FILES[args.survey]
-    xml_file = data_dir / xml_filename
-    output_file = data_dir / OUTPUT_FILES[args.survey]
-
-    if not xml_file.exists():
-        print(f"ERROR: XML file not found: {xml_file}")
-        sys.exit(1)
-
-    # Parse XML
-    df = parse_qualtrics_xml(xml_file)
-
-    # Classify rows
-    print("\nClassifying rows...")
-    is_preview, is_metadata = classify_rows(df)
-
-    n_preview = is_preview.sum()
-    n_metadata = is_metadata.sum()
-    n_real = len(df) - n_preview - n_metadata
-
-    print(f"  Real data rows: {n_real}")
-    print(f"  Preview rows (kept, flagged): {n_preview}")
-    print(f"  Metadata rows (dropped): {n_metadata}")
-
-    # Safety check: Ensure metadata rows don't have valid Prolific IDs
-    metadata_rows = df[is_metadata]
-    valid_pids_in_metadata = metadata_rows['PROLIFIC_PID'].apply(is_valid_prolific_id).sum()
-
-    print(f"\n=== SAFETY CHECKS ===")
-    print(f"Rows to be dropped (metadata): {n_metadata}")
-    print(f"Valid Prolific IDs in metadata rows: {valid_pids_in_metadata}")
-
-    if valid_pids_in_metadata > 0:
-        print("\nERROR: Found valid Prolific IDs in rows marked as metadata!")
-        print("These rows would be incorrectly dropped:")
-        print(metadata_rows[metadata_rows['PROLIFIC_PID'].apply(is_valid_prolific_id)][
-            ['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']
-        ])
-        sys.exit(1)
-
-    # Assert safety
-    assert valid_pids_in_metadata == 0, \
-        "Found valid Prolific IDs in metadata rows - would lose real data!"
-
-    # Show what we're dropping
-    if n_metadata > 0:
-        print("\nMetadata rows being dropped:")
-        print(metadata_rows[['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']])
-
-    # Drop only metadata rows (keep preview rows)
-    df_clean = df[~is_metadata].copy()
-    print(f"\nAfter dropping metadata: {len(df_clean)} rows")
-
-    # Add is_preview flag
-    is_preview_clean = is_preview[~is_metadata]
-    df_clean['is_preview'] = is_preview_clean.astype(int)
-    print(f"Preview rows flagged: {df_clean['is_preview'].sum()}")
-
-    # Report on remaining rows without valid Prolific IDs (should only be previews)
-    has_valid_pid = df_clean['PROLIFIC_PID'].apply(is_valid_prolific_id)
-    invalid_pids_remaining = (~has_valid_pid).sum()
-    invalid_non_preview = (~has_valid_pid & (df_clean['is_preview'] == 0)).sum()
-
-    print(f"Rows with invalid Prolific ID: {invalid_pids_remaining}")
-    print(f"  Of which are preview: {df_clean['is_preview'].sum()}")
-    print(f"  Of which are NOT preview: {invalid_non_preview}")
-
-    if invalid_non_preview > 0:
-        print("\nWARNING: Non-preview rows with invalid Prolific IDs:")
-        print(df_clean[(~has_valid_pid) & (df_clean['is_preview'] == 0)][
-            ['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']
-        ].head(10))
-
-    # Rename _recordId to response_id
-    df_clean.columns = [col.replace('_recordId', 'response_id') for col in df_clean.columns]
-
-    # Convert appropriate columns to numeric where possible
-    print("\nConverting column types...")
-    for col in ['progress', 'duration']:
-        if col in df_clean.columns:
-            df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
-
-    # Save to Stata format
-    print(f"\nSaving to Stata format: {output_file}")
-    df_clean.to_stata(output_file, write_index=False, version=118)
-
-    print(f"\n=== COMPLETE ===")
-    print(f"Saved {len(df_clean)} observations with {len(df_clean.columns)} variables")
-    print(f"  Preview rows: {df_clean['is_preview'].sum()}")
-    print(f"  Real data rows: {(df_clean['is_preview'] == 0).sum()}")
-    print(f"Output: {output_file}")
-
-
-if __name__ == '__main__':
-    main()
+#!/usr/bin/env python3
+"""
+Parse Qualtrics XML Export to Stata Dataset
+
+Usage: python parse_xml.py <survey_name> [xml_filename]
+
+Arguments:
+    survey_name: One of 'prescreen', 'main', 'followup', or 'all'
+    xml_filename: Optional specific XML filename (without path)
+
+Examples:
+    python parse_xml.py prescreen
+    python parse_xml.py main
+    python parse_xml.py followup
+    python parse_xml.py prescreen vacc_se_prescreen_full_January+8,+2026_16.33.xml
+    python parse_xml.py main --stream     # iterparse, flat memory on large exports
+    python parse_xml.py all               # all three surveys in parallel
+    python parse_xml.py main --no-cache   # ignore derived/parse_cache
+    python parse_xml.py main --incremental  # append only new responses
+    python parse_xml.py main --format dta arrow  # also write main_raw.arrow
+    python parse_xml.py main --parse-jobs 8      # parse one huge export in parallel
+    python parse_xml.py main --profile    # write data/main_raw.profile.json
+    python parse_xml.py main --force      # re-parse even if nothing changed
+
+Parses Qualtrics XML export and saves as Stata dataset (and optionally
+Parquet/Feather/Arrow for Python consumers; see survey_io.py).
+- Preserves preview data (flagged with is_preview=1)
+- Drops only true metadata (placeholder PIDs like {{%PROLIFIC_PID%}})
+- Asserts no real data is lost
+- Caches the parsed data by XML content hash (derived/parse_cache/), so an
+  unchanged export only re-emits the .dta
+- Exits after a few stat calls when neither the export nor the outputs have
+  changed since the last run (run stamp in derived/parse_cache/)
+
+numpy, pandas, ElementTree and the process pool are imported inside the
+functions that use them, so --help and the up-to-date path never load them.
+
+Created by Dan + Claude Code
+"""
+
+from contextlib import redirect_stdout
+from pathlib import Path
+import io
+import mmap
+import os
+import re
+import sys
+import argparse
+
+import parse_cache
+import survey_io
+from profiling import StageProfiler
+
+
+# Bump when parsing, typing or classification changes (invalidates the parse cache)
+PARSER_VERSION = 1
+
+# Default XML filenames for each survey
+DEFAULT_XML_FILES = {
+    'prescreen': 'vacc_se_prescreen_full_January+8,+2026_16.33.xml',
+    'main': 'flu_survey_main_January+8,+2026_16.30.xml',
+    'followup': 'flu_vacc_se_followup_January+8,+2026_18.39.xml',
+}
+
+# Output filenames
+OUTPUT_FILES = {
+    'prescreen': 'prescreen_raw.dta',
+    'main': 'main_raw.dta',
+    'followup': 'followup_raw.dta',
+}
+
+# Qualtrics timestamp fields (matched case-insensitively) and their format
+DATETIME_COLUMNS = {'startdate', 'enddate', 'recordeddate'}
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Identifier fields that must stay strings even if they look numeric
+STRING_COLUMNS = {'_recordId', 'PROLIFIC_PID', 'ResponseId', 'responseId'}
+
+# Bytes fed to the XML parser per step when reading a memory-mapped export
+MMAP_CHUNK_SIZE = 16 * 1024
+
+# Text columns with at most this many distinct values (and no more than this
+# share of distinct values per row) are stored as categoricals
+CATEGORY_MAX_LEVELS = 50
+CATEGORY_MAX_RATIO = 0.5
+
+
+def parse_qualtrics_xml(xml_path, stream=False, infer_types=True, skip_ids=None,
+                        use_mmap=False, jobs=1, profiler=None):
+    """Parse Qualtrics XML export into a DataFrame.
+
+    With stream=True the file is read incrementally with iterparse and each
+    <Response> element is cleared once consumed, so peak memory stays roughly
+    flat regardless of the number of responses.
+
+    With use_mmap=True the file is memory-mapped and fed to the XML parser in
+    chunks instead of going through Python file I/O (implies streaming).
+    With jobs > 1 the <Response> boundaries are located up front and byte
+    ranges of the file are parsed in a process pool, then concatenated in
+    file order (implies use_mmap).
+
+    With infer_types=True (default) each column is given a numeric, datetime,
+    small-integer or categorical dtype where its values allow; otherwise every
+    field is left as a string column.
+
+    skip_ids is an optional set of _recordId values to leave out; responses
+    with those IDs are never materialized (implies stream=True).
+
+    profiler is an optional profiling.StageProfiler. The streaming engines
+    parse and build columns in one pass, recorded as a single
+    'xml_parse+build_columns' stage.
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    print(f"Parsing XML file: {xml_path}")
+
+    if jobs > 1:
+        with profiler.stage('xml_parse+build_columns') as record:
+            columns, n_rows, n_skipped = _parallel_columns(xml_path, jobs, skip_ids=skip_ids)
+            record['rows'] = n_rows
+        mode = f' ({jobs} parallel byte ranges)'
+    elif use_mmap:
+        with profiler.stage('xml_parse+build_columns') as record:
+            events = _mmap_events(xml_path)
+            columns, n_rows, n_skipped = _stream_columns(xml_path, skip_ids=skip_ids, events=events)
+            record['rows'] = n_rows
+        mode = ' (streaming, mmap)'
+    elif stream or skip_ids:
+        with profiler.stage('xml_parse+build_columns') as record:
+            columns, n_rows, n_skipped = _stream_columns(xml_path, skip_ids=skip_ids)
+            record['rows'] = n_rows
+        mode = ' (streaming)'
+    else:
+        columns, n_rows = _tree_columns(xml_path, profiler=profiler)
+        n_skipped = 0
+        mode = ''
+
+    df = build_dataframe(columns, n_rows, infer_types=infer_types, profiler=profiler)
+    print(f"  Parsed {len(df)} responses with {len(df.columns)} columns{mode}")
+    if skip_ids:
+        print(f"  Skipped {n_skipped} already-known responses")
+    return df
+
+
+def _append_row(columns, row, n_rows):
+    """
+    Append one response (dict of field -> text) to the columnar buffers.
+
+    Fields seen for the first time are back-filled with None for the
+    n_rows earlier responses; fields absent from this response are padded
+    with None, matching the NaN pandas would give a missing key.
+    """
+    for tag, value in row.items():
+        buffer = columns.get(tag)
+        if buffer is None:
+            buffer = columns[tag] = [None] * n_rows
+        buffer.append(value)
+
+    for buffer in columns.values():
+        if len(buffer) == n_rows:
+            buffer.append(None)
+
+
+def _tree_columns(xml_path, profiler=None):
+    """Parse the whole export with ET.parse into columnar buffers."""
+    import xml.etree.ElementTree as ET
+
+    profiler = profiler or StageProfiler(enabled=False)
+
+    with profiler.stage('xml_parse'):
+        tree = ET.parse(xml_path)
+        root = tree.getroot()
+
+    columns = {}
+    n_rows = 0
+    with profiler.stage('build_columns') as record:
+        for response in root.findall('Response'):
+            # Later duplicates of a tag overwrite earlier ones
+            row = {child.tag: (child.text if child.text else '') for child in response}
+            _append_row(columns, row, n_rows)
+            n_rows += 1
+        record['rows'] = n_rows
+
+    return columns, n_rows
+
+
+def _stream_columns(xml_path, skip_ids=None, events=None):
+    """
+    Stream <Response> elements into columnar buffers.
+
+    Responses whose _recordId is in skip_ids are cleared without being
+    added to the buffers. events is an optional ('start'/'end', element)
+    iterator to consume instead of iterparse on xml_path (e.g. _mmap_events).
+
+    Returns:
+        columns: dict mapping field name -> list of values (one per response),
+                 in order of first appearance
+        n_rows: number of responses read
+        n_skipped: number of responses skipped via skip_ids
+    """
+    import xml.etree.ElementTree as ET
+
+    columns = {}
+    n_rows = 0
+    n_skipped = 0
+
+    context = events if events is not None else ET.iterparse(xml_path, events=('start', 'end'))
+    try:
+        _, root = next(context)
+    except StopIteration:
+        return columns, n_rows, n_skipped
+
+    for event, elem in context:
+        if event != 'end' or elem.tag != 'Response':
+            continue
+
+        if skip_ids and elem.findtext('_recordId') in skip_ids:
+            n_skipped += 1
+            elem.clear()
+            root.clear()
+            continue
+
+        # Later duplicates of a tag overwrite earlier ones, as in the tree parser
+        row = {child.tag: (child.text if child.text else '') for child in elem}
+        _append_row(columns, row, n_rows)
+        n_rows += 1
+
+        # Free the consumed response and drop it from the root
+        elem.clear()
+        root.clear()
+
+    return columns, n_rows, n_skipped
+
+
+def _mmap_events(xml_path, start=None, end=None, chunk_size=MMAP_CHUNK_SIZE):
+    """
+    Yield ('start'/'end', element) events for a memory-mapped export.
+
+    The mapped bytes are fed to an XMLPullParser chunk_size bytes at a time.
+    If a byte range [start, end) of <Response> elements is given, only that
+    range is parsed, wrapped in the file's own header (XML declaration and
+    root open tag) and trailer so it forms a well-formed document.
+    """
+    import xml.etree.ElementTree as ET
+
+    with open(xml_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            parser = ET.XMLPullParser(events=('start', 'end'))
+
+            if start is None:
+                pieces = [(0, len(mm))]
+            else:
+                first, last = _response_span(mm)
+                pieces = [(0, first), (start, end), (last, len(mm))]
+
+            for piece_start, piece_end in pieces:
+                for pos in range(piece_start, piece_end, chunk_size):
+                    parser.feed(mm[pos:min(pos + chunk_size, piece_end)])
+                    yield from parser.read_events()
+
+            parser.close()
+            yield from parser.read_events()
+
+
+def _response_span(mm):
+    """Byte offsets (start of first <Response>, end of last </Response>) in a mapped export."""
+    first = mm.find(b'<Response>')
+    if first == -1:
+        return len(mm), len(mm)
+    last = mm.rfind(b'</Response>') + len(b'</Response>')
+    return first, last
+
+
+def find_response_ranges(xml_path, n_parts):
+    """
+    Split an export into up to n_parts byte ranges on <Response> boundaries.
+
+    Boundaries are found by jumping to evenly spaced offsets in the mapped
+    file and searching forward for the next '<Response>' tag, so only a few
+    bytes around each split point are scanned. (Markup inside field text is
+    escaped, so the literal tag only occurs at real element starts.)
+
+    Returns:
+        list of (start, end) byte offsets, in file order
+    """
+    with open(xml_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            first, last = _response_span(mm)
+            if first >= last:
+                return []
+
+            bounds = [first]
+            for k in range(1, n_parts):
+                target = first + (last - first) * k // n_parts
+                pos = mm.find(b'<Response>', max(target, bounds[-1] + 1), last)
+                if pos != -1:
+                    bounds.append(pos)
+            bounds.append(last)
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _parse_range_worker(xml_path, start, end, skip_ids):
+    """Process-pool entry point: parse one byte range into columnar buffers."""
+    events = _mmap_events(xml_path, start, end)
+    return _stream_columns(xml_path, skip_ids=skip_ids, events=events)
+
+
+def _parallel_columns(xml_path, jobs, skip_ids=None):
+    """
+    Parse byte ranges of one export in a process pool and concatenate the
+    per-range buffers in file order.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    ranges = find_response_ranges(xml_path, jobs)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_parse_range_worker, xml_path, start, end, skip_ids)
+                   for start, end in ranges]
+        parts = [future.result() for future in futures]
+
+    columns = {}
+    n_rows = 0
+    n_skipped = 0
+    for part_columns, part_rows, part_skipped in parts:
+        for tag, values in part_columns.items():
+            buffer = columns.get(tag)
+            if buffer is None:
+                buffer = columns[tag] = [None] * n_rows
+            buffer.extend(values)
+        n_rows += part_rows
+        n_skipped += part_skipped
+        for buffer in columns.values():
+            if len(buffer) < n_rows:
+                buffer.extend([None] * (n_rows - len(buffer)))
+
+    return columns, n_rows, n_skipped
+
+
+def infer_column(name, values):
+    """
+    Convert one column of raw field text to the narrowest sensible dtype.
+
+    Empty strings and None count as missing. Tries, in order:
+      - datetime for StartDate/EndDate/RecordedDate
+      - integer (smallest of int8/int16/int32/int64; nullable if missing)
+      - float64
+      - categorical for low-cardinality text
+    and falls back to a string column. Identifier columns and numbers with
+    leading zeros (e.g. ZIP codes) are kept as strings; a column with no
+    values at all becomes float64 NaN (as Stata imports an empty column).
+    """
+    import numpy as np
+    import pandas as pd
+
+    raw = pd.Series(values, dtype=object)
+    missing = raw.isna() | (raw == '')
+    present = raw[~missing]
+    n_present = len(present)
+
+    if name in STRING_COLUMNS:
+        return values
+    if n_present == 0:
+        return np.full(len(raw), np.nan)
+
+    if name.lower() in DATETIME_COLUMNS:
+        parsed = pd.to_datetime(raw.where(~missing), format=DATETIME_FORMAT, errors='coerce')
+        if parsed.notna().sum() == n_present:
+            return parsed.array
+
+    text = present.astype(str)
+    has_leading_zero = text.str.match(r'^-?0\d').any()
+    numeric = pd.to_numeric(raw.where(~missing), errors='coerce')
+    if not has_leading_zero and numeric.notna().sum() == n_present:
+        valid = numeric[~missing]
+        if (valid == valid.round()).all():
+            for dtype in ('int8', 'int16', 'int32', 'int64'):
+                info = np.iinfo(dtype)
+                if valid.min() >= info.min and valid.max() <= info.max:
+                    break
+            if missing.any():
+                return pd.array(numeric, dtype=dtype.capitalize())
+            return numeric.astype(dtype).array
+        return numeric.astype('float64').array
+
+    n_levels = text.nunique()
+    if n_levels <= CATEGORY_MAX_LEVELS and n_levels <= CATEGORY_MAX_RATIO * len(raw):
+        return pd.Categorical(raw.where(raw.notna(), None))
+
+    return values
+
+
+def build_dataframe(columns, n_rows, infer_types=True, profiler=None):
+    """Build the DataFrame from columnar buffers in one step."""
+    import pandas as pd
+
+    profiler = profiler or StageProfiler(enabled=False)
+    if infer_types:
+        with profiler.stage('type_conversion', rows=n_rows):
+            columns = {name: infer_column(name, values) for name, values in columns.items()}
+    with profiler.stage('dataframe', rows=n_rows):
+        return pd.DataFrame(columns, index=pd.RangeIndex(n_rows))
+
+
+# Prolific IDs are 24-character lowercase hex strings
+PROLIFIC_ID_PATTERN = r'[a-f0-9]{24}'
+
+
+def is_valid_prolific_id(pid):
+    """Check if a string looks like a valid Prolific ID (24-char hex string)."""
+    import pandas as pd
+
+    if pd.isna(pid) or pid == '':
+        return False
+    # Prolific IDs are 24-character hex strings
+    return bool(re.match(rf'^{PROLIFIC_ID_PATTERN}$', str(pid).strip()))
+
+
+def is_placeholder_pid(pid):
+    """Check if a PID is a Qualtrics placeholder like {{%PROLIFIC_PID%}}."""
+    import pandas as pd
+
+    if pd.isna(pid) or pid == '':
+        return False
+    return '{{%' in str(pid) or '%}}' in str(pid)
+
+
+def valid_prolific_id_mask(pids):
+    """Vectorized is_valid_prolific_id over a Series of PIDs."""
+    pids = pids.astype('string').str.strip()
+    return pids.str.fullmatch(PROLIFIC_ID_PATTERN).fillna(False).astype(bool)
+
+
+def placeholder_pid_mask(pids):
+    """Vectorized is_placeholder_pid over a Series of PIDs."""
+    pids = pids.astype('string')
+    has_placeholder = (pids.str.contains('{{%', regex=False)
+                       | pids.str.contains('%}}', regex=False))
+    return has_placeholder.fillna(False).astype(bool)
+
+
+def classify_rows(df):
+    """
+    Classify rows into: real data, preview data, and metadata (to drop).
+
+    All checks are vectorized and computed once so the safety checks and
+    reports in main() can reuse them.
+
+    Returns:
+        is_preview: Boolean series - True for preview responses (keep, but flag)
+        is_metadata: Boolean series - True for metadata to drop (placeholder PIDs)
+        has_valid_pid: Boolean series - True where PROLIFIC_PID is a valid Prolific ID
+    """
+    # Check for preview distribution channel
+    is_preview_channel = (df['distributionChannel'] == 'preview').fillna(False)
+
+    # Check for preview status
+    is_preview_status = (df['status'] == 'Survey Preview').fillna(False)
+
+    # Check for placeholder PID (test entries with {{%PROLIFIC_PID%}})
+    has_placeholder_pid = placeholder_pid_mask(df['PROLIFIC_PID'])
+
+    # Preview rows: preview channel/status but NOT placeholder PIDs
+    # These are real preview runs that should be kept but flagged
+    is_preview = (is_preview_channel | is_preview_status) & ~has_placeholder_pid
+
+    # Metadata rows: placeholder PIDs (these are templates, not real responses)
+    is_metadata = has_placeholder_pid
+
+    has_valid_pid = valid_prolific_id_mask(df['PROLIFIC_PID'])
+
+    return is_preview, is_metadata, has_valid_pid
+
+
+class SafetyCheckError(Exception):
+    """Raised when parsing would drop rows that carry real Prolific IDs."""
+
+
+def run_inputs(xml_file, formats=('dta',), infer_types=True):
+    """
+    Run-stamp inputs for an export: its path, size and mtime, the parser
+    version and the options that change the written outputs.
+    """
+    return {
+        'parser_version': PARSER_VERSION,
+        'xml': str(Path(xml_file).resolve()),
+        'xml_stat': parse_cache.stat_signature(xml_file),
+        'infer_types': infer_types,
+        'formats': sorted(formats),
+    }
+
+
+def outputs_up_to_date(xml_file, output_file, cache_dir, formats=('dta',), infer_types=True):
+    """
+    True if the export and every output written from it are unchanged (by
+    size and mtime) since the last successful run with the same options.
+    Always False without a cache directory.
+    """
+    if cache_dir is None:
+        return False
+    return parse_cache.run_is_current(cache_dir, Path(output_file).stem,
+                                      run_inputs(xml_file, formats, infer_types))
+
+
+def process_survey(xml_file, output_file, stream=False, infer_types=True,
+                   cache_dir=None, cache_max_bytes=parse_cache.DEFAULT_MAX_BYTES,
+                   incremental=False, formats=('dta',), use_mmap=False, parse_jobs=1,
+                   profile=False, force=False):
+    """
+    Parse one Qualtrics export, classify and check its rows, and save it.
+
+    stream, infer_types, use_mmap and parse_jobs (-> jobs) select how the XML
+    is read; see parse_qualtrics_xml.
+
+    If cache_dir is given, the parsed and classified DataFrame is cached
+    there keyed by the XML content hash; on a hit XML parsing and
+    classification are skipped and only the output file is re-written.
+
+    With incremental=True and an existing output file, only responses not
+    already in the output are parsed and classified, then appended (see
+    append_new_responses). The cache is not used in that mode.
+
+    formats lists the output formats to write (see survey_io.OUTPUT_FORMATS);
+    output_file names the .dta and the others share its stem.
+
+    With profile=True each stage's wall time, peak RSS and rows/sec are
+    written as JSON next to the output (<stem>.profile.json).
+
+    With cache_dir, a run stamp is written after each successful run; the
+    next run returns immediately if the export and outputs are unchanged
+    (see outputs_up_to_date), unless force or profile is set.
+
+    Prints a progress log to stdout. Raises SafetyCheckError if metadata rows
+    carry valid Prolific IDs (i.e. real data would be dropped).
+
+    Returns:
+        df_clean: the saved DataFrame, or None if the outputs were up to date
+    """
+    output_file = Path(output_file)
+    if not force and not profile and outputs_up_to_date(xml_file, output_file, cache_dir,
+                                                        formats, infer_types):
+        print(f"{xml_file} and its outputs are unchanged since the last run; nothing to do "
+              f"(use --force to re-parse)")
+        return None
+
+    profiler = StageProfiler(enabled=profile)
+    try:
+        df_clean = _process_survey(xml_file, output_file, cache_dir, cache_max_bytes, incremental,
+                                   formats, profiler, stream=stream, infer_types=infer_types,
+                                   use_mmap=use_mmap, jobs=parse_jobs)
+        if cache_dir is not None:
+            parse_cache.write_run_stamp(cache_dir, output_file.stem,
+                                        run_inputs(xml_file, formats, infer_types),
+                                        [survey_io.output_path(output_file, fmt) for fmt in formats])
+        return df_clean
+    finally:
+        if profile:
+            report_path = output_file.with_suffix('.profile.json')
+            profiler.write_json(report_path, xml_file=str(xml_file),
+                                xml_bytes=Path(xml_file).stat().st_size,
+                                output_file=str(output_file), formats=list(formats))
+            print(f"\n=== PROFILE ===\n{profiler.summary()}")
+            print(f"Profile report: {report_path}")
+
+
+def _process_survey(xml_file, output_file, cache_dir, cache_max_bytes, incremental, formats,
+                    profiler, **parse_options):
+    """Body of process_survey, with the profiler threaded through."""
+    key = None
+
+    if incremental:
+        df_prev, prev_path = survey_io.read_existing_output(output_file, formats=formats)
+        if df_prev is not None:
+            return append_new_responses(xml_file, output_file, df_prev, prev_path,
+                                        formats=formats, profiler=profiler, **parse_options)
+        print(f"No previous output for {output_file}; parsing the full export")
+
+    if cache_dir is not None:
+        if parse_cache.parquet_available():
+            with profiler.stage('cache_lookup'):
+                key = parse_cache.cache_key(xml_file, PARSER_VERSION,
+                                            infer_types=parse_options['infer_types'])
+                df_clean = parse_cache.load(cache_dir, output_file.stem, key)
+            if df_clean is not None:
+                print(f"Cache hit for {xml_file} (key {key[:12]}): skipping XML parsing")
+                save_survey(df_clean, output_file, formats, profiler=profiler)
+                return df_clean
+            print(f"Cache miss for {xml_file} (key {key[:12]})")
+        else:
+            print("Parse cache disabled: pyarrow is not installed")
+
+    df_clean = parse_and_classify(xml_file, profiler=profiler, **parse_options)
+
+    if key is not None:
+        with profiler.stage('cache_store', rows=len(df_clean)):
+            path = parse_cache.store(cache_dir, output_file.stem, key, df_clean,
+                                     max_bytes=cache_max_bytes)
+        print(f"Cached parsed data: {path}")
+
+    save_survey(df_clean, output_file, formats, profiler=profiler)
+    return df_clean
+
+
+def append_new_responses(xml_file, output_file, df_prev, prev_path, formats=('dta',),
+                         profiler=None, **parse_options):
+    """
+    Incrementally refresh the output from a newer (superset) export.
+
+    df_prev is the previously written output (read from prev_path). Streams
+    the export skipping every response whose _recordId is already saved,
+    classifies and checks only the new responses, and appends them. Parsing
+    and classification cost scales with the number of new responses; the
+    output files themselves are re-written. parse_options are passed to
+    parse_qualtrics_xml.
+
+    Returns:
+        df_clean: the combined DataFrame (unchanged previous data if nothing new)
+    """
+    import pandas as pd
+
+    print(f"Loaded previous output: {prev_path}")
+    known_ids = set(df_prev['response_id'].dropna())
+    print(f"  {len(df_prev)} responses already saved")
+
+    df_new = parse_and_classify(xml_file, skip_ids=known_ids, profiler=profiler, **parse_options)
+    if len(df_new) == 0:
+        print(f"\nNo new responses; {prev_path} left unchanged")
+        return df_prev
+
+    df_new, reinfer = align_new_rows(df_new, df_prev)
+    df_clean = pd.concat([df_prev, df_new], ignore_index=True)
+    for col in reinfer:
+        df_clean[col] = infer_column(col, [None if pd.isna(value) else str(value)
+                                           for value in df_clean[col]])
+    if reinfer:
+        print(f"  Re-inferred types over all rows: {', '.join(reinfer)}")
+    print(f"\nAppended {len(df_new)} new responses ({len(df_clean)} total)")
+
+    save_survey(df_clean, output_file, formats, profiler=profiler)
+    return df_clean
+
+
+def align_new_rows(df_new, df_prev):
+    """
+    Cast the new rows' columns to the previous output's dtypes, so the
+    combined columns keep one type (a numeric column whose new part is
+    all missing, or a categorical with the same levels).
+
+    Returns:
+        (df_new, columns whose types disagree and must be re-inferred over
+        the combined rows: the cast failed or would lose values)
+    """
+    df_new = df_new.copy()
+    reinfer = []
+    for col in df_new.columns.intersection(df_prev.columns):
+        dtype = df_prev[col].dtype
+        if df_new[col].dtype == dtype:
+            continue
+        new = df_new[col]
+        try:
+            cast = new.astype(dtype)
+        except (TypeError, ValueError, OverflowError):
+            reinfer.append(col)
+            continue
+        # Unknown categories become NaN and narrow integers wrap around
+        present = new.notna()
+        same = bool((cast.notna() == present).all())
+        if same and present.any():
+            same = bool((cast[present].astype(object) == new[present].astype(object)).all())
+        if same:
+            df_new[col] = cast
+        else:
+            reinfer.append(col)
+    return df_new, reinfer
+
+
+def parse_and_classify(xml_file, skip_ids=None, profiler=None, **parse_options):
+    """
+    Parse an export, drop metadata rows and flag previews.
+
+    skip_ids (known responses to leave out), profiler and parse_options
+    (stream, infer_types, use_mmap, jobs) are passed to parse_qualtrics_xml.
+    Raises SafetyCheckError if metadata rows carry valid Prolific IDs.
+
+    Returns:
+        df_clean: typed DataFrame with is_preview and response_id
+    """
+    import pandas as pd
+
+    profiler = profiler or StageProfiler(enabled=False)
+
+    # Parse XML
+    df = parse_qualtrics_xml(xml_file, skip_ids=skip_ids, profiler=profiler, **parse_options)
+    if len(df) == 0:
+        return df
+
+    # Classify rows
+    print("\nClassifying rows...")
+    with profiler.stage('classification', rows=len(df)):
+        is_preview, is_metadata, has_valid_pid = classify_rows(df)
+
+    n_preview = is_preview.sum()
+    n_metadata = is_metadata.sum()
+    n_real = len(df) - n_preview - n_metadata
+
+    print(f"  Real data rows: {n_real}")
+    print(f"  Preview rows (kept, flagged): {n_preview}")
+    print(f"  Metadata rows (dropped): {n_metadata}")
+
+    # Safety check: Ensure metadata rows don't have valid Prolific IDs
+    with profiler.stage('safety_checks', rows=len(df)):
+        metadata_rows = df[is_metadata]
+        valid_pids_in_metadata = (is_metadata & has_valid_pid).sum()
+
+    print(f"\n=== SAFETY CHECKS ===")
+    print(f"Rows to be dropped (metadata): {n_metadata}")
+    print(f"Valid Prolific IDs in metadata rows: {valid_pids_in_metadata}")
+
+    if valid_pids_in_metadata > 0:
+        print("\nERROR: Found valid Prolific IDs in rows marked as metadata!")
+        print("These rows would be incorrectly dropped:")
+        print(df[is_metadata & has_valid_pid][
+            ['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']
+        ])
+        raise SafetyCheckError(
+            f"{valid_pids_in_metadata} metadata rows in {xml_file} have valid Prolific IDs"
+        )
+
+    # Show what we're dropping
+    if n_metadata > 0:
+        print("\nMetadata rows being dropped:")
+        print(metadata_rows[['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']])
+
+    # Drop only metadata rows (keep preview rows)
+    df_clean = df[~is_metadata].copy()
+    print(f"\nAfter dropping metadata: {len(df_clean)} rows")
+
+    # Add is_preview flag
+    is_preview_clean = is_preview[~is_metadata]
+    df_clean['is_preview'] = is_preview_clean.astype(int)
+    print(f"Preview rows flagged: {df_clean['is_preview'].sum()}")
+
+    # Report on remaining rows without valid Prolific IDs (should only be previews)
+    has_valid_pid = has_valid_pid[~is_metadata]
+    invalid_pids_remaining = (~has_valid_pid).sum()
+    invalid_non_preview = (~has_valid_pid & (df_clean['is_preview'] == 0)).sum()
+
+    print(f"Rows with invalid Prolific ID: {invalid_pids_remaining}")
+    print(f"  Of which are preview: {df_clean['is_preview'].sum()}")
+    print(f"  Of which are NOT preview: {invalid_non_preview}")
+
+    if invalid_non_preview > 0:
+        print("\nWARNING: Non-preview rows with invalid Prolific IDs:")
+        print(df_clean[(~has_valid_pid) & (df_clean['is_preview'] == 0)][
+            ['_recordId', 'PROLIFIC_PID', 'distributionChannel', 'status']
+        ].head(10))
+
+    # Rename _recordId to response_id
+    df_clean.columns = [col.replace('_recordId', 'response_id') for col in df_clean.columns]
+
+    # Convert appropriate columns to numeric where possible
+    # (already typed by schema inference unless --no-infer-types)
+    print("\nConverting column types...")
+    with profiler.stage('numeric_conversion', rows=len(df_clean)):
+        for col in ['progress', 'duration']:
+            if col in df_clean.columns and not pd.api.types.is_numeric_dtype(df_clean[col]):
+                df_clean[col] = pd.to_numeric(df_clean[col], errors='coerce')
+
+    return df_clean
+
+
+def save_survey(df_clean, output_file, formats=('dta',), profiler=None):
+    """
+    Save the parsed survey in each requested format and print a summary.
+
+    output_file names the .dta; other formats are written alongside it with
+    their own suffix (see survey_io.OUTPUT_FORMATS).
+    """
+    profiler = profiler or StageProfiler(enabled=False)
+    paths = []
+    for fmt in formats:
+        print(f"\nSaving to {fmt} format: {survey_io.output_path(output_file, fmt)}")
+        with profiler.stage(f'write_{fmt}', rows=len(df_clean)):
+            paths.extend(survey_io.write_survey(df_clean, output_file, [fmt]))
+
+    print(f"\n=== COMPLETE ===")
+    print(f"Saved {len(df_clean)} observations with {len(df_clean.columns)} variables")
+    print(f"  Preview rows: {df_clean['is_preview'].sum()}")
+    print(f"  Real data rows: {(df_clean['is_preview'] == 0).sum()}")
+    for path in paths:
+        print(f"Output: {path}")
+
+
+def _parse_survey_worker(survey, xml_file, output_file, options):
+    """
+    Process-pool entry point: run process_survey with its log captured.
+
+    Returns:
+        (survey, ok, log) where ok is False if the survey failed its safety
+        checks or raised, and log is everything it printed.
+    """
+    log = io.StringIO()
+    ok = True
+    with redirect_stdout(log):
+        try:
+            process_survey(xml_file, output_file, **options)
+        except SafetyCheckError as e:
+            ok = False
+            print(f"\nFAILED safety checks: {e}")
+        except Exception:
+            import traceback
+            ok = False
+            print(f"\nFAILED with exception:\n{traceback.format_exc()}")
+    return survey, ok, log.getvalue()
+
+
+def parse_all_surveys(data_dir, surveys=None, max_workers=None, **options):
+    """
+    Parse several surveys in a process pool, one worker per survey.
+
+    Keyword options (stream, infer_types, cache_dir, ...) are passed through
+    to process_survey.
+
+    Each worker's log is captured and printed as one contiguous block per
+    survey (in the order given), so logs from concurrent workers do not
+    interleave. Surveys whose outputs are up to date are reported without
+    starting a worker.
+
+    Returns:
+        dict mapping survey name -> True if it parsed and passed safety checks
+    """
+    data_dir = Path(data_dir)
+    surveys = list(surveys or DEFAULT_XML_FILES)
+    results = {}
+    jobs = {}
+
+    for survey in surveys:
+        xml_file = data_dir / DEFAULT_XML_FILES[survey]
+        if not xml_file.exists():
+            print(f"ERROR: XML file not found: {xml_file}")
+            results[survey] = False
+            continue
+        output_file = data_dir / OUTPUT_FILES[survey]
+        if (not options.get('force') and not options.get('profile')
+                and outputs_up_to_date(xml_file, output_file, options.get('cache_dir'),
+                                       options.get('formats', ('dta',)),
+                                       options.get('infer_types', True))):
+            print(f"\n[{survey}] UP TO DATE ({xml_file.name} and outputs unchanged)")
+            results[survey] = True
+            continue
+        jobs[survey] = (xml_file, output_file)
+
+    if jobs:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=max_workers or len(jobs)) as pool:
+            futures = {
+                survey: pool.submit(_parse_survey_worker, survey, xml_file, output_file, options)
+                for survey, (xml_file, output_file) in jobs.items()
+            }
+            for survey in jobs:
+                _, ok, log = futures[survey].result()
+                results[survey] = ok
+                print(f"\n{'=' * 70}\n[{survey}] {'OK' if ok else 'FAILED'}\n{'=' * 70}")
+                print(log, end='')
+
+    print(f"\n=== ALL SURVEYS ===")
+    for survey in surveys:
+        print(f"  {survey}: {'OK' if results[survey] else 'FAILED'}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Parse Qualtrics XML export to Stata dataset'
+    )
+    parser.add_argument(
+        'survey',
+        choices=['prescreen', 'main', 'followup', 'all'],
+        help="Survey name: prescreen, main, followup, or 'all' to parse every survey in parallel"
+    )
+    parser.add_argument(
+        'xml_file',
+        nargs='?',
+        default=None,
+        help='Optional: specific XML filename (in data directory)'
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Parse incrementally with iterparse (flat memory for large exports)'
+    )
+    parser.add_argument(
+        '--no-infer-types',
+        dest='infer_types',
+        action='store_false',
+        help='Keep every field as a string column (skip schema inference)'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help="With 'all': number of worker processes (default: one per survey)"
+    )
+    parser.add_argument(
+        '--no-cache',
+        dest='use_cache',
+        action='store_false',
+        help='Always parse the XML (do not read or write derived/parse_cache)'
+    )
+    parser.add_argument(
+        '--cache-max-mb',
+        type=int,
+        default=parse_cache.DEFAULT_MAX_BYTES // 1024 ** 2,
+        help='Size budget for the parse cache; oldest entries are evicted beyond it'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Append only responses not already in the existing output file'
+    )
+    parser.add_argument(
+        '--format',
+        dest='formats',
+        nargs='+',
+        choices=list(survey_io.OUTPUT_FORMATS),
+        default=['dta'],
+        help='Output format(s): dta (default), parquet, feather, arrow; e.g. --format dta arrow'
+    )
+    parser.add_argument(
+        '--mmap',
+        dest='use_mmap',
+        action='store_true',
+        help='Memory-map the XML and feed the parser in chunks (implies --stream)'
+    )
+    parser.add_argument(
+        '--parse-jobs',
+        type=int,
+        default=1,
+        help='Parse byte ranges of one export in this many processes (implies --mmap)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Record per-stage wall time, peak RSS and rows/sec to <output>.profile.json'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Re-parse even if the export and outputs are unchanged since the last run'
+    )
+
+    args = parser.parse_args()
+
+    # Set up paths
+    proj_dir = Path(__file__).parent.parent
+    data_dir = proj_dir / 'data'
+    options = {
+        'stream': args.stream,
+        'infer_types': args.infer_types,
+        'cache_dir': proj_dir / 'derived' / 'parse_cache' if args.use_cache else None,
+        'cache_max_bytes': args.cache_max_mb * 1024 ** 2,
+        'incremental': args.incremental,
+        'formats': args.formats,
+        'use_mmap': args.use_mmap,
+        'parse_jobs': args.parse_jobs,
+        'profile': args.profile,
+        'force': args.force,
+    }
+
+    if args.survey == 'all':
+        if args.xml_file:
+            parser.error("xml_file cannot be given with 'all' (uses DEFAULT_XML_FILES)")
+        results = parse_all_surveys(data_dir, max_workers=args.jobs, **options)
+        sys.exit(0 if all(results.values()) else 1)
+
+    # Get input/output files
+    xml_filename = args.xml_file or DEFAULT_XML_FILES[args.survey]
+    xml_file = data_dir / xml_filename
+    output_file = data_dir / OUTPUT_FILES[args.survey]
+
+    if not xml_file.exists():
+        print(f"ERROR: XML file not found: {xml_file}")
+        sys.exit(1)
+
+    try:
+        process_survey(xml_file, output_file, **options)
+    except SafetyCheckError:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Incremental Bonus Payments from a Persistent Ledger
+
+Python replacement for process_main_payment_day*.do and
+process_followup_payment*.do. Instead of re-importing the survey export
+and every earlier reward_day*.csv each round, payments are recorded in an
+append-only ledger (default: derived/payment_ledger.jsonl) that is loaded
+into a dict per bonus, so "already paid?" is one hash lookup per response.
+
+The ledger is JSON Lines, one record per line, never rewritten:
+    {"kind": "payment", "bonus", "pid", "amount", "round", "response_id", "time"}
+    {"kind": "response", "bonus", "response_id"}     (evaluated, no payment)
+
+A round reads the (cumulative) Qualtrics CSV export row by row and only
+evaluates responses whose ResponseId the ledger has not seen for that
+bonus, applies the bonus's filters and reward rule, skips participants
+already paid, writes the Prolific bulk-payment CSV (prolific_id,pay) and
+then appends the round to the ledger.
+
+Bonuses are defined in a spec (default: code/payments.json); rules are:
+    post_trial  'amount' if the post-trial estimate (the one non-empty of
+                'columns', '%' stripped) is within 'range' (main survey:
+                0.50 for 0.2-2.4%)
+    guess       'amount' per guess within 'tolerance' of its 'target'
+                (followup: 0.50 each for placebo ~3% and vaccine ~1.3%)
+
+Numeric answers are read as the do-files' `destring, force` read them:
+'%' is stripped and anything that is not a (finite) number counts as
+missing. The answers the do-files fixed by hand are listed in the bonus's
+'fixes' ({"column", "text" or "contains", "value"}), applied before
+parsing. A bonus with "free_text": true also reads free text containing
+exactly one number ("maybe 2") as that number, which the do-files never
+did. Money and thresholds are Decimals, so 2.4 is in range exactly.
+
+A round name already in the ledger for the bonus is refused, and an
+existing payment CSV is only replaced by a different one with --force.
+
+Usage:
+    python code/payment_ledger.py import main_post_trial data/reward_day1.csv --round day1
+    python code/payment_ledger.py run main_post_trial "data/flu_survey_main_December+8,+2025_15.41.csv" --round day6
+    python code/payment_ledger.py run followup_guess data/followup.csv --round final2 --dry-run
+    python code/payment_ledger.py summary
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+DEFAULT_SPEC = Path('code') / 'payments.json'
+
+NUMBER = re.compile(r'-?\d+(?:\.\d+)?|-?\.\d+')
+
+# Header of the Prolific bulk-payment CSV (as the do-files' outsheet wrote it)
+PAYMENT_HEADER = ['prolific_id', 'pay']
+
+
+def load_spec(spec_path):
+    """
+    Read and validate a payments spec.
+
+    Returns:
+        spec dict with 'ledger', 'output_dir' and 'bonuses' keyed by name
+    """
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    bonuses = {}
+    for bonus in spec['bonuses']:
+        for field in ('name', 'rule', 'pid', 'amount'):
+            if field not in bonus:
+                raise ValueError(f"Bonus spec {bonus.get('name', '?')!r} is missing {field}")
+        if bonus['rule'] not in RULES:
+            raise ValueError(f"Bonus {bonus['name']!r}: unknown rule {bonus['rule']!r}")
+        if bonus['name'] in bonuses:
+            raise ValueError(f"Duplicate bonus name {bonus['name']!r}")
+        bonuses[bonus['name']] = bonus
+    spec['bonuses'] = bonuses
+    return spec
+
+
+def parse_number(text, free_text=False):
+    """
+    A numeric answer as a Decimal with '%' stripped; with free_text, also
+    the only number in free text. None if missing, not finite or ambiguous.
+    """
+    text = (text or '').replace('%', '').strip()
+    if not text:
+        return None
+    try:
+        # Decimal accepts digit separators ("1_000"); destring does not
+        value = Decimal(text) if '_' not in text else None
+    except InvalidOperation:
+        value = None
+    if value is None and free_text:
+        numbers = NUMBER.findall(text)
+        value = Decimal(numbers[0]) if len(numbers) == 1 else None
+    return value if value is not None and value.is_finite() else None
+
+
+def read_answer(row, column, bonus):
+    """A numeric answer after the bonus's hand fixes (see the module docstring)."""
+    text = (row.get(column.lower()) or '').strip()
+    for fix in bonus.get('fixes', []):
+        if fix['column'].lower() != column.lower():
+            continue
+        if text == fix.get('text') or ('contains' in fix and fix['contains'] in text):
+            text = fix['value']
+            break
+    return parse_number(text, free_text=bonus.get('free_text', False))
+
+
+def post_trial_reward(row, bonus):
+    """'amount' if the post-trial estimate is within 'range' (inclusive)."""
+    values = [read_answer(row, col, bonus) for col in bonus['columns']]
+    values = [value for value in values if value is not None]
+    if not values:
+        return None
+    low, high = (Decimal(bound) for bound in bonus['range'])
+    # Later arms overwrite earlier ones, as in the do-file's loop
+    return Decimal(bonus['amount']) if low <= values[-1] <= high else None
+
+
+def guess_reward(row, bonus):
+    """'amount' for each guess within 'tolerance' of its 'target'."""
+    correct = 0
+    for guess in bonus['guesses']:
+        value = read_answer(row, guess['column'], bonus)
+        if value is not None and abs(value - Decimal(guess['target'])) <= Decimal(guess['tolerance']):
+            correct += 1
+    return Decimal(bonus['amount']) * correct if correct else None
+
+
+RULES = {
+    'post_trial': post_trial_reward,
+    'guess': guess_reward,
+}
+
+
+class Ledger:
+    """
+    Append-only payment ledger, indexed in memory by bonus: paid
+    participants (pid -> total amount) and evaluated response IDs.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.paid = {}
+        self.seen = {}
+        self.rounds = {}
+        self.valid_bytes = 0
+        if self.path.exists():
+            self._load()
+
+    def _load(self):
+        data = self.path.read_bytes()
+        # A line without its newline is a write that never finished; it is
+        # ignored and cut off before the next append
+        self.valid_bytes = data.rfind(b'\n') + 1
+        if self.valid_bytes < len(data):
+            print(f"warning: ignoring incomplete last line of {self.path}")
+        for number, line in enumerate(data[:self.valid_bytes].decode('utf-8').splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                self._index(json.loads(line))
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"{self.path}:{number}: bad ledger record: {e}")
+
+    def _index(self, record):
+        bonus = record['bonus']
+        if record.get('response_id'):
+            self.seen.setdefault(bonus, set()).add(record['response_id'])
+        if record['kind'] == 'payment':
+            paid = self.paid.setdefault(bonus, {})
+            paid[record['pid']] = paid.get(record['pid'], Decimal(0)) + Decimal(record['amount'])
+            key = (bonus, record['round'])
+            count, total = self.rounds.get(key, (0, Decimal(0)))
+            self.rounds[key] = (count + 1, total + Decimal(record['amount']))
+
+    def is_paid(self, bonus, pid):
+        return pid in self.paid.get(bonus, {})
+
+    def is_seen(self, bonus, response_id):
+        return response_id in self.seen.get(bonus, ())
+
+    def append(self, records):
+        """Append records in one write, flushed to disk, and index them."""
+        if not records:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.truncate(self.valid_bytes)
+            f.seek(self.valid_bytes)
+            f.write(''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+            self.valid_bytes = f.tell()
+        for record in records:
+            self._index(record)
+
+
+def normalize_pid(pid):
+    """Prolific IDs as the ledger stores them: stripped, lower-case."""
+    return (pid or '').strip().lower()
+
+
+def iter_responses(csv_path):
+    """Rows of a Qualtrics CSV export as dicts with lower-cased column names (as Stata imports them)."""
+    with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader)]
+        for values in reader:
+            yield dict(zip(header, values))
+
+
+def evaluate_round(ledger, bonus, csv_path, round_name):
+    """
+    Evaluate the responses of an export that the ledger has not seen.
+
+    Returns:
+        (payments {pid: amount}, records to append, counts)
+    """
+    rule = RULES[bonus['rule']]
+    response_col = bonus.get('response_id', 'ResponseId').lower()
+    pid_col = bonus['pid'].lower()
+    filters = {col.lower(): value for col, value in bonus.get('filters', {}).items()}
+    now = datetime.now().isoformat(timespec='seconds')
+
+    payments = {}
+    records = []
+    counts = {'rows': 0, 'already seen': 0, 'new': 0, 'eligible': 0, 'rewarded': 0, 'already paid': 0}
+    for row in iter_responses(csv_path):
+        response_id = row.get(response_col, '')
+        # Skip Qualtrics' question-text and ImportId header rows
+        if not response_id.startswith('R_'):
+            continue
+        counts['rows'] += 1
+        if ledger.is_seen(bonus['name'], response_id):
+            counts['already seen'] += 1
+            continue
+        counts['new'] += 1
+        record = {'kind': 'response', 'bonus': bonus['name'], 'response_id': response_id}
+
+        if all(row.get(col, '').strip() == value for col, value in filters.items()):
+            counts['eligible'] += 1
+            amount = rule(row, bonus)
+            pid = normalize_pid(row.get(pid_col))
+            if amount is not None and pid:
+                counts['rewarded'] += 1
+                if ledger.is_paid(bonus['name'], pid) or pid in payments:
+                    counts['already paid'] += 1
+                else:
+                    payments[pid] = amount
+                    record = {'kind': 'payment', 'bonus': bonus['name'], 'pid': pid,
+                              'amount': f"{amount:.2f}", 'round': round_name,
+                              'response_id': response_id, 'time': now}
+        records.append(record)
+    return payments, records, counts
+
+
+def format_payments(payments):
+    """Prolific bulk-payment CSV text, one participant per line, sorted by ID."""
+    lines = [','.join(PAYMENT_HEADER)] + [f"{pid},{payments[pid]:.2f}" for pid in sorted(payments)]
+    return '\n'.join(lines) + '\n'
+
+
+def write_payments(path, payments, force=False):
+    """
+    Write the bulk-payment CSV. An existing file with different contents
+    (e.g. an earlier round's payments) is only replaced with force.
+    """
+    text = format_payments(payments)
+    if path.exists() and not force:
+        if path.read_text(encoding='utf-8') == text:
+            return
+        raise ValueError(f"{path} exists with different payments; use another --output or --force")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.tmp{os.getpid()}")
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def read_payment_csv(path):
+    """(pid, amount) pairs of an earlier bulk-payment CSV; a header line is skipped."""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for values in csv.reader(f):
+            if not values or not values[0].strip():
+                continue
+            amount = parse_number(values[1]) if len(values) > 1 else None
+            if amount is None:
+                if values[0].strip().lower() in ('prolific_id', 'prolific_pid', 'pid', 'participant_id'):
+                    continue
+                raise ValueError(f"{path}: no amount for {values[0]!r}")
+            yield normalize_pid(values[0]), amount
+
+
+def check_new_round(ledger, bonus, round_name):
+    """Refuse a round name the ledger already has payments for."""
+    if (bonus['name'], round_name) in ledger.rounds:
+        count, total = ledger.rounds[(bonus['name'], round_name)]
+        raise ValueError(f"{bonus['name']} round {round_name!r} is already in the ledger "
+                         f"({count:,} paid, {total:.2f}); choose a new round name")
+
+
+def run_round(ledger, bonus, csv_path, round_name, output_path, dry_run=False, force=False):
+    """Evaluate a round, write its payment CSV and record it in the ledger."""
+    check_new_round(ledger, bonus, round_name)
+    payments, records, counts = evaluate_round(ledger, bonus, csv_path, round_name)
+    print(f"\n=== {bonus['name']}, round {round_name} ===")
+    for label, count in counts.items():
+        print(f"  {label + ':':<16} {count:>8,}")
+    total = sum(payments.values(), Decimal(0))
+    print(f"  Paying {len(payments):,} participants, {total:.2f} in total")
+
+    if dry_run:
+        print("  (dry run: nothing written)")
+        return
+    # The CSV first: if the append never happens the round can simply be rerun
+    write_payments(output_path, payments, force=force)
+    ledger.append(records)
+    print(f"Saved: {output_path}")
+    print(f"Ledger: {ledger.path} (+{len(records):,} records)")
+
+
+def import_round(ledger, bonus, paths, round_name):
+    """Record the payments of earlier bulk-payment CSVs (participants already paid are skipped)."""
+    check_new_round(ledger, bonus, round_name)
+    now = datetime.now().isoformat(timespec='seconds')
+    records = []
+    seen = set()
+    for path in paths:
+        for pid, amount in read_payment_csv(path):
+            if ledger.is_paid(bonus['name'], pid) or pid in seen:
+                continue
+            seen.add(pid)
+            records.append({'kind': 'payment', 'bonus': bonus['name'], 'pid': pid,
+                            'amount': f"{amount:.2f}", 'round': round_name, 'response_id': None,
+                            'time': now})
+    ledger.append(records)
+    print(f"Imported {len(records):,} payments into {bonus['name']}, round {round_name}")
+
+
+def print_summary(ledger):
+    """Participants and totals per bonus and round."""
+    print(f"\n=== LEDGER: {ledger.path} ===")
+    for (bonus, round_name), (count, total) in sorted(ledger.rounds.items()):
+        print(f"  {bonus:<20} {round_name:<12} {count:>6,} paid {total:>10.2f}")
+    for bonus, paid in sorted(ledger.paid.items()):
+        print(f"  {bonus:<20} {'all':<12} {len(paid):>6,} paid {sum(paid.values(), Decimal(0)):>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental bonus payments from a persistent ledger')
+    parser.add_argument(
+        '--spec',
+        type=Path,
+        default=None,
+        help=f'Payments spec (default: {DEFAULT_SPEC})'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Pay the new responses of a survey export')
+    run_parser.add_argument('bonus', help='Bonus name in the spec')
+    run_parser.add_argument('csv', type=Path, help='Qualtrics CSV export (cumulative is fine)')
+    run_parser.add_argument('--round', required=True, dest='round_name', help='Round name, e.g. day6')
+    run_parser.add_argument(
+        '--output',
+        type=Path,
+        default=None,
+        help="Bulk-payment CSV (default: <output_dir>/reward_<round>.csv)"
+    )
+    run_parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Report what would be paid without writing the CSV or the ledger'
+    )
+    run_parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Replace an existing payment CSV with different contents'
+    )
+
+    import_parser = commands.add_parser('import', help='Record earlier bulk-payment CSVs as paid')
+    import_parser.add_argument('bonus', help='Bonus name in the spec')
+    import_parser.add_argument('csvs', type=Path, nargs='+', help='Payment CSVs (prolific_id,pay)')
+    import_parser.add_argument('--round', required=True, dest='round_name', help='Round name, e.g. day1')
+
+    commands.add_parser('summary', help='Participants and totals per bonus and round')
+    args = parser.parse_args()
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    spec_path = args.spec or proj_dir / DEFAULT_SPEC
+
+    try:
+        spec = load_spec(spec_path)
+        ledger = Ledger(proj_dir / spec['ledger'])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read spec or ledger: {e}")
+        sys.exit(1)
+
+    if args.command == 'summary':
+        print_summary(ledger)
+        return
+
+    if args.bonus not in spec['bonuses']:
+        print(f"ERROR: not in {spec_path}: {args.bonus}")
+        sys.exit(1)
+    bonus = spec['bonuses'][args.bonus]
+
+    try:
+        if args.command == 'import':
+            import_round(ledger, bonus, args.csvs, args.round_name)
+        else:
+            if not args.csv.exists():
+                print(f"ERROR: survey export not found: {args.csv}")
+                sys.exit(1)
+            output = args.output or proj_dir / spec.get('output_dir', 'data') / f"reward_{args.round_name}.csv"
+            run_round(ledger, bonus, args.csv, args.round_name, output, dry_run=args.dry_run,
+                      force=args.force)
+    except (OSError, ValueError, ArithmeticError) as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Stage Profiling for the Python Pipeline
+
+StageProfiler records, per named stage, the wall time, the process peak RSS
+at the end of the stage, and rows/sec when a row count is known. The report
+is written as JSON (e.g. next to parse_xml.py output with --profile) so
+timings can be compared across Qualtrics export sizes.
+
+Usage:
+    profiler = StageProfiler()
+    with profiler.stage('xml_parse') as record:
+        df = ...
+        record['rows'] = len(df)
+    profiler.write_json('data/main_raw.profile.json', xml_file='...')
+
+A disabled profiler (StageProfiler(enabled=False)) keeps the same interface
+at negligible cost, so callers never need to branch on it.
+
+Peak RSS comes from resource.getrusage, which is unavailable on Windows;
+there it is reported as null.
+
+Created by Dan + Claude Code
+"""
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak / 1024 ** 2
+    return peak / 1024
+
+
+class StageProfiler:
+    """Collects wall time, peak RSS and throughput for named pipeline stages."""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        Time the enclosed block as stage `name`.
+
+        Yields a dict; set record['rows'] inside the block if the row count
+        is only known afterwards.
+        """
+        record = {'stage': name, 'rows': rows}
+        if not self.enabled:
+            yield record
+            return
+
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wall = time.perf_counter() - start
+            record['wall_sec'] = round(wall, 6)
+            record['peak_rss_mb'] = _round(peak_rss_mb())
+            if record['rows'] is not None and wall > 0:
+                record['rows_per_sec'] = round(record['rows'] / wall, 1)
+            else:
+                record['rows_per_sec'] = None
+            self.stages.append(record)
+
+    def report(self, **metadata):
+        """Return the profile as a JSON-serializable dict."""
+        import platform
+
+        return {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            **metadata,
+            'total_wall_sec': round(time.perf_counter() - self._start, 6),
+            'peak_rss_mb': _round(peak_rss_mb()),
+            'stages': self.stages,
+        }
+
+    def write_json(self, path, **metadata):
+        """Write the report to path (no-op when disabled)."""
+        if not self.enabled:
+            return None
+        with open(path, 'w') as f:
+            json.dump(self.report(**metadata), f, indent=2, default=str)
+        return path
+
+    def summary(self):
+        """One line per stage, for printing at the end of a run."""
+        lines = []
+        for record in self.stages:
+            rate = f"{record['rows_per_sec']:>12,.0f} rows/s" if record['rows_per_sec'] else ' ' * 19
+            rss = f"{record['peak_rss_mb']:8.1f} MB" if record['peak_rss_mb'] is not None else ''
+            lines.append(f"  {record['stage']:<24} {record['wall_sec']:9.3f} s {rate} {rss}")
+        return '\n'.join(lines)
+
+
+def _round(value, digits=1):
+    return None if value is None else round(value, digits)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Randomization Inference for Treatment-Arm Comparisons
+
+Permutation p-values for the keyvar coefficients of the regression_tables.py
+tables, in place of `permute arm_n ...: regress y keyvars $controls`. Each
+draw re-assigns the arms by permuting the rows' keyvars (complete
+randomization within the estimation sample) and recomputes, for every
+outcome that shares the estimation rows:
+
+    - the regression coefficients of the keyvars, with the controls
+      partialled out (Frisch-Waugh): with Z = QR for the controls and
+      D the keyvars, each draw only needs Q'D[perm], and
+          b = (D'D - A'A)^-1 D[perm]' Y_res,    A = Q'D[perm]
+      (D'D is the same for every permutation, Y_res = Y - QQ'Y is fixed)
+    - the difference in means between each arm and the control group
+
+Draws are generated as permutation index matrices in blocks sized to a
+memory budget (--block-mb) and every statistic is computed for the whole
+block in batched matmuls and one batched solve. Blocks are spread across
+a process pool; block i of a column group uses the i-th seed spawned from
+--seed and the group's name, so results depend only on the seed and block
+size, not on the number of workers or which tables are built.
+
+As in Stata's permute, the p-value is the share of draws whose statistic
+is at least as large in absolute value as the observed one. The tables
+are written by regression_tables.py with a [p] row under each (se) row
+(the regression coefficient's p-value); the difference-in-means p-values
+are printed.
+
+Usage:
+    python code/randomization_inference.py                    # every table, 10,000 draws
+    python code/randomization_inference.py treatment_effects --draws 50000 --jobs 8
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import regression_tables as rt
+
+DEFAULT_DRAWS = 10_000
+DEFAULT_SEED = 12345
+
+# Memory budget for one block of permuted keyvars (MB)
+DEFAULT_BLOCK_MB = 64
+
+# Relative tolerance when comparing a draw's statistic to the observed one,
+# so the identity permutation counts despite rounding
+TIE_TOL = 1e-9
+
+DEFAULT_SUFFIX = '_ri'
+
+
+def permutation_problem(design, rows, Y):
+    """
+    Arrays the draws need for one column group: the keyvars D, the
+    orthonormal basis Q of the (non-collinear) controls and _cons, and the
+    outcomes Y and their residuals on the controls.
+
+    Returns:
+        (D, Q, Y, Y_res)
+    """
+    X = design.X[rows]
+    key = set(design.key_index)
+    Z = X[:, [j for j in range(X.shape[1]) if j not in key]]
+    Q, R = np.linalg.qr(Z)
+    kept = rt.Factorization._independent_columns(Z, R)
+    if len(kept) < Z.shape[1]:
+        Q, _ = np.linalg.qr(Z[:, kept])
+    D = X[:, design.key_index]
+    return D, Q, Y, Y - Q @ (Q.T @ Y)
+
+
+def block_statistics(problem, perm):
+    """
+    Keyvar coefficients and differences in means for a block of
+    permutations (perm is draws x n row indices).
+
+    Returns:
+        (coef, dim) arrays of shape (draws, keyvars, outcomes)
+    """
+    D, Q, Y, Y_res = problem
+    Dp = D[perm]                                      # (draws, n, m)
+    Dp_t = Dp.transpose(0, 2, 1)
+    A = np.matmul(Q.T, Dp)                            # (draws, c, m)
+    coef = np.linalg.solve(D.T @ D - A.transpose(0, 2, 1) @ A, Dp_t @ Y_res)
+
+    n_arm = D.sum(axis=0)
+    n_control = len(D) - n_arm.sum()
+    sums = Dp_t @ Y                                   # (draws, m, p)
+    control_sums = Y.sum(axis=0) - sums.sum(axis=1)   # (draws, p)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dim = sums / n_arm[:, None] - (control_sums / n_control)[:, None, :]
+    return coef, dim
+
+
+def observed_statistics(problem):
+    """Statistics of the actual assignment (the identity permutation)."""
+    coef, dim = block_statistics(problem, np.arange(len(problem[0]))[None, :])
+    return coef[0], dim[0]
+
+
+def block_sizes(n_draws, n_rows, n_keys, block_mb=DEFAULT_BLOCK_MB):
+    """Split n_draws into blocks whose permuted keyvars and indices fit in block_mb."""
+    per_draw = n_rows * (8 * n_keys + 4)
+    size = max(1, int(block_mb * 1024 ** 2 // per_draw))
+    return [min(size, n_draws - start) for start in range(0, n_draws, size)]
+
+
+def _ri_worker(args):
+    """
+    Process-pool entry point: run some blocks of one column group.
+
+    Returns:
+        (coef_count, dim_count) of draws at least as extreme as observed
+    """
+    problem, observed, sizes, seeds = args
+    coef_obs, dim_obs = observed
+    n = len(problem[0])
+    coef_count = np.zeros(coef_obs.shape, dtype=np.int64)
+    dim_count = np.zeros(dim_obs.shape, dtype=np.int64)
+    for size, seed in zip(sizes, seeds):
+        rng = np.random.default_rng(seed)
+        perm = np.tile(np.arange(n, dtype=np.int32), (size, 1))
+        rng.permuted(perm, axis=1, out=perm)
+        coef, dim = block_statistics(problem, perm)
+        coef_count += (np.abs(coef) >= np.abs(coef_obs) * (1 - TIE_TOL)).sum(axis=0)
+        dim_count += (np.abs(dim) >= np.abs(dim_obs) * (1 - TIE_TOL)).sum(axis=0)
+    return coef_count, dim_count
+
+
+def group_seed(seed, name):
+    """Seed sequence for a column group, from the base seed and the group's name."""
+    return np.random.SeedSequence([seed, int(hashlib.sha256(name.encode()).hexdigest()[:8], 16)])
+
+
+class RandomizationInference:
+    """
+    Permutation p-values for regression_tables column groups, with one
+    process pool shared by every table (use as a context manager).
+    """
+
+    def __init__(self, draws=DEFAULT_DRAWS, seed=DEFAULT_SEED, block_mb=DEFAULT_BLOCK_MB,
+                 max_workers=None):
+        self.draws = draws
+        self.seed = seed
+        self.block_mb = block_mb
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pool = None
+        self.seconds = 0.0
+
+    def __enter__(self):
+        if self.max_workers > 1:
+            from concurrent.futures import ProcessPoolExecutor
+
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self
+
+    def __exit__(self, *exc):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def pvalues(self, problem, name):
+        """
+        Permutation p-values for one column group.
+
+        Returns:
+            (coef_p, dim_p) arrays of shape (keyvars, outcomes)
+        """
+        observed = observed_statistics(problem)
+        D = problem[0]
+        sizes = block_sizes(self.draws, D.shape[0], D.shape[1], self.block_mb)
+        seeds = group_seed(self.seed, name).spawn(len(sizes))
+        n_tasks = min(len(sizes), self.max_workers)
+        tasks = [(problem, observed, sizes[i::n_tasks], seeds[i::n_tasks]) for i in range(n_tasks)]
+
+        if self.pool is None:
+            counts = [_ri_worker(task) for task in tasks]
+        else:
+            counts = list(self.pool.map(_ri_worker, tasks))
+        coef_count = sum(count[0] for count in counts)
+        dim_count = sum(count[1] for count in counts)
+        return coef_count / self.draws, dim_count / self.draws
+
+    def add_pvalues(self, df, design, columns, results, table_name):
+        """
+        Add ri_p (regression coefficient), ri_p_dim (difference in means)
+        and ri_draws to each column's results, per keyvar.
+        """
+        start = time.perf_counter()
+        Y_all, groups = rt.estimation_groups(df, design, columns)
+        for rows, cols in groups:
+            if any(name in design.keyvars for name in results[cols[0]]['omitted']):
+                print(f"warning: {table_name}: keyvar omitted, no randomization inference for "
+                      f"{', '.join(columns[c][0] for c in cols)}")
+                continue
+            problem = permutation_problem(design, rows, Y_all[rows][:, cols])
+            name = f"{table_name}:{','.join(columns[c][0] for c in cols)}:{cols[0]}"
+            coef_p, dim_p = self.pvalues(problem, name)
+            for i, c in enumerate(cols):
+                results[c].update(ri_p=coef_p[:, i], ri_p_dim=dim_p[:, i], ri_draws=self.draws)
+        self.seconds += time.perf_counter() - start
+
+
+def print_dim_pvalues(name, results, keyvars):
+    """Difference-in-means permutation p-values of a table, one line per keyvar."""
+    print(f"  {name} difference in means, randomization p:")
+    for r, keyvar in enumerate(keyvars):
+        cells = ''.join(f"{rt.fmt(res['ri_p_dim'][r], '12.3f', '.'):>12}" if 'ri_p_dim' in res
+                        else f"{'.':>12}" for res in results)
+        print(f"    {keyvar:<18}{cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Randomization inference for the treatment-effect tables')
+    parser.add_argument(
+        'tables',
+        nargs='*',
+        help='Table names to build (default: every table in the spec)'
+    )
+    parser.add_argument(
+        '--draws',
+        type=int,
+        default=DEFAULT_DRAWS,
+        help=f'Permutations per regression (default: {DEFAULT_DRAWS:,})'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=DEFAULT_SEED,
+        help=f'Base random seed (default: {DEFAULT_SEED})'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes (default: one per CPU; 1 runs serially)'
+    )
+    parser.add_argument(
+        '--block-mb',
+        type=float,
+        default=DEFAULT_BLOCK_MB,
+        help=f'Memory budget per block of draws in MB (default: {DEFAULT_BLOCK_MB})'
+    )
+    parser.add_argument(
+        '--spec',
+        type=Path,
+        default=None,
+        help=f'Regression table spec (default: {rt.DEFAULT_SPEC})'
+    )
+    parser.add_argument(
+        '--data',
+        type=Path,
+        default=None,
+        help="Survey data file (default: the spec's data)"
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=Path,
+        default=None,
+        help=f'Directory for the .tex and .md files (default: {rt.OUTPUT_DIR})'
+    )
+    parser.add_argument(
+        '--suffix',
+        default=DEFAULT_SUFFIX,
+        help=f"Appended to each table's file name (default: {DEFAULT_SUFFIX})"
+    )
+    args = parser.parse_args()
+    if args.draws < 1:
+        parser.error('--draws must be at least 1')
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    spec_path = args.spec or proj_dir / rt.DEFAULT_SPEC
+
+    try:
+        spec = rt.load_spec(spec_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read spec {spec_path}: {e}")
+        sys.exit(1)
+
+    known = {table['name'] for table in spec['tables']}
+    unknown = [name for name in args.tables if name not in known]
+    if unknown:
+        print(f"ERROR: not in {spec_path}: {', '.join(unknown)}")
+        sys.exit(1)
+
+    data_path = args.data or proj_dir / spec['data']
+    if not data_path.exists():
+        print(f"ERROR: data file not found: {data_path}")
+        sys.exit(1)
+
+    with RandomizationInference(args.draws, args.seed, args.block_mb, args.jobs) as ri:
+        try:
+            all_results = rt.build_tables(spec, data_path, args.output_dir or proj_dir / rt.OUTPUT_DIR,
+                                          proj_dir, names=set(args.tables) or None, ri=ri,
+                                          suffix=args.suffix)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+
+    print(f"\nRandomization inference: {args.draws:,} draws per regression, "
+          f"{ri.max_workers} worker(s), {ri.seconds:.1f}s")
+    for table in spec['tables']:
+        if table['name'] in all_results:
+            keyvars = table.get('keyvars', spec.get('keyvars'))
+            print_dim_pvalues(table['name'], all_results[table['name']], keyvars)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+"""
+Multi-Outcome OLS Tables with Shared Factorized Designs
+
+Python engine for the treatment-effect tables (treatment_effects.do,
+explore_persistence.do, heterogeneous_treatment_effects.do): for every
+column, `regress y keyvars $controls if <sample>, robust` and the control
+mean, written as the esttab fragments those do-files produce or in the
+regression_table.ado format. The full table set comes from one read of the
+data, driven by a spec (default: code/regression_tables.json).
+
+The design matrix for keyvars + controls is built once over the whole
+dataset: controls are read from the globals in code/_set_controls.do,
+i.var terms become indicators for every level but the lowest (Stata's
+base) and wildcards such as cond_* expand in dataset order. A regression
+then only picks rows: its sample is the column's `if` conditions and the
+rows where y and every regressor are non-missing (casewise deletion).
+
+Each distinct (design, rows) pair is factorized once, X = QR, and the
+factorization is cached, so outcomes with the same missing pattern (e.g.
+post_trial, delta and link_click) and tables that reuse a sample (the HTE
+splits of several tables) share it. All outcomes of a factorization are
+solved together:
+
+    b      = W'Y        with W = Q R^-T restricted to the keyvar columns
+    E      = Y - Q Q'Y
+    se^2   = (W * W)'(E * E) * n / (n - k)     (HC1, all outcomes at once)
+
+Regressors collinear with earlier ones are omitted as Stata does (_cons
+first, then keyvars and controls in order); an omitted keyvar is reported
+as missing. The control mean is the mean of y where every keyvar is 0,
+within the column's `if` sample (as `sum y if arm_control == 1 & ...`).
+
+Variables the do-files create with `gen` (vacc_post, se_sample, the HTE
+splits, ...) are derived here in DERIVED_VARIABLES with Stata's missing
+value semantics (missing compares greater than any number).
+
+Usage:
+    python code/regression_tables.py                      # every table
+    python code/regression_tables.py treatment_effects het_high_prior
+    python code/regression_tables.py --data derived/merged_all.parquet --list
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_SPEC = Path('code') / 'regression_tables.json'
+OUTPUT_DIR = Path('output') / 'tables'
+
+# A regressor whose QR pivot is below this fraction of its norm is collinear
+COLLINEAR_TOL = 1e-9
+
+# LaTeX escapes applied to row labels (as in regression_table.ado)
+TEX_ESCAPES = {'$': r'\$', '%': r'\%', '&': r'\&', '_': r'\_'}
+
+GLOBAL_LINE = re.compile(r'^\s*global\s+(\w+)\s+"([^"]*)"', re.MULTILINE)
+MACRO_REF = re.compile(r'\$(\w+)')
+
+
+def read_globals(do_file):
+    """
+    Globals defined with `global name "..."` in a do-file, with $name
+    references to earlier globals expanded.
+
+    Returns:
+        dict mapping global name -> expanded string
+    """
+    text = Path(do_file).read_text(encoding='utf-8')
+    globals_ = {}
+    for name, value in GLOBAL_LINE.findall(text):
+        globals_[name] = expand_macros(value, globals_)
+    return globals_
+
+
+def expand_macros(text, globals_):
+    """Replace $name references with their values (unknown globals are empty, as in Stata)."""
+    return ' '.join(MACRO_REF.sub(lambda m: globals_.get(m.group(1), ''), text).split())
+
+
+# Variables created with `gen` in the do-files. Comparisons treat missing as
+# larger than every number, as Stata does.
+
+def _missing_gt(x, value):
+    return (x > value) | x.isna()
+
+
+def _missing_ge(x, value):
+    return (x >= value) | x.isna()
+
+
+def _indicator_if_nonmissing(x, condition):
+    return condition.astype(float).where(x.notna())
+
+
+def _recall_sample(df):
+    recall_miss = df[['recall_gavi', 'recall_manufacturer', 'recall_university']].isna().sum(axis=1)
+    invalid_miss = (df['in_followup'] != 0) & df['recall_study'].isin([1, 3]) & (recall_miss > 0)
+    return ((df['in_followup'] != 0) & ~invalid_miss).astype(float)
+
+
+DERIVED_VARIABLES = {
+    # treatment_effects.do
+    'vacc_post': lambda df: _indicator_if_nonmissing(df['got_flu_vacc'], df['got_flu_vacc'] == 1),
+    # explore_persistence.do
+    'se_sample': lambda df: ((df['guess_vaccine'] != -99) & (df['guess_placebo'] != -99)
+                             & (df['in_followup'] != 0) & df['guess_vaccine'].notna()
+                             & df['guess_placebo'].notna()).astype(float),
+    'recall_sample': _recall_sample,
+    'yes_recall_study': lambda df: _indicator_if_nonmissing(df['recall_study'], df['recall_study'] == 1),
+    'yes_recall_manu': lambda df: _indicator_if_nonmissing(df['recall_manufacturer'],
+                                                           df['recall_manufacturer'] == 1),
+    'yes_recall_uni': lambda df: _indicator_if_nonmissing(df['recall_university'],
+                                                          df['recall_university'] == 1),
+    'yes_recall_gavi': lambda df: _indicator_if_nonmissing(df['recall_gavi'], df['recall_gavi'] == 1),
+    'guess_delta': lambda df: df['guess_vaccine'] - df['guess_placebo'],
+    # heterogeneous_treatment_effects.do
+    'high_prior': lambda df: _missing_ge(df['prior_self_vacc'], 5).astype(float),
+    'bad_experience': lambda df: (~df['flu_vacc_reaction'].isin([1, 2])).astype(float),
+    'high_trust': lambda df: _missing_gt(df['trust_trial'], 5).astype(float),
+    'high_relevance': lambda df: _missing_gt(df['relevant_trial'], 5).astype(float),
+    'reliable_uni': lambda df: (df['reliable_university'] == 3).astype(float),
+}
+
+
+def load_spec(spec_path):
+    """
+    Read and validate a regression table spec.
+
+    Returns:
+        spec dict with 'tables' and defaults ('keyvars', 'controls', ...)
+    """
+    with open(spec_path, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+
+    names = set()
+    for table in spec['tables']:
+        if 'name' not in table or not table.get('outcomes'):
+            raise ValueError(f"Table spec {table.get('name', '?')!r} needs a name and outcomes")
+        if table['name'] in names:
+            raise ValueError(f"Duplicate table name {table['name']!r}")
+        if not (table.get('keyvars') or spec.get('keyvars')):
+            raise ValueError(f"Table {table['name']!r} has no keyvars")
+        if table.get('style', spec.get('style', 'esttab')) not in STYLES:
+            raise ValueError(f"Table {table['name']!r}: unknown style {table.get('style')!r}")
+        names.add(table['name'])
+    return spec
+
+
+def read_data(path):
+    """
+    Read a survey data file with value codes, and its variable labels (.dta only).
+
+    Returns:
+        (DataFrame, {variable: label})
+    """
+    import pandas as pd
+    from survey_io import iter_survey_chunks
+
+    path = Path(path)
+    df = pd.concat(list(iter_survey_chunks(path)), ignore_index=True)
+    labels = {}
+    if path.suffix.lower() == '.dta':
+        with pd.read_stata(path, iterator=True) as reader:
+            labels = {var: label for var, label in reader.variable_labels().items() if label}
+    return df, labels
+
+
+def add_derived(df, names):
+    """Add the DERIVED_VARIABLES among names that the data does not already have."""
+    missing = [name for name in dict.fromkeys(names) if name in DERIVED_VARIABLES and name not in df.columns]
+    if missing:
+        df = df.assign(**{name: DERIVED_VARIABLES[name](df) for name in missing})
+    return df
+
+
+def expand_terms(terms, columns):
+    """Expand wildcard terms (cond_*, i.flu_*) against the data's columns, in dataset order."""
+    expanded = []
+    for term in terms:
+        prefix, var = ('i.', term[2:]) if term.startswith('i.') else ('', term)
+        if any(ch in var for ch in '*?'):
+            matches = [col for col in columns if fnmatch.fnmatchcase(col, var)]
+            if not matches:
+                raise ValueError(f"{term} matches no variables")
+            expanded.extend(prefix + col for col in matches)
+        else:
+            expanded.append(term)
+    return expanded
+
+
+class Design:
+    """
+    The regressors of `regress y keyvars controls` over every row of the
+    data: X has _cons first, then keyvars, then controls (i.var expanded to
+    level indicators), and `complete` flags rows with no missing regressor.
+    """
+
+    def __init__(self, df, keyvars, controls):
+        terms = expand_terms(controls, list(df.columns))
+        unknown = [t[2:] if t.startswith('i.') else t for t in keyvars + terms
+                   if (t[2:] if t.startswith('i.') else t) not in df.columns]
+        if unknown:
+            raise ValueError(f"not in the data: {', '.join(dict.fromkeys(unknown))}")
+
+        n = len(df)
+        columns = [np.ones(n)]
+        names = ['_cons']
+        complete = np.ones(n, dtype=bool)
+        for term in list(keyvars) + terms:
+            if term.startswith('i.'):
+                var = term[2:]
+                values = df[var].to_numpy(dtype=float)
+                observed = ~np.isnan(values)
+                for level in np.unique(values[observed])[1:]:
+                    columns.append((values == level).astype(float))
+                    names.append(f"{level:g}.{var}")
+            else:
+                values = df[term].to_numpy(dtype=float)
+                observed = ~np.isnan(values)
+                columns.append(np.where(observed, values, 0.0))
+                names.append(term)
+            complete &= observed
+
+        self.X = np.column_stack(columns)
+        self.names = names
+        self.complete = complete
+        self.keyvars = list(keyvars)
+        self.key_index = [names.index(var) for var in keyvars]
+        self.key = (tuple(keyvars), tuple(terms))
+
+
+class Factorization:
+    """
+    QR factorization of one design restricted to a set of rows, with the
+    collinear regressors omitted; solves any number of outcomes at once.
+    """
+
+    def __init__(self, design, rows):
+        X = design.X[rows]
+        Q, R = np.linalg.qr(X)
+        kept = self._independent_columns(X, R)
+        if len(kept) < X.shape[1]:
+            Q, R = np.linalg.qr(X[:, kept])
+
+        self.rows = rows
+        self.n, self.k = X.shape[0], len(kept)
+        self.Q = Q
+        # W = Q R^-T, columns for the keyvars that were kept (others stay NaN)
+        position = {j: p for p, j in enumerate(kept)}
+        self.omitted = [design.names[j] for j in range(X.shape[1]) if j not in position]
+        self.key_kept = [i for i, j in enumerate(design.key_index) if j in position]
+        Rinv_t = np.linalg.inv(R).T
+        self.W = Q @ Rinv_t[:, [position[design.key_index[i]] for i in self.key_kept]]
+        self.n_keys = len(design.key_index)
+
+    @staticmethod
+    def _independent_columns(X, R):
+        """Indices of columns not collinear with earlier ones (Stata's omission order), from X = QR."""
+        norms = np.linalg.norm(X, axis=0)
+        pivots = np.abs(np.diagonal(R))
+        return [j for j in range(X.shape[1]) if norms[j] > 0 and pivots[j] > COLLINEAR_TOL * norms[j]]
+
+    def solve(self, Y):
+        """
+        Keyvar coefficients and HC1 standard errors for the outcome columns of Y
+        (rows already restricted to this factorization's rows).
+
+        Returns:
+            (coef, se) arrays of shape (keyvars, outcomes), NaN for omitted keyvars
+        """
+        resid = Y - self.Q @ (self.Q.T @ Y)
+        coef = np.full((self.n_keys, Y.shape[1]), np.nan)
+        se = np.full((self.n_keys, Y.shape[1]), np.nan)
+        coef[self.key_kept] = self.W.T @ Y
+        se[self.key_kept] = np.sqrt((self.W ** 2).T @ resid ** 2 * (self.n / (self.n - self.k)))
+        return coef, se
+
+
+class FactorizationCache:
+    """Factorizations keyed by design and a digest of their rows."""
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, design, rows):
+        key = (design.key, hashlib.sha1(np.packbits(rows).tobytes()).hexdigest())
+        if key in self.entries:
+            self.hits += 1
+        else:
+            self.misses += 1
+            self.entries[key] = Factorization(design, rows)
+        return self.entries[key]
+
+
+def sample_mask(df, conditions):
+    """Rows meeting every var == value condition (all rows if there are none)."""
+    mask = np.ones(len(df), dtype=bool)
+    for var, value in (conditions or {}).items():
+        mask &= df[var].to_numpy(dtype=float) == value
+    return mask
+
+
+def estimation_groups(df, design, columns):
+    """
+    Group (outcome, sample mask) columns by their estimation rows: the
+    sample, minus rows with a missing outcome or regressor.
+
+    Returns:
+        (Y_all, groups) with Y_all the (rows x columns) outcome matrix and
+        groups a list of (rows mask, column indices)
+    """
+    Y_all = df[[outcome for outcome, _ in columns]].to_numpy(dtype=float)
+    groups = {}
+    for c, (_, sample) in enumerate(columns):
+        rows = sample & design.complete & ~np.isnan(Y_all[:, c])
+        groups.setdefault(rows.tobytes(), (rows, []))[1].append(c)
+    for rows, cols in groups.values():
+        if not rows.any():
+            raise ValueError(f"no observations for {', '.join(columns[c][0] for c in cols)}")
+    return Y_all, list(groups.values())
+
+
+def fit_columns(df, design, columns, cache):
+    """
+    Fit every (outcome, sample mask) column on one design. Columns whose
+    estimation rows coincide are solved together on a shared factorization.
+
+    Returns:
+        list of dicts with coef, se (per keyvar), n, control_mean, omitted
+    """
+    keys_zero = (df[design.keyvars].to_numpy(dtype=float) == 0).all(axis=1)
+    Y_all, groups = estimation_groups(df, design, columns)
+
+    results = [None] * len(columns)
+    for rows, cols in groups:
+        factorization = cache.get(design, rows)
+        coef, se = factorization.solve(Y_all[rows][:, cols])
+        for i, c in enumerate(cols):
+            y = Y_all[:, c]
+            control = columns[c][1] & keys_zero & ~np.isnan(y)
+            results[c] = {
+                'coef': coef[:, i], 'se': se[:, i], 'n': factorization.n,
+                'control_mean': y[control].mean() if control.any() else np.nan,
+                'omitted': factorization.omitted,
+            }
+    return results
+
+
+def table_columns(df, table):
+    """
+    The (outcome, sample mask) columns of a table spec: outcomes within its
+    `if` sample, or with `by`, outcomes repeated for each value of the split.
+    """
+    base = sample_mask(df, table.get('if'))
+    by = table.get('by')
+    if not by:
+        return [(outcome, base) for outcome in table['outcomes']]
+    return [(outcome, base & sample_mask(df, {by['var']: value}))
+            for value in by['values'] for outcome in table['outcomes']]
+
+
+# Table writers: esttab fragments (b(%9.3f) se(%9.3f) label nostar
+# stats(cm N) fragment nolines nogaps) and regression_table.ado's format
+
+def fmt(value, spec='.3f', missing=''):
+    """Format a number, or `missing` for NaN."""
+    return missing if value is None or not np.isfinite(value) else format(value, spec)
+
+
+def tex_escape(text):
+    """Escape the characters regression_table.ado escapes in row labels."""
+    return ''.join(TEX_ESCAPES.get(ch, ch) for ch in text)
+
+
+def esttab_rows(results, row_labels):
+    """
+    (label, cells) rows of an esttab table: coefficient and (se) rows per
+    keyvar, a [randomization p] row when results have ri_p, control mean, N.
+    """
+    rows = []
+    for r, label in enumerate(row_labels):
+        rows.append((label, [fmt(res['coef'][r]) for res in results]))
+        rows.append(('', [f"({fmt(res['se'][r])})" if np.isfinite(res['se'][r]) else ''
+                          for res in results]))
+        if any('ri_p' in res for res in results):
+            rows.append(('', [f"[{fmt(res['ri_p'][r])}]" if 'ri_p' in res and np.isfinite(res['ri_p'][r])
+                              else '' for res in results]))
+    rows.append(('Control mean', [fmt(res['control_mean']) for res in results]))
+    rows.append(('N', [f"{res['n']:,}" for res in results]))
+    return rows
+
+
+def esttab_tex_lines(results, row_labels, titles=None, footer=None):
+    """esttab .tex fragment lines, plus the split label footer row if given."""
+    lines = [f"{tex_escape(label):<20}" + ''.join(f"&{cell:>12}" for cell in cells) + '\\\\'
+             for label, cells in esttab_rows(results, row_labels)]
+    if footer:
+        lines.append(' & '.join(footer))
+    return lines
+
+
+def esttab_md_lines(results, row_labels, titles=None, footer=None):
+    """esttab .md table lines with column titles in the header row."""
+    titles = titles or [''] * len(results)
+    lines = [f"| {'':<20} |" + ''.join(f" {title:>12} |" for title in titles),
+             f"| {'-' * 20} |" + ' :----------: |' * len(results)]
+    lines += [f"| {label:<20} |" + ''.join(f" {cell:>12} |" for cell in cells)
+              for label, cells in esttab_rows(results, row_labels)]
+    if footer:
+        lines.append('| ' + ' | '.join(footer) + ' |')
+    return lines
+
+
+def ado_tex_lines(results, row_labels, titles=None, footer=None):
+    """regression_table.ado .tex fragment lines (final row without \\\\ unless a footer follows)."""
+    lines = []
+    for r, label in enumerate(row_labels):
+        lines.append(tex_escape(label) + ''.join(f" & {fmt(res['coef'][r], '9.3f', '.')}"
+                                                 for res in results) + ' \\\\')
+        lines.append(' ' * 15 + ''.join(
+            f" & ({fmt(res['se'][r], '7.3f')})" if np.isfinite(res['se'][r]) else ' & .'
+            for res in results) + ' \\\\')
+        if any('ri_p' in res for res in results):
+            lines.append(' ' * 15 + ''.join(
+                f" & [{fmt(res['ri_p'][r], '7.3f')}]" if 'ri_p' in res and np.isfinite(res['ri_p'][r])
+                else ' & .' for res in results) + ' \\\\')
+    lines.append('Control mean   ' + ''.join(f" & {fmt(res['control_mean'], '9.3f', '.')}"
+                                             for res in results) + ' \\\\')
+    lines.append('N              ' + ''.join(f" & {res['n']:,}" for res in results))
+    if footer:
+        lines[-1] += ' \\\\'
+        lines.append(' & '.join(footer))
+    return lines
+
+
+def ado_md_lines(results, row_labels, titles=None, footer=None):
+    """regression_table.ado .md table lines (no header row)."""
+    lines = ['|--|' + '--:|' * len(results)]
+    for r, label in enumerate(row_labels):
+        lines.append(f"| {label} |" + ''.join(f" {fmt(res['coef'][r], missing='.')} |" for res in results))
+        lines.append('|  |' + ''.join(
+            f" ({fmt(res['se'][r])}) |" if np.isfinite(res['se'][r]) else ' . |' for res in results))
+        if any('ri_p' in res for res in results):
+            lines.append('|  |' + ''.join(
+                f" [{fmt(res['ri_p'][r])}] |" if 'ri_p' in res and np.isfinite(res['ri_p'][r])
+                else ' . |' for res in results))
+    lines.append('| Control mean |' + ''.join(f" {fmt(res['control_mean'], missing='.')} |"
+                                            for res in results))
+    lines.append('| N |' + ''.join(f" {res['n']:,} |" for res in results))
+    if footer:
+        lines.append('| ' + ' | '.join(footer) + ' |')
+    return lines
+
+
+# style -> (.tex writer, .md writer)
+STYLES = {
+    'esttab': (esttab_tex_lines, esttab_md_lines),
+    'regression_table': (ado_tex_lines, ado_md_lines),
+}
+
+
+def print_table(name, results, row_labels, headers):
+    """Console table in the layout of regression_table.ado."""
+    width = 20 + 12 * len(results)
+    print(f"\nRegression Table: {name}")
+    print('-' * width)
+    print(' ' * 20 + ''.join(f"{header[:10]:>12}" for header in headers))
+    print('-' * width)
+    for r, label in enumerate(row_labels):
+        print(f"{label[:20]:<20}" + ''.join(f"{fmt(res['coef'][r], '12.3f', '.'):>12}" for res in results))
+        print(' ' * 20 + ''.join(f"{'(' + fmt(res['se'][r], '6.3f', '.') + ')':>12}" for res in results))
+        if any('ri_p' in res for res in results):
+            print(' ' * 20 + ''.join(f"{'[' + fmt(res['ri_p'][r], '6.3f', '.') + ']':>12}" if 'ri_p' in res
+                                     else f"{'':>12}" for res in results))
+    print('-' * width)
+    print(f"{'Control mean':<20}" + ''.join(f"{fmt(res['control_mean'], '12.3f', '.'):>12}"
+                                            for res in results))
+    print(f"{'N':<20}" + ''.join(f"{res['n']:>12,}" for res in results))
+    print('-' * width)
+
+
+def write_lines(path, lines):
+    """Write lines with a trailing newline, creating the directory."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+
+def table_setting(spec, table, key, default=None):
+    """A table's own setting, else the spec-wide default."""
+    return table.get(key, spec.get(key, default))
+
+
+def build_tables(spec, data_path, output_dir, proj_dir, names=None, ri=None, suffix=''):
+    """
+    Fit and write the spec's tables (all, or those in names) from one read
+    of the data, sharing designs and factorizations across tables. With ri
+    (a randomization_inference.RandomizationInference), each column also
+    gets permutation p-values, written as a [p] row; suffix is appended to
+    the output file names.
+
+    Returns:
+        dict mapping table name -> list of column results
+    """
+    tables = [table for table in spec['tables'] if names is None or table['name'] in names]
+    globals_ = read_globals(proj_dir / spec['controls_file']) if spec.get('controls_file') else {}
+
+    start = time.perf_counter()
+    df, labels = read_data(data_path)
+    needed = [var for table in tables for var in
+              table['outcomes'] + list(table.get('if', {})) + ([table['by']['var']] if 'by' in table else [])]
+    df = add_derived(df, needed)
+    missing = [var for var in dict.fromkeys(needed) if var not in df.columns]
+    if missing:
+        raise ValueError(f"not in {data_path}: {', '.join(missing)}")
+    print(f"Read {len(df):,} rows x {df.shape[1]} columns from {data_path} "
+          f"({time.perf_counter() - start:.2f}s)")
+
+    cache = FactorizationCache()
+    designs = {}
+    all_results = {}
+    n_regressions = 0
+    start = time.perf_counter()
+    for table in tables:
+        keyvars = table_setting(spec, table, 'keyvars')
+        controls = expand_macros(table_setting(spec, table, 'controls', ''), globals_).split()
+        design_key = (tuple(keyvars), tuple(controls))
+        if design_key not in designs:
+            designs[design_key] = Design(df, keyvars, controls)
+        design = designs[design_key]
+
+        columns = table_columns(df, table)
+        results = fit_columns(df, design, columns, cache)
+        if ri is not None:
+            ri.add_pvalues(df, design, columns, results, table['name'])
+        all_results[table['name']] = results
+        n_regressions += len(results)
+
+        label_overrides = table_setting(spec, table, 'labels', {})
+        row_labels = [label_overrides.get(var) or labels.get(var, var) for var in keyvars]
+        by = table.get('by')
+        titles = table.get('titles')
+        if titles and by:
+            titles = titles * len(by['values'])
+        footer = None
+        if by:
+            footer = [by.get('rowlabel', by['var'])] + [
+                str(label) for label in by.get('labels', by['values']) for _ in table['outcomes']]
+
+        omitted = sorted({name for res in results for name in res['omitted'] if name in keyvars})
+        if omitted:
+            print(f"warning: omitted due to collinearity in {table['name']}: {', '.join(omitted)}")
+        print_table(table['name'], results, row_labels, [outcome for outcome, _ in columns])
+
+        tex_writer, md_writer = STYLES[table_setting(spec, table, 'style', 'esttab')]
+        tex_path = output_dir / f"{table['name']}{suffix}.tex"
+        write_lines(tex_path, tex_writer(results, row_labels, titles, footer))
+        write_lines(tex_path.with_suffix('.md'), md_writer(results, row_labels, titles, footer))
+        print(f"Saved: {tex_path}")
+
+    print(f"\n{n_regressions} regressions in {len(tables)} tables: {cache.misses} factorizations "
+          f"({cache.hits} reused), {time.perf_counter() - start:.2f}s")
+    return all_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Treatment-effect tables from a shared factorized OLS engine')
+    parser.add_argument(
+        'tables',
+        nargs='*',
+        help='Table names to build (default: every table in the spec)'
+    )
+    parser.add_argument(
+        '--spec',
+        type=Path,
+        default=None,
+        help=f'Regression table spec (default: {DEFAULT_SPEC})'
+    )
+    parser.add_argument(
+        '--data',
+        type=Path,
+        default=None,
+        help="Survey data file (default: the spec's data)"
+    )
+    parser.add_argument(
+        '--output-dir',
+        type=Path,
+        default=None,
+        help=f'Directory for the .tex and .md files (default: {OUTPUT_DIR})'
+    )
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='List the spec tables and exit'
+    )
+    args = parser.parse_args()
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    spec_path = args.spec or proj_dir / DEFAULT_SPEC
+
+    try:
+        spec = load_spec(spec_path)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read spec {spec_path}: {e}")
+        sys.exit(1)
+
+    if args.list:
+        for table in spec['tables']:
+            by = f" by {table['by']['var']}" if 'by' in table else ''
+            print(f"  {table['name']:<24} {', '.join(table['outcomes'])}{by}")
+        return
+
+    known = {table['name'] for table in spec['tables']}
+    unknown = [name for name in args.tables if name not in known]
+    if unknown:
+        print(f"ERROR: not in {spec_path}: {', '.join(unknown)}")
+        sys.exit(1)
+
+    data_path = args.data or proj_dir / spec['data']
+    if not data_path.exists():
+        print(f"ERROR: data file not found: {data_path}")
+        sys.exit(1)
+
+    try:
+        build_tables(spec, data_path, args.output_dir or proj_dir / OUTPUT_DIR, proj_dir,
+                     names=set(args.tables) or None)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
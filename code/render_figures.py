@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Batch Figure Rendering from plot_to_csv Exports
+
+Renders the figures listed in a manifest (default: code/figures.json) from
+the CSVs that plot_to_csv writes next to each Stata graph, in a process pool
+on the Agg backend, one worker per figure.
+
+Each figure is cached by a hash of its input CSV, its manifest spec, the
+plotting code and RENDER_VERSION (stamps under derived/figure_cache/), so a
+run only redraws figures whose data or spec changed; an output that was
+deleted or edited since its render is redrawn too.
+
+Manifest entries:
+    name      unique figure name (also the stamp file name)
+    kind      renderer; 'forest' draws forest_plot.plot_forest
+    csv       input CSV, relative to the project directory
+    output    output image, relative to the project directory
+    ...       renderer options (title, xlabel, ncols, dpi, colors, markers)
+
+The forest renderer reads either a tidy CSV with the forest_plot.index_effects
+columns (renamed with 'columns' if needed), or a multi-series plot_to_csv
+export described by:
+    sersets   {_serset: {'treatment', 'role': 'ci' or 'point', 'offset'}}
+              (CI series have ci_lo/ci_hi, point series have coef)
+    y         the y-position column shared by all series (e.g. ypos)
+    rows      [[y, splitting_var, subgroup], ...] where a series' rows sit at
+              y + offset
+
+pandas, matplotlib and the process pool are only imported when a figure
+has to be redrawn, so a run where every figure is cached stays cheap.
+
+Usage:
+    python code/render_figures.py                  # every stale figure
+    python code/render_figures.py hte_forest_panels --force
+    python code/render_figures.py --list
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+from pathlib import Path
+
+# Bump when rendering changes in a way the spec and input hashes do not capture
+RENDER_VERSION = 1
+
+DEFAULT_MANIFEST = Path('code') / 'figures.json'
+CACHE_DIR = Path('derived') / 'figure_cache'
+
+# Plotting modules whose source is part of each figure's cache key
+RENDERER_SOURCES = {'forest': ['forest_plot.py']}
+
+REQUIRED_KEYS = ('name', 'kind', 'csv', 'output')
+
+
+def load_manifest(manifest_path):
+    """
+    Read and validate a figure manifest.
+
+    Returns:
+        list of figure spec dicts, in manifest order
+    """
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        specs = json.load(f)['figures']
+
+    seen = set()
+    for spec in specs:
+        missing = [key for key in REQUIRED_KEYS if key not in spec]
+        if missing:
+            raise ValueError(f"Figure spec {spec.get('name', '?')!r} is missing {', '.join(missing)}")
+        if spec['kind'] not in RENDERERS:
+            raise ValueError(f"Figure {spec['name']!r}: unknown kind {spec['kind']!r}")
+        if spec['name'] in seen:
+            raise ValueError(f"Duplicate figure name {spec['name']!r}")
+        seen.add(spec['name'])
+    return specs
+
+
+def effects_from_sersets(df, spec):
+    """
+    Rebuild a tidy effects table from a multi-series plot_to_csv export.
+
+    CI and point series of the same treatment are joined on their rows, so
+    each output row has splitting_var, subgroup, treatment, effect, ci_lower
+    and ci_upper.
+    """
+    import pandas as pd
+
+    y_col = spec.get('y', 'ypos')
+    rows = {round(float(y), 3): (split, subgroup) for y, split, subgroup in spec['rows']}
+    parts = {'ci': [], 'point': []}
+
+    for serset, series in spec['sersets'].items():
+        part = df[df['_serset'] == int(serset)]
+        base = (part[y_col] - series.get('offset', 0)).round(3)
+        unknown = sorted(set(base) - set(rows))
+        if unknown:
+            raise ValueError(f"_serset {serset}: no row for {y_col} - offset = {unknown}")
+        labels = [rows[y] for y in base]
+        out = pd.DataFrame({
+            'splitting_var': [split for split, _ in labels],
+            'subgroup': [subgroup for _, subgroup in labels],
+            'treatment': series['treatment'],
+        })
+        if series['role'] == 'ci':
+            out['ci_lower'] = part['ci_lo'].to_numpy()
+            out['ci_upper'] = part['ci_hi'].to_numpy()
+        else:
+            out['effect'] = part['coef'].to_numpy()
+        parts[series['role']].append(out)
+
+    keys = ['splitting_var', 'subgroup', 'treatment']
+    effects = pd.concat(parts['point'], ignore_index=True)
+    cis = pd.concat(parts['ci'], ignore_index=True)
+    effects = effects.merge(cis, on=keys, how='left', validate='one_to_one')
+
+    # Panels and subgroups in manifest row order, treatments in serset order
+    row_order = {label: k for k, label in enumerate(rows.values())}
+    treatment_order = {t: k for k, t in enumerate(dict.fromkeys(
+        series['treatment'] for series in spec['sersets'].values()))}
+    order = sorted(range(len(effects)), key=lambda i: (
+        row_order[(effects['splitting_var'].iat[i], effects['subgroup'].iat[i])],
+        treatment_order[effects['treatment'].iat[i]]))
+    return effects.iloc[order].reset_index(drop=True)
+
+
+def render_forest(spec, csv_path, output_path):
+    """Draw a forest figure spec with forest_plot.plot_forest."""
+    import pandas as pd
+    from forest_plot import index_effects, plot_forest
+
+    df = pd.read_csv(csv_path)
+    if 'sersets' in spec:
+        df = effects_from_sersets(df, spec)
+    data = index_effects(df, spec.get('columns'))
+    print(f"  {len(df)} estimates: {' x '.join(str(n) for n in data.shape)} "
+          f"(outcome x splitting var x treatment x subgroup)")
+
+    options = {key: spec[key] for key in ('title', 'xlabel', 'ncols', 'colors', 'markers', 'dpi')
+               if key in spec}
+    if 'panel_size' in spec:
+        options['panel_size'] = tuple(spec['panel_size'])
+    plot_forest(data, output_path, **options)
+
+
+RENDERERS = {'forest': render_forest}
+
+
+def file_digest(path):
+    """SHA-256 hex digest of a file's bytes."""
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def figure_key(spec, proj_dir):
+    """Cache key: hash of the input CSV, the spec, the plotting code and RENDER_VERSION."""
+    digest = hashlib.sha256()
+    digest.update(f"render={RENDER_VERSION};".encode())
+    digest.update(json.dumps(spec, sort_keys=True).encode())
+    digest.update(file_digest(Path(proj_dir) / spec['csv']).encode())
+    code_dir = Path(__file__).resolve().parent
+    for source in RENDERER_SOURCES.get(spec['kind'], []):
+        digest.update(file_digest(code_dir / source).encode())
+    return digest.hexdigest()
+
+
+def stamp_path(proj_dir, name):
+    """Path of the render stamp for a figure."""
+    return Path(proj_dir) / CACHE_DIR / f"{name}.stamp.json"
+
+
+def is_current(spec, key, proj_dir):
+    """True if the output exists and is exactly what the last render with this key wrote."""
+    output_path = Path(proj_dir) / spec['output']
+    try:
+        stamp = json.loads(stamp_path(proj_dir, spec['name']).read_text())
+    except (OSError, ValueError):
+        return False
+    return (stamp.get('key') == key and output_path.exists()
+            and stamp.get('output') == file_digest(output_path))
+
+
+def write_stamp(spec, key, proj_dir):
+    """Record a render: its cache key and the digest of the written output."""
+    stamp_file = stamp_path(proj_dir, spec['name'])
+    stamp_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = stamp_file.with_name(stamp_file.name + f'.tmp{os.getpid()}')
+    tmp_file.write_text(json.dumps({'key': key, 'output': file_digest(Path(proj_dir) / spec['output'])}))
+    os.replace(tmp_file, stamp_file)
+
+
+def render_figure(spec, proj_dir, key):
+    """Render one figure on the Agg backend and stamp it."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+    proj_dir = Path(proj_dir)
+    output_path = proj_dir / spec['output']
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    print(f"  Input:  {spec['csv']}")
+    RENDERERS[spec['kind']](spec, proj_dir / spec['csv'], output_path)
+    write_stamp(spec, key, proj_dir)
+    print(f"  Saved:  {spec['output']}")
+
+
+def _render_worker(spec, proj_dir, key):
+    """
+    Process-pool entry point: render one figure with its log captured.
+
+    Returns:
+        (name, status, log) where status is 'rendered' or 'failed'
+    """
+    log = io.StringIO()
+    with redirect_stdout(log):
+        try:
+            render_figure(spec, proj_dir, key)
+            status = 'rendered'
+        except Exception:
+            import traceback
+            status = 'failed'
+            print(f"\nFAILED with exception:\n{traceback.format_exc()}")
+    return spec['name'], status, log.getvalue()
+
+
+def render_figures(specs, proj_dir, force=False, max_workers=None):
+    """
+    Render the stale figures among specs in a process pool.
+
+    Figures whose cache key matches their stamp are skipped without starting
+    a worker; their output's mtime is refreshed so make treats them as up to
+    date. Logs are printed as one block per figure, in manifest order.
+
+    Returns:
+        dict mapping figure name -> 'rendered', 'cached' or 'failed'
+    """
+    proj_dir = Path(proj_dir)
+    results = {}
+    jobs = {}
+
+    for spec in specs:
+        csv_path = proj_dir / spec['csv']
+        if not csv_path.exists():
+            print(f"ERROR: [{spec['name']}] input CSV not found: {csv_path}")
+            results[spec['name']] = 'failed'
+            continue
+        key = figure_key(spec, proj_dir)
+        if not force and is_current(spec, key, proj_dir):
+            os.utime(proj_dir / spec['output'])
+            results[spec['name']] = 'cached'
+            continue
+        jobs[spec['name']] = (spec, key)
+
+    if jobs:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=max_workers or len(jobs)) as pool:
+            futures = {name: pool.submit(_render_worker, spec, proj_dir, key)
+                       for name, (spec, key) in jobs.items()}
+            for name in jobs:
+                _, status, log = futures[name].result()
+                results[name] = status
+                print(f"\n{'=' * 70}\n[{name}] {status.upper()}\n{'=' * 70}")
+                print(log, end='')
+
+    print(f"\n=== FIGURES ===")
+    for spec in specs:
+        print(f"  {spec['name']}: {results[spec['name']]}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render manifest figures from plot_to_csv exports')
+    parser.add_argument(
+        'figures',
+        nargs='*',
+        help='Figure names to render (default: every figure in the manifest)'
+    )
+    parser.add_argument(
+        '--manifest',
+        type=Path,
+        default=None,
+        help=f'Figure manifest (default: {DEFAULT_MANIFEST})'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Redraw even if the input CSV and spec are unchanged since the last render'
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        default=None,
+        help='Worker processes (default: one per figure to render)'
+    )
+    parser.add_argument(
+        '--list',
+        action='store_true',
+        help='List the manifest figures and exit'
+    )
+    args = parser.parse_args()
+
+    # Get project directory (parent of code/)
+    script_dir = Path(__file__).parent
+    proj_dir = script_dir.parent
+    manifest = args.manifest or proj_dir / DEFAULT_MANIFEST
+
+    try:
+        specs = load_manifest(manifest)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"ERROR: could not read manifest {manifest}: {e}")
+        sys.exit(1)
+
+    if args.list:
+        for spec in specs:
+            print(f"  {spec['name']:<24} {spec['kind']:<8} {spec['csv']} -> {spec['output']}")
+        return
+
+    if args.figures:
+        by_name = {spec['name']: spec for spec in specs}
+        unknown = [name for name in args.figures if name not in by_name]
+        if unknown:
+            print(f"ERROR: not in {manifest}: {', '.join(unknown)}")
+            sys.exit(1)
+        specs = [by_name[name] for name in args.figures]
+
+    results = render_figures(specs, proj_dir, force=args.force, max_workers=args.jobs)
+    if any(status == 'failed' for status in results.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Power Simulation for Trimmed-Mean (Yuen) Tests vs Regression
+
+Python engine for the simulation in simulate_trimming.do. For each effect
+size te and iteration:
+
+    1. draw a bootstrap sample of the 1,900-row hesitant pilot sample
+       (delta residualized on treatment, stacked 12 times, first 1,900 rows)
+    2. assign treatment at random (runiform() <= 0.5)
+    3. y = delta_res + te * treatment
+    4. Yuen's trimmed-mean t test at trim rates 1, 10, 20, 25 (calc_yuen.do)
+    5. OLS of y on treatment and i.(prior_self_vacc prior_self_placebo age
+       gender education income race polviews), robust (HC1)
+
+Instead of looping, every iteration of an effect size is done at once: the
+bootstrap draws are one (iterations x n) NumPy index matrix, each group is
+sorted once per iteration and all trim rates read their percentiles from
+the same sorted arrays, and the regressions are solved as a batch. Effect
+sizes are spread across a process pool; each gets its own seed spawned
+from --seed, so results do not depend on the number of workers.
+
+simulate_trimming.do builds the bootstrap sample once and only re-draws
+treatment in its loop (bsample is in the plan but not the code); use
+--no-bsample to reproduce that exactly.
+
+Output is the results frame of simulate_trimming.do (te, iter, yuen_t,
+p<trim>, delta<trim>, reject<trim> for trim in 1 10 20 25 _reg), with the
+Yuen t statistics added as t1 t10 t20 t25 (yuen_t is never filled by the
+do-file either and is kept for column compatibility). It is written as .dta
+so it can be compared with Stata output, and the rejection rates by te are
+printed as in `table te, stat(mean reject...)`.
+
+Usage:
+    python code/simulate_trimming.py data/pilot_main_clean.dta
+    python code/simulate_trimming.py data/pilot_main_clean.dta --iterations 200 --jobs 4
+    python code/simulate_trimming.py data/pilot_main_clean.dta --no-bsample --seed 20260108
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.special import stdtr
+
+# Effect sizes and iterations from simulate_trimming.do
+EFFECT_SIZES = [0, 1, 2, 2.8, 2.9, 3, 3.1, 3.5, 4, 4.5, 5]
+N_ITERATIONS = 1000
+TRIM_RATES = [1, 10, 20, 25]
+SAMPLE_SIZE = 1900
+ALPHA = 0.05
+
+REG_CONTROLS = ['prior_self_vacc', 'prior_self_placebo', 'age', 'gender', 'education',
+                'income', 'race', 'polviews']
+
+# Iterations per regression batch (bounds memory at ~batch x n x k floats)
+REG_BATCH = 100
+
+
+def stata_pctile(sorted_values, counts, p):
+    """
+    Stata's pctile (egen pctile / summarize, detail) of each row.
+
+    sorted_values is (rows, n) with each row's values ascending in the first
+    counts[row] positions. With P = n * p / 100: if P is an integer the
+    result is the mean of the P-th and (P+1)-th values, else the
+    (floor(P) + 1)-th value (1-based).
+    """
+    num = counts * p
+    k = num // 100
+    exact = (num % 100) == 0
+    rows = np.arange(len(counts))
+    upper = sorted_values[rows, np.minimum(k, sorted_values.shape[1] - 1)]
+    lower = sorted_values[rows, np.maximum(k - 1, 0)]
+    return np.where(exact, (lower + upper) / 2, upper)
+
+
+def yuen_batch(y, treat, trim_rates=TRIM_RATES):
+    """
+    Yuen's two-sample trimmed-mean t test for every row of y at once.
+
+    Follows calc_yuen.do: within-group percentiles at trim and 100 - trim,
+    trimmed mean over values inside [low, high] (ties included), winsorized
+    variance, d_j = (n_j - 1) s2_wj / (h_j (h_j - 1)), Welch-type df.
+
+    Args:
+        y: (rows, n) outcomes
+        treat: (rows, n) booleans, True for group 1
+
+    Returns:
+        {trim: {'delta', 'yuen', 'df', 'p'}} with (rows,) arrays
+    """
+    groups = {}
+    for j, in_group in ((0, ~treat), (1, treat)):
+        counts = in_group.sum(axis=1)
+        sorted_values = np.sort(np.where(in_group, y, np.inf), axis=1)
+        groups[j] = (in_group, counts, sorted_values)
+
+    results = {}
+    for trim in trim_rates:
+        means, ds, hs = {}, {}, {}
+        for j, (in_group, counts, sorted_values) in groups.items():
+            low = stata_pctile(sorted_values, counts, trim)[:, None]
+            high = stata_pctile(sorted_values, counts, 100 - trim)[:, None]
+
+            kept = in_group & (y >= low) & (y <= high)
+            h = kept.sum(axis=1)
+            means[j] = np.where(kept, y, 0).sum(axis=1) / h
+
+            winsor = np.where(in_group, np.clip(y, low, high), 0)
+            w_mean = winsor.sum(axis=1) / counts
+            var_w = (np.where(in_group, (winsor - w_mean[:, None]) ** 2, 0).sum(axis=1)
+                     / (counts - 1))
+            ds[j] = (counts - 1) * var_w / (h * (h - 1))
+            hs[j] = h
+
+        delta = means[1] - means[0]
+        yuen = delta / np.sqrt(ds[1] + ds[0])
+        df = (ds[1] + ds[0]) ** 2 / (ds[1] ** 2 / (hs[1] - 1) + ds[0] ** 2 / (hs[0] - 1))
+        p = 2 * (1 - stdtr(df, np.abs(yuen)))
+        results[trim] = {'delta': delta, 'yuen': yuen, 'df': df, 'p': p}
+    return results
+
+
+def yuen_t(y, group, trim_rate=20.0):
+    """
+    Single Yuen test, same returns as the yuen_t program in calc_yuen.do
+    (for cross-checking against Stata).
+
+    Returns:
+        dict with delta, yuen, df, p
+    """
+    y = np.asarray(y, dtype=float)
+    group = np.asarray(group)
+    keep = ~np.isnan(y) & ~pd.isna(group)
+    result = yuen_batch(y[keep][None, :], (group[keep] == 1)[None, :], [trim_rate])[trim_rate]
+    return {key: float(values[0]) for key, values in result.items()}
+
+
+def factor_dummies(controls):
+    """
+    Indicator columns for i.var on each control (lowest level is the base),
+    as Stata's factor-variable expansion.
+
+    Returns:
+        (n, k) float array (rows with a missing control are all zero)
+    """
+    columns = []
+    for col in controls.columns:
+        values = controls[col].to_numpy(dtype=float)
+        for level in np.unique(values[~np.isnan(values)])[1:]:
+            columns.append(values == level)
+    if not columns:
+        return np.zeros((len(controls), 0))
+    return np.column_stack(columns).astype(float)
+
+
+def regress_treatment_batch(y, treat, dummies, valid):
+    """
+    OLS of y on a constant, treatment and the control dummies for every row
+    of y, with HC1 (robust) standard errors for the treatment coefficient.
+
+    Rows of the design with valid == False are dropped (Stata's listwise
+    deletion); collinear columns (e.g. a level absent from a bootstrap
+    sample) are handled with a pseudo-inverse and excluded from the rank.
+
+    Returns:
+        (coef, p) arrays of shape (rows,)
+    """
+    n_rows, n = y.shape
+    weight = valid.astype(float)
+    X = np.concatenate([np.ones((n_rows, n, 1)), treat[:, :, None].astype(float), dummies], axis=2)
+    X *= weight[:, :, None]
+    yw = y * weight
+
+    xtx = X.transpose(0, 2, 1) @ X
+    xtx_inv = np.linalg.pinv(xtx, hermitian=True)
+    beta = (xtx_inv @ (X.transpose(0, 2, 1) @ yw[:, :, None]))[:, :, 0]
+    resid = yw - (X @ beta[:, :, None])[:, :, 0]
+
+    n_obs = weight.sum(axis=1)
+    rank = np.linalg.matrix_rank(xtx, hermitian=True)
+    df_r = n_obs - rank
+
+    # Var(b_treat) = a' X' diag(e^2) X a * N / (N - rank), a = row 1 of (X'X)^+
+    w = (X @ xtx_inv[:, 1, :, None])[:, :, 0]
+    var = (resid ** 2 * w ** 2).sum(axis=1) * n_obs / df_r
+    coef = beta[:, 1]
+    p = 2 * (1 - stdtr(df_r, np.abs(coef / np.sqrt(var))))
+    return coef, p
+
+
+def simulate_effect_size(te, delta_res, dummies, reg_valid, n_iterations, seed,
+                         bsample=True, trim_rates=TRIM_RATES):
+    """
+    All iterations for one effect size. Returns the results frame rows for te.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(delta_res)
+
+    # Bootstrap index matrix: row i holds the sample for iteration i
+    if bsample:
+        idx = rng.integers(0, n, size=(n_iterations, n))
+    else:
+        idx = np.broadcast_to(np.arange(n), (n_iterations, n))
+    treat = rng.random((n_iterations, n)) <= 0.5
+    y = delta_res[idx] + te * treat
+
+    frame = {'te': np.full(n_iterations, te, dtype=float),
+             'iter': np.arange(1, n_iterations + 1),
+             'yuen_t': np.full(n_iterations, np.nan)}
+
+    yuen = yuen_batch(y, treat, trim_rates)
+    for trim in trim_rates:
+        frame[f'p{trim}'] = yuen[trim]['p']
+        frame[f'delta{trim}'] = yuen[trim]['delta']
+        frame[f'reject{trim}'] = (yuen[trim]['p'] <= ALPHA).astype(float)
+
+    coefs, ps = [], []
+    for start in range(0, n_iterations, REG_BATCH):
+        rows = slice(start, start + REG_BATCH)
+        coef, p = regress_treatment_batch(y[rows], treat[rows], dummies[idx[rows]],
+                                          reg_valid[idx[rows]])
+        coefs.append(coef)
+        ps.append(p)
+    frame['p_reg'] = np.concatenate(ps)
+    frame['delta_reg'] = np.concatenate(coefs)
+    frame['reject_reg'] = (frame['p_reg'] <= ALPHA).astype(float)
+
+    for trim in trim_rates:
+        frame[f't{trim}'] = yuen[trim]['yuen']
+    return pd.DataFrame(frame)
+
+
+def prepare_sample(df, sample_size=SAMPLE_SIZE):
+    """
+    Build the simulation sample as simulate_trimming.do does: hesitant
+    respondents (vacc_intent >= 3, Stata missing included), delta
+    residualized on treatment, replicated and cut to sample_size rows.
+
+    Returns:
+        DataFrame with delta_res and the regression controls
+    """
+    df = df[(df['vacc_intent'] >= 3) | df['vacc_intent'].isna()].copy()
+    df['delta'] = df['posterior_vacc'] - df['posterior_novacc']
+
+    # reg delta i.treatment; predict delta_res, residual
+    fit = df['delta'].notna() & df['treatment'].notna()
+    df['delta_res'] = np.nan
+    df.loc[fit, 'delta_res'] = (df.loc[fit, 'delta']
+                                - df[fit].groupby('treatment')['delta'].transform('mean'))
+    df = df[df['delta_res'].notna()][['delta_res'] + REG_CONTROLS]
+
+    # forvalues n = 0/10 { append using `hesitant' } ; keep if _n <= 1900
+    return pd.concat([df] * 12, ignore_index=True).iloc[:sample_size]
+
+
+def _simulate_worker(args):
+    te, sample_arrays, n_iterations, seed, bsample = args
+    delta_res, dummies, reg_valid = sample_arrays
+    return simulate_effect_size(te, delta_res, dummies, reg_valid, n_iterations, seed, bsample)
+
+
+def run_simulation(sample, effect_sizes=EFFECT_SIZES, n_iterations=N_ITERATIONS, seed=12345,
+                   bsample=True, max_workers=None):
+    """
+    Run every effect size (in a process pool when max_workers != 1).
+
+    Effect size i uses the i-th seed spawned from `seed`, so results are
+    reproducible for any number of workers.
+
+    Returns:
+        results frame sorted by te, iter
+    """
+    delta_res = sample['delta_res'].to_numpy(dtype=float)
+    controls = sample[REG_CONTROLS]
+    sample_arrays = (delta_res, factor_dummies(controls), controls.notna().all(axis=1).to_numpy())
+
+    seeds = np.random.SeedSequence(seed).spawn(len(effect_sizes))
+    tasks = [(te, sample_arrays, n_iterations, seeds[i], bsample)
+             for i, te in enumerate(effect_sizes)]
+
+    if max_workers == 1:
+        frames = [_simulate_worker(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(_simulate_worker, tasks))
+    return pd.concat(frames, ignore_index=True)
+
+
+def power_table(results, trim_rates=TRIM_RATES):
+    """Mean rejection rate by effect size (table te, stat(mean reject...))."""
+    cols = [f'reject{trim}' for trim in trim_rates] + ['reject_reg']
+    return results.groupby('te')[cols].mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate power of trimmed-mean (Yuen) tests vs regression')
+    parser.add_argument('data', type=Path, help='Pilot main clean data (pilot_main_clean.dta)')
+    parser.add_argument('--iterations', type=int, default=N_ITERATIONS,
+                        help=f'Iterations per effect size (default: {N_ITERATIONS})')
+    parser.add_argument('--effect-sizes', type=float, nargs='+', default=EFFECT_SIZES,
+                        help='Effect sizes (default: as in simulate_trimming.do)')
+    parser.add_argument('--seed', type=int, default=12345, help='Base random seed')
+    parser.add_argument('--no-bsample', action='store_true',
+                        help='Re-draw treatment only, without resampling rows (as the do-file loop)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Worker processes (default: one per CPU; 1 runs serially)')
+    parser.add_argument('--output', type=Path, default=None,
+                        help='Results .dta (default: derived/simulate_trimming_results.dta)')
+    args = parser.parse_args()
+
+    if not args.data.exists():
+        print(f"ERROR: data file not found: {args.data}")
+        sys.exit(1)
+
+    proj_dir = Path(__file__).parent.parent
+    output = args.output or proj_dir / 'derived' / 'simulate_trimming_results.dta'
+
+    sample = prepare_sample(pd.read_stata(args.data, convert_categoricals=False))
+    print(f"Simulation sample: {len(sample):,} rows; {len(args.effect_sizes)} effect sizes x "
+          f"{args.iterations:,} iterations ({'bootstrap' if not args.no_bsample else 'fixed sample'})")
+
+    start = time.perf_counter()
+    results = run_simulation(sample, args.effect_sizes, args.iterations, seed=args.seed,
+                             bsample=not args.no_bsample, max_workers=args.jobs)
+    print(f"Done in {time.perf_counter() - start:.1f} s")
+
+    print("\nRejection rates (p <= 0.05) by effect size:")
+    print(power_table(results).round(3).to_string())
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    results.to_stata(output, write_index=False, version=118)
+    print(f"\nResults: {output}")
+
+
+if __name__ == '__main__':
+    main()
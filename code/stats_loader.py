@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Typed Loader for Stata Summary-Statistics CSVs
+
+Reads the stats CSVs written by summary_stats_*.do in one vectorized pass
+into typed columns, instead of coercing and nesting row by row:
+
+    stats_*_categorical.csv  variable,value,n,pct   -> CategoricalStats
+    stats_*_continuous.csv   variable,n,mean,sd,min,p50,max -> ContinuousStats
+
+Both expose an index built once at load time, so stats.lookup(var, value)
+and `var in stats` are O(1) dict lookups, and to_nested() returns the
+nested-dict layout build_codebook.py renders from.
+
+Row handling matches the original csv.DictReader readers:
+    - rows with an empty variable, value, n or pct are skipped
+    - rows whose n or pct do not parse as numbers are skipped
+    - n is truncated to an integer (int(float(n)))
+    - value '.' (Stata missing) is stored under the key 'missing'
+    - other values are truncated to integers when numeric, else kept as strings
+    - if a (variable, value) pair repeats, the last row wins
+
+Created by Dan + Claude Code
+"""
+
+import numpy as np
+import pandas as pd
+
+# Continuous stats key -> CSV column
+CONTINUOUS_FIELDS = {'n': 'n', 'mean': 'mean', 'sd': 'sd', 'min': 'min',
+                     'median': 'p50', 'max': 'max'}
+
+
+def _read_stats_csv(filepath, text_columns, numeric_columns):
+    """
+    Read a stats CSV into stripped string columns ('' when absent) and
+    float columns (NaN when empty or not a number).
+
+    The fast path lets the C parser type the numeric columns directly; if
+    any cell does not parse (or rows are ragged), the file is re-read as
+    text and coerced column by column. An empty file (Stata writes one when
+    no variables qualify) gives an empty frame.
+    """
+    columns = text_columns + numeric_columns
+    try:
+        df = pd.read_csv(filepath, dtype={**{col: str for col in text_columns},
+                                          **{col: float for col in numeric_columns}},
+                         keep_default_na=False, na_values={col: [''] for col in numeric_columns})
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame({col: pd.Series(dtype=str if col in text_columns else float)
+                             for col in columns})
+    except (ValueError, pd.errors.ParserError):
+        df = _read_text(filepath)
+        for col in numeric_columns:
+            if col in df.columns:
+                df[col] = pd.to_numeric(df[col].fillna('').str.strip(), errors='coerce')
+
+    for col in columns:
+        if col not in df.columns:
+            df[col] = '' if col in text_columns else np.nan
+    for col in text_columns:
+        df[col] = df[col].fillna('').str.strip()
+    return df[columns]
+
+
+def _read_text(filepath):
+    """
+    Read a CSV with every cell as a string. Rows with extra fields are
+    truncated rather than rejected, as csv.DictReader would keep them.
+    """
+    options = {'dtype': str, 'keep_default_na': False, 'na_filter': False}
+    try:
+        return pd.read_csv(filepath, **options)
+    except pd.errors.ParserError:
+        # Ragged rows: the python engine can truncate them (slower, rare)
+        with open(filepath, 'r') as f:
+            width = len(f.readline().split(','))
+        return pd.read_csv(filepath, engine='python',
+                           on_bad_lines=lambda fields: fields[:width], **options)
+
+
+def _value_keys(values):
+    """
+    Lookup keys for the (stripped) value column: 'missing' for '.', truncated
+    ints for numeric values, the string otherwise.
+    """
+    keys = values.to_numpy(dtype=object).copy()
+    is_missing = keys == '.'
+    try:
+        numeric = np.full(len(keys), np.nan)
+        numeric[~is_missing] = keys[~is_missing].astype(float)
+    except ValueError:
+        # Some non-numeric codes: coerce element-wise
+        numeric = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    finite = np.isfinite(numeric)
+    keys[finite] = np.trunc(numeric[finite]).astype(np.int64).tolist()
+    keys[is_missing] = 'missing'
+    return keys
+
+
+class CategoricalStats:
+    """Per-value counts and percentages, with a (variable, value) index."""
+
+    def __init__(self, variable, value, n, pct):
+        self.variable = variable  # object array of variable names
+        self.value = value        # object array of value keys (int, str or 'missing')
+        self.n = n                # int64
+        self.pct = pct            # float64
+        self.index = {key: i for i, key in enumerate(zip(variable.tolist(), value.tolist()))}
+        self.variables = dict.fromkeys(variable.tolist())
+
+    def __len__(self):
+        return len(self.n)
+
+    def __contains__(self, var):
+        return var in self.variables
+
+    def lookup(self, var, value):
+        """(n, pct) for one variable value, or None if absent."""
+        i = self.index.get((var, value))
+        if i is None:
+            return None
+        return int(self.n[i]), float(self.pct[i])
+
+    def to_nested(self):
+        """{var: {value: {'n': n, 'pct': pct}}}, as build_codebook renders from."""
+        stats = {}
+        for var, value, n, pct in zip(self.variable.tolist(), self.value.tolist(),
+                                      self.n.tolist(), self.pct.tolist()):
+            stats.setdefault(var, {})[value] = {'n': n, 'pct': pct}
+        return stats
+
+
+class ContinuousStats:
+    """Summary statistics per continuous variable, indexed by variable name."""
+
+    def __init__(self, variable, columns):
+        self.variable = variable  # object array of variable names
+        self.columns = columns    # stats key -> array (n int64, others float64)
+        self.index = {var: i for i, var in enumerate(variable.tolist())}
+
+    def __len__(self):
+        return len(self.variable)
+
+    def __contains__(self, var):
+        return var in self.index
+
+    def lookup(self, var):
+        """Stats dict for one variable, or None if absent."""
+        i = self.index.get(var)
+        if i is None:
+            return None
+        return {key: values[i].item() for key, values in self.columns.items()}
+
+    def to_nested(self):
+        """{var: {'n': ..., 'mean': ..., 'sd': ..., 'min': ..., 'median': ..., 'max': ...}}."""
+        lists = {key: values.tolist() for key, values in self.columns.items()}
+        return {var: {key: lists[key][i] for key in lists}
+                for var, i in self.index.items()}
+
+
+def load_categorical_stats(filepath):
+    """Load a categorical stats CSV into CategoricalStats (see module docstring)."""
+    df = _read_stats_csv(filepath, ['variable', 'value'], ['n', 'pct'])
+    keep = ((df['variable'] != '') & (df['value'] != '')
+            & df['n'].notna() & df['pct'].notna()).to_numpy()
+
+    return CategoricalStats(
+        variable=df['variable'].to_numpy(dtype=object)[keep],
+        value=_value_keys(df['value'][keep]),
+        n=np.trunc(df['n'].to_numpy(dtype=float)[keep]).astype(np.int64),
+        pct=df['pct'].to_numpy(dtype=float)[keep],
+    )
+
+
+def load_continuous_stats(filepath):
+    """
+    Load a continuous stats CSV into ContinuousStats.
+
+    Rows with an empty variable or non-numeric n are skipped; other
+    non-numeric cells (e.g. Stata's '.' for an undefined sd) become NaN.
+    """
+    df = _read_stats_csv(filepath, ['variable'], list(CONTINUOUS_FIELDS.values()))
+    keep = ((df['variable'] != '') & df['n'].notna()).to_numpy()
+
+    columns = {key: df[col].to_numpy(dtype=float)[keep] for key, col in CONTINUOUS_FIELDS.items()}
+    columns['n'] = np.trunc(columns['n']).astype(np.int64)
+    return ContinuousStats(df['variable'].to_numpy(dtype=object)[keep], columns)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Codebook Summary Statistics Computed in Python
+
+Computes the same statistics as the summary_stats_*.do scripts directly from
+a survey data file (any format survey_io reads: the parse_xml.py outputs or
+a cleaned .dta), so build_codebook.py can refresh a codebook without a
+Stata run or a CSV round-trip:
+
+    continuous   n, mean, sd, min, median (p50), max   (summarize, detail)
+    categorical  per-value n and pct of non-missing, plus a 'missing' entry
+                 with pct of the analysis sample         (write_cat_stats)
+
+The file is read in chunks (survey_io.iter_survey_chunks) and each chunk is
+folded into per-variable accumulators with vectorized numpy/pandas ops, so
+memory is bounded by the chunk size, the number of distinct categorical
+values and the median sample:
+
+    - mean and sd are combined across chunks with the parallel-variance
+      update (Chan et al.), so they match a single-pass computation
+    - the median is exact while a variable has at most exact_median_max
+      non-missing values; beyond that it is taken from a uniform reservoir
+      sample of that size (approximate, error shrinks with 1/sqrt(size))
+
+Rows are restricted to sample_var == 1 (final_sample, as in the do-files)
+when the file has that column; otherwise every row is used.
+
+Results use the layout of build_codebook.read_continuous_stats and
+read_categorical_stats, so they can be passed straight to the renderer.
+
+Usage:
+    python code/summary_stats.py data/main_raw.parquet --continuous duration_sec \
+        --categorical finished distributionChannel
+
+Created by Dan + Claude Code
+"""
+
+import argparse
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from survey_io import iter_survey_chunks
+
+DEFAULT_CHUNK_ROWS = 250_000
+
+# Keep every value (exact median) up to this many non-missing values per
+# variable; past it, keep a reservoir sample of this size
+EXACT_MEDIAN_MAX = 1_000_000
+
+DEFAULT_SAMPLE_VAR = 'final_sample'
+
+
+class ContinuousAccumulator:
+    """Streaming n/mean/sd/min/max and a (possibly sampled) median for one variable."""
+
+    def __init__(self, exact_median_max=EXACT_MEDIAN_MAX, seed=0):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.exact_median_max = exact_median_max
+        self.rng = np.random.default_rng(seed)
+        self.kept = []          # value chunks while the median is exact
+        self.reservoir = None   # sampled values once it is not
+
+    def update(self, values):
+        """Fold in a chunk of values (non-numeric and missing values are ignored)."""
+        values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+        values = values[np.isfinite(values)]
+        k = len(values)
+        if k == 0:
+            return
+
+        # Parallel mean/variance update
+        chunk_mean = values.mean()
+        chunk_m2 = ((values - chunk_mean) ** 2).sum()
+        total = self.n + k
+        delta = chunk_mean - self.mean
+        self.m2 += chunk_m2 + delta ** 2 * self.n * k / total
+        self.mean += delta * k / total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+        seen = self.n
+        self.n = total
+        if self.reservoir is None and total <= self.exact_median_max:
+            self.kept.append(values)
+            return
+        if self.reservoir is None:
+            # Switch to sampling: the values kept so far fill the reservoir first
+            pool = np.concatenate(self.kept + [values[:self.exact_median_max - seen]])
+            self.reservoir = pool
+            self.kept = []
+            values = values[self.exact_median_max - seen:]
+            seen = self.exact_median_max
+        self._sample(values, seen)
+
+    def _sample(self, values, seen):
+        """Algorithm R over a chunk: value t (1-based) replaces a random slot with prob size/t."""
+        if len(values) == 0:
+            return
+        size = len(self.reservoir)
+        positions = np.arange(seen + 1, seen + len(values) + 1)
+        slots = (self.rng.random(len(values)) * positions).astype(np.int64)
+        replace = slots < size
+        # With repeated slots, numpy keeps the last write, as the sequential algorithm would
+        self.reservoir[slots[replace]] = values[replace]
+
+    def result(self):
+        """Stats dict in read_continuous_stats layout (NaN where Stata gives '.')."""
+        if self.n == 0:
+            nan = float('nan')
+            return {'n': 0, 'mean': nan, 'sd': nan, 'min': nan, 'median': nan, 'max': nan}
+        sample = self.reservoir if self.reservoir is not None else np.concatenate(self.kept)
+        return {
+            'n': self.n,
+            'mean': float(self.mean),
+            'sd': float(math.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else float('nan'),
+            'min': float(self.min),
+            'median': float(np.median(sample)),
+            'max': float(self.max),
+        }
+
+    @property
+    def exact(self):
+        return self.reservoir is None
+
+
+def value_key(value):
+    """Key for a categorical value: truncated int if numeric, else the stripped string."""
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return str(value).strip()
+    return int(number) if math.isfinite(number) else str(value).strip()
+
+
+def _is_missing(values):
+    """Stata-style missing: NaN/None for numbers, '' for strings."""
+    missing = values.isna()
+    if values.dtype == object or isinstance(values.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        missing |= values.astype(str).str.strip().eq('')
+    return missing
+
+
+class CategoricalAccumulator:
+    """Streaming per-value counts and missing count for one variable."""
+
+    def __init__(self):
+        self.counts = {}
+        self.n_missing = 0
+
+    def update(self, values):
+        """Fold in a chunk of values."""
+        values = pd.Series(values)
+        missing = _is_missing(values)
+        self.n_missing += int(missing.sum())
+        for value, n in values[~missing].value_counts(sort=False).items():
+            if n == 0:
+                continue  # unused category level
+            key = value_key(value)
+            self.counts[key] = self.counts.get(key, 0) + int(n)
+
+    def result(self, n_sample):
+        """
+        Stats dict in read_categorical_stats layout: pct of non-missing per
+        value (values in ascending order, as levelsof lists them) and the
+        missing count as a pct of the n_sample analysis rows.
+        """
+        n_nonmiss = sum(self.counts.values())
+        stats = {}
+        for key in sorted(self.counts, key=lambda k: (isinstance(k, str), k)):
+            stats[key] = {'n': self.counts[key], 'pct': 100 * self.counts[key] / n_nonmiss}
+        if self.n_missing > 0:
+            stats['missing'] = {'n': self.n_missing, 'pct': 100 * self.n_missing / n_sample}
+        return stats
+
+
+def compute_summary_stats(chunks, cont_vars, cat_vars, sample_var=DEFAULT_SAMPLE_VAR,
+                          exact_median_max=EXACT_MEDIAN_MAX):
+    """
+    Fold DataFrame chunks into continuous and categorical statistics.
+
+    Variables missing from the data are left out of the results.
+
+    Returns:
+        (cont_stats, cat_stats, info) where info has 'n_sample' (rows used),
+        'sample_filtered', 'missing_vars' and 'approximate_median' (variables
+        whose median came from the reservoir sample)
+    """
+    cont_acc = {var: ContinuousAccumulator(exact_median_max, seed=i)
+                for i, var in enumerate(cont_vars)}
+    cat_acc = {var: CategoricalAccumulator() for var in cat_vars}
+    present = set()
+    n_sample = 0
+    sample_filtered = False
+
+    for chunk in chunks:
+        if sample_var and sample_var in chunk.columns:
+            chunk = chunk[pd.to_numeric(chunk[sample_var], errors='coerce') == 1]
+            sample_filtered = True
+        n_sample += len(chunk)
+        for var, acc in cont_acc.items():
+            if var in chunk.columns:
+                present.add(var)
+                acc.update(chunk[var])
+        for var, acc in cat_acc.items():
+            if var in chunk.columns:
+                present.add(var)
+                acc.update(chunk[var])
+
+    cont_stats = {var: acc.result() for var, acc in cont_acc.items() if var in present}
+    cat_stats = {var: acc.result(n_sample) for var, acc in cat_acc.items() if var in present}
+    info = {
+        'n_sample': n_sample,
+        'sample_filtered': sample_filtered,
+        'missing_vars': [var for var in list(cont_vars) + list(cat_vars) if var not in present],
+        'approximate_median': [var for var, acc in cont_acc.items()
+                               if var in present and not acc.exact],
+    }
+    return cont_stats, cat_stats, info
+
+
+def summary_stats_from_file(path, cont_vars, cat_vars, sample_var=DEFAULT_SAMPLE_VAR,
+                            chunk_rows=DEFAULT_CHUNK_ROWS, exact_median_max=EXACT_MEDIAN_MAX):
+    """
+    Compute codebook statistics from a survey data file, reading only the
+    needed columns in chunks of chunk_rows.
+
+    Returns:
+        (cont_stats, cat_stats, info) as from compute_summary_stats
+    """
+    columns = list(dict.fromkeys(list(cont_vars) + list(cat_vars) + ([sample_var] if sample_var else [])))
+    chunks = iter_survey_chunks(path, columns=columns, chunk_rows=chunk_rows)
+    return compute_summary_stats(chunks, cont_vars, cat_vars, sample_var=sample_var,
+                                 exact_median_max=exact_median_max)
+
+
+def print_info(info):
+    """Print the sample size and any variables that were absent or approximated."""
+    scope = 'rows in the analysis sample' if info['sample_filtered'] else 'rows (no sample variable; all rows used)'
+    print(f"  {info['n_sample']:,} {scope}")
+    missing = info['missing_vars']
+    if missing:
+        shown = ', '.join(missing[:10]) + (f", ... ({len(missing) - 10} more)" if len(missing) > 10 else '')
+        print(f"  WARNING: {len(missing)} variable(s) not in the data: {shown}")
+    if info['approximate_median']:
+        print(f"  Approximate (sampled) median for: {', '.join(info['approximate_median'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute codebook summary statistics from a survey data file')
+    parser.add_argument('data', type=Path, help='Survey data file (.dta, .parquet, .feather or .arrow)')
+    parser.add_argument('--continuous', nargs='*', default=[], help='Continuous variables')
+    parser.add_argument('--categorical', nargs='*', default=[], help='Categorical variables')
+    parser.add_argument('--sample-var', default=DEFAULT_SAMPLE_VAR,
+                        help=f"Keep rows where this variable == 1, if present (default: {DEFAULT_SAMPLE_VAR})")
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f'Rows per chunk (default: {DEFAULT_CHUNK_ROWS:,})')
+    args = parser.parse_args()
+
+    if not args.data.exists():
+        print(f"ERROR: data file not found: {args.data}")
+        sys.exit(1)
+
+    cont_stats, cat_stats, info = summary_stats_from_file(
+        args.data, args.continuous, args.categorical, sample_var=args.sample_var,
+        chunk_rows=args.chunk_rows)
+    print_info(info)
+
+    for var, stats in cont_stats.items():
+        print(f"\n{var}: n={stats['n']:,} mean={stats['mean']:.4g} sd={stats['sd']:.4g} "
+              f"min={stats['min']:.4g} median={stats['median']:.4g} max={stats['max']:.4g}")
+    for var, stats in cat_stats.items():
+        print(f"\n{var}:")
+        for value, entry in stats.items():
+            print(f"  {value!s:<12} {entry['n']:>10,} {entry['pct']:7.2f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Read and Write Parsed Survey Data in Several Formats
+
+Output formats (selected with parse_xml.py --format):
+    dta      Stata 14+ (.dta, version 118) for the Stata cleaning stages
+    parquet  Compressed columnar (.parquet)
+    feather  Feather v2 / Arrow IPC with LZ4 compression (.feather)
+    arrow    Uncompressed Arrow IPC file (.arrow), memory-mappable zero-copy
+
+Python consumers should use read_survey(), which memory-maps the columnar
+formats instead of reading through CSV or .dta, or iter_survey_chunks() to
+stream a file in bounded-size chunks.
+
+The columnar formats need pyarrow; .dta only needs pandas. Both are
+imported on first use, so CLIs can import this module for OUTPUT_FORMATS
+without paying for pandas.
+
+Created by Dan + Claude Code
+"""
+
+import os
+from pathlib import Path
+
+# Format name -> file suffix
+OUTPUT_FORMATS = {
+    'dta': '.dta',
+    'parquet': '.parquet',
+    'feather': '.feather',
+    'arrow': '.arrow',
+}
+
+# Order in which read_existing_output() prefers formats (typed columnar first)
+READ_PREFERENCE = ['arrow', 'feather', 'parquet', 'dta']
+
+
+def to_stata_frame(df):
+    """
+    Prepare a typed DataFrame for to_stata.
+
+    Categorical columns are written back as strings so the .dta keeps string
+    variables (to_stata would otherwise turn them into value-labelled codes
+    and break string comparisons in the do-files). Numeric and datetime
+    columns are written natively.
+    """
+    import pandas as pd
+
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    out = df.copy()
+    for col in categorical:
+        out[col] = out[col].astype(object).where(out[col].notna(), '').astype(str)
+    return out
+
+
+def write_dta(df, path, variable_labels=None, value_labels=None):
+    """
+    Write Stata .dta (version 118), optionally with variable labels
+    ({var: label}) and value labels ({var: {code: label}}).
+    """
+    to_stata_frame(df).to_stata(path, write_index=False, version=118,
+                                variable_labels=variable_labels or None,
+                                value_labels=value_labels or None)
+
+
+def write_parquet(df, path):
+    """Write Parquet."""
+    df.to_parquet(path, index=False)
+
+
+def write_feather(df, path):
+    """Write Feather v2 (LZ4-compressed Arrow IPC)."""
+    df.reset_index(drop=True).to_feather(path)
+
+
+def write_arrow(df, path):
+    """Write an uncompressed Arrow IPC file, suitable for zero-copy memory-mapping."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+WRITERS = {
+    'dta': write_dta,
+    'parquet': write_parquet,
+    'feather': write_feather,
+    'arrow': write_arrow,
+}
+
+
+def output_path(base_path, fmt):
+    """Path for format `fmt`, replacing the suffix of base_path (e.g. main_raw.dta)."""
+    return Path(base_path).with_suffix(OUTPUT_FORMATS[fmt])
+
+
+def write_survey(df, base_path, formats=('dta',), variable_labels=None, value_labels=None):
+    """
+    Write df in each requested format next to base_path.
+
+    Each file is written under a temporary name and renamed into place, so
+    an existing file that is still memory-mapped (e.g. df itself came from
+    read_survey on it) is never truncated underneath its reader. Variable
+    and value labels are only written to .dta (see write_dta).
+
+    Returns:
+        list of written paths, in the order of `formats`
+    """
+    paths = []
+    for fmt in formats:
+        if fmt not in WRITERS:
+            raise ValueError(f"Unknown output format '{fmt}'. Use one of: {', '.join(WRITERS)}")
+        path = output_path(base_path, fmt)
+        tmp_path = path.with_name(f"{path.stem}.tmp{os.getpid()}{path.suffix}")
+        options = {'variable_labels': variable_labels, 'value_labels': value_labels} if fmt == 'dta' else {}
+        WRITERS[fmt](df, tmp_path, **options)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def read_survey(path, columns=None):
+    """
+    Read a parsed survey file, choosing the reader from its suffix.
+
+    Arrow and Feather files are memory-mapped, so only the requested columns
+    are paged in; Parquet is read with memory_map=True.
+    """
+    import pandas as pd
+
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == '.dta':
+        return pd.read_stata(path, columns=columns)
+    if suffix == '.parquet':
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    if suffix in ('.feather', '.arrow'):
+        import pyarrow as pa
+
+        with pa.memory_map(str(path), 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table.to_pandas()
+
+    raise ValueError(f"Don't know how to read {path} (expected one of {', '.join(OUTPUT_FORMATS.values())})")
+
+
+def iter_survey_chunks(path, columns=None, chunk_rows=100_000):
+    """
+    Yield a parsed survey file as DataFrames of at most chunk_rows rows, so
+    files larger than memory can be summarized in one pass.
+
+    Only the requested columns that exist in the file are read (all columns
+    if columns is None). Arrow and Feather batches are sliced from a memory
+    map; Parquet is read batch by batch; .dta is read with Stata's value
+    codes (labelled variables are not converted to their labels).
+    """
+    import pandas as pd
+
+    path = Path(path)
+    suffix = path.suffix.lower()
+
+    if suffix == '.dta':
+        with pd.read_stata(path, iterator=True, convert_categoricals=False) as reader:
+            available = list(reader.variable_labels())
+            cols = available if columns is None else [col for col in columns if col in available]
+            while True:
+                try:
+                    chunk = reader.read(chunk_rows, columns=cols)
+                except StopIteration:
+                    return
+                if chunk.empty:
+                    return
+                yield chunk
+        return
+
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        available = parquet_file.schema_arrow.names
+        cols = available if columns is None else [col for col in columns if col in available]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=cols):
+            yield batch.to_pandas()
+        return
+
+    if suffix in ('.feather', '.arrow'):
+        import pyarrow as pa
+
+        with pa.memory_map(str(path), 'r') as source:
+            reader = pa.ipc.open_file(source)
+            available = reader.schema.names
+            cols = available if columns is None else [col for col in columns if col in available]
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i).select(cols)
+                for offset in range(0, batch.num_rows, chunk_rows):
+                    yield batch.slice(offset, chunk_rows).to_pandas()
+        return
+
+    raise ValueError(f"Don't know how to read {path} (expected one of {', '.join(OUTPUT_FORMATS.values())})")
+
+
+def read_existing_output(base_path, formats=None):
+    """
+    Read the previously written output for base_path, preferring typed
+    columnar formats over .dta.
+
+    Returns:
+        (df, path) or (None, None) if no output exists
+    """
+    for fmt in READ_PREFERENCE:
+        if formats is not None and fmt not in formats:
+            continue
+        path = output_path(base_path, fmt)
+        if path.exists():
+            return read_survey(path), path
+    return None, None